@@ -1,2 +1,3 @@
 :: Perform a Windows build.
-pyinstaller deepqt/main.py --onefile --noconfirm --clean --workpath=build --distpath=dist --windowed --name=DeepQt.exe --icon=media\logo.ico
\ No newline at end of file
+:: Modules that are only imported lazily, by name, must be listed as hidden imports.
+pyinstaller deepqt/main.py --onefile --noconfirm --clean --workpath=build --distpath=dist --windowed --name=DeepQt.exe --icon=media\logo.ico --hidden-import=deepl --hidden-import=psutil --hidden-import=bs4 --hidden-import=minify_html --hidden-import=pyexcel
\ No newline at end of file
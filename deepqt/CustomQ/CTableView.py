@@ -0,0 +1,44 @@
+import PySide6.QtWidgets as Qw
+import PySide6.QtGui as Qg
+import PySide6.QtCore as Qc
+
+
+class CTableView(Qw.QTableView):
+    """
+    Extends the functionality with custom helpers
+    """
+
+    finished_drop = Qc.Signal()
+
+    def __init__(self, parent=None) -> None:
+        Qw.QTableView.__init__(self, parent)
+
+    def selectedRows(self) -> list[int]:
+        return sorted({index.row() for index in self.selectedIndexes()})
+
+    def hasSelected(self) -> bool:
+        return self.selectedIndexes() != []
+
+    def dragEnterEvent(self, event: Qg.QDragEnterEvent) -> None:
+        if event.mimeData().hasUrls():
+            event.accept()
+        else:
+            event.ignore()
+
+    def dragMoveEvent(self, event: Qg.QDragMoveEvent) -> None:
+        if event.mimeData().hasUrls():
+            event.accept()
+        else:
+            event.ignore()
+
+    def dropEvent(self, event: Qg.QDropEvent) -> None:
+        if event.mimeData().hasUrls():
+            for url in event.mimeData().urls():
+                self.handleDrop(url.toLocalFile())
+            event.accept()
+        else:
+            event.ignore()
+        self.finished_drop.emit()
+
+    def handleDrop(self, path: str) -> None:
+        pass
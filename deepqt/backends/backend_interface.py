@@ -9,6 +9,7 @@ Unreliable backends may return nonsense and need per segment tweaking to work.
     e.g. ChatGPT, LLMs in general.
 """
 
+import asyncio
 from abc import abstractmethod, ABC
 from enum import StrEnum, auto, Enum
 from pathlib import Path
@@ -35,6 +36,22 @@ class TranslationFailed(Exception):
     pass
 
 
+class TooManyRequests(TranslationFailed):
+    """
+    Raised when the service is rate limiting, the request may be sent again later.
+    """
+
+    pass
+
+
+class QuotaExceeded(TranslationFailed):
+    """
+    Raised when the account's character quota is used up.
+    """
+
+    pass
+
+
 class UnsupportedFileFormat(Exception):
     """
     Raised when a file format is not supported by the backend.
@@ -124,6 +141,21 @@ class BackendStatus:
     usage_limit: int | None = None
 
 
+@frozen
+class BackendCapabilities:
+    """
+    What a backend can handle per request, used by the translation engine to batch
+    and schedule the work.
+    A max_request_bytes of None means there is no limit.
+    max_concurrency is only respected if supports_concurrency is set.
+    """
+
+    max_request_bytes: int | None = None
+    max_texts_per_request: int = 1
+    supports_concurrency: bool = False
+    max_concurrency: int = 1
+
+
 @define
 class BackendConfig(ABC):
     # How long it took to translate 1000 characters on average. (-1 if unknown)
@@ -238,9 +270,13 @@ class Backend(ABC):
     """
 
     _config: BackendConfig | None  # Needs to be passed from the config.
+    _source_language: str  # Blank to detect it.
+    _target_language: str
 
     def __init__(self) -> None:
         self._config = None
+        self._source_language = ""
+        self._target_language = ""
 
     @abstractmethod
     def connect(self) -> None: ...
@@ -272,8 +308,56 @@ class Backend(ABC):
     @abstractmethod
     def set_config(self, config: BackendConfig) -> None: ...
 
+    def set_languages(self, source_language: str, target_language: str) -> None:
+        """
+        Set the languages to translate between.
+
+        :param source_language: The language code of the texts, blank to detect it.
+        :param target_language: The language code to translate to.
+        """
+        self._source_language = source_language
+        self._target_language = target_language
+
+    def capabilities(self) -> BackendCapabilities:
+        """
+        Describes the requests the backend accepts.
+        The default is the most conservative, one text per request, one request at a time.
+        """
+        return BackendCapabilities()
+
     @abstractmethod
-    def translate_text(self, text: str) -> str: ...
+    def translate_text(self, text: str, is_html: bool = False) -> str:
+        """
+        Translate a text. Html texts must keep their tags as they are.
+        """
+        ...
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        """
+        Translate several texts in one request, if the backend supports it.
+        Backends that accept multiple texts per request should override this.
+
+        :param texts: The texts to translate.
+        :param is_html: [Optional] Whether the texts are html.
+        :return: The translations, in the same order.
+        """
+        return [self.translate_text(text, is_html) for text in texts]
+
+    async def translate_text_async(self, text: str, is_html: bool = False) -> str:
+        """
+        Translate a text without blocking the event loop.
+        Backends with native async clients should override this, the default runs
+        the blocking variant in a thread.
+        """
+        return await asyncio.to_thread(self.translate_text, text, is_html)
+
+    async def translate_texts_async(self, texts: list[str], is_html: bool = False) -> list[str]:
+        """
+        Translate several texts without blocking the event loop.
+        Backends with native async clients should override this, the default runs
+        the blocking variant in a thread.
+        """
+        return await asyncio.to_thread(self.translate_texts, texts, is_html)
 
     @abstractmethod
     def translate_file(self, file_in: Path, file_type: ct.Formats, file_out: Path) -> None: ...
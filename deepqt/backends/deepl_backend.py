@@ -1,16 +1,26 @@
 from pathlib import Path
-from typing import Any
 
 from attrs import define
-import deepl
+from loguru import logger
 
 import deepqt.backends.backend_interface as bi
 import deepqt.constants as ct
 import deepqt.utils as ut
 
+# Only needed once connecting, which is long after startup.
+deepl = ut.LazyModule("deepl")
+
 # This is the value returned by the API if the user has unlimited usage.
 DEEPL_USAGE_UNLIMITED = 1_000_000_000_000
 
+# The API nominally accepts up to 128 KiB per request, but in practice requests failed well below
+# that, so whole requests are held to the same 25 kB the texts are split to (API_MAX_BYTES).
+# Up to 50 texts are allowed in a request.
+DEEPL_MAX_REQUEST_BYTES = 25_000
+DEEPL_MAX_TEXTS_PER_REQUEST = 50
+# The API tolerates a few parallel requests, but starts rate limiting beyond that.
+DEEPL_MAX_CONCURRENCY = 4
+
 
 @define
 class DeepLConfig(bi.BackendConfig):
@@ -26,6 +36,7 @@ class DeepLConfig(bi.BackendConfig):
     tl_max_chunks: int = 20
     tl_min_chunk_size: int = 5_000
     tl_preserve_formatting: bool = True
+    server_url: str = ""  # Blank means DeepL's own.
     wait_time: ct.Milliseconds = 1000
     help: ct.HTML = """<html> <head/> <body>
         <p> To use this specific translation service you need a DeepL API key.
@@ -73,6 +84,12 @@ class DeepLConfig(bi.BackendConfig):
                 type=bool,
                 description="Preserve formatting in the translated text.",
             ),
+            "server_url": bi.AttributeMetadata(
+                name="Server URL",
+                type=str,
+                description="Alternative address of the API, e.g. a local stand-in. "
+                "Leave blank to use DeepL.",
+            ),
             "wait_time": bi.AttributeMetadata(
                 name="Wait time",
                 type=ct.Milliseconds,
@@ -88,41 +105,129 @@ class DeepLBackend(bi.ReliableBackend):
 
     _config: DeepLConfig | None  # Needs to be passed from the config.
     _connection: bi.ConnectionStatus
+    _translator: "deepl.Translator | None"
 
     def __init__(self) -> None:
         super().__init__()
         self._status = bi.ConnectionStatus.Offline
+        self._translator = None
 
-    def connect(self) -> None: ...
+    def connect(self) -> None:
+        """
+        Open the translator and test it, since creating it doesn't talk to the API yet.
 
-    def disconnect(self) -> None: ...
+        :raises TranslationFailed: If the API can't be reached or the key is rejected.
+        """
+        config = self.config()
+        try:
+            translator = deepl.Translator(
+                auth_key=config.api_key, server_url=config.server_url or None
+            )
+            translator.get_usage()
+        except (deepl.DeepLException, ValueError) as e:
+            self._status = bi.ConnectionStatus.Error
+            raise bi.TranslationFailed(f"Failed to connect to DeepL: {e}") from e
+        self._translator = translator
+        self._status = bi.ConnectionStatus.Connected
+
+    def disconnect(self) -> None:
+        if self._translator is not None:
+            self._translator.close()
+        self._translator = None
+        self._status = bi.ConnectionStatus.Offline
 
     def supported_languages(self) -> list[tuple[str, str]]:
         """
         Returns a list of supported languages in the form of tuples (code, name).
         Example: [('en', 'English'), ('de', 'German'), ...]
         """
-        ...
+        try:
+            languages = self.translator().get_target_languages()
+        except deepl.DeepLException as e:
+            raise bi.TranslationFailed(f"Failed to load the languages: {e}") from e
+        return [(language.code, language.name) for language in languages]
 
     def supported_formats(self) -> list[ct.Formats]:
         """
         These are the supported file formats: Text, Epub, PDF etc.
         """
-        ...
+        return [ct.Formats.TEXT]
 
-    def config(self) -> dict[str, Any]: ...
+    def config(self) -> DeepLConfig:
+        return self._config if self._config is not None else self.default_config()
 
-    def default_config(self) -> dict[str, Any]: ...
+    def default_config(self) -> DeepLConfig:
+        return DeepLConfig()
 
-    def set_config(self, config: dict[str, Any]) -> None: ...
+    def set_config(self, config: DeepLConfig) -> None:
+        self._config = config
 
-    def translate_text(self, text: str) -> str: ...
+    def capabilities(self) -> bi.BackendCapabilities:
+        return bi.BackendCapabilities(
+            max_request_bytes=DEEPL_MAX_REQUEST_BYTES,
+            max_texts_per_request=DEEPL_MAX_TEXTS_PER_REQUEST,
+            supports_concurrency=True,
+            max_concurrency=DEEPL_MAX_CONCURRENCY,
+        )
 
-    def translate_file(self, file_in: Path, file_type: ct.Formats, file_out: Path) -> None: ...
+    def translator(self) -> "deepl.Translator":
+        if self._translator is None:
+            raise bi.TranslationFailed("Not connected to DeepL.")
+        return self._translator
+
+    def translate_text(self, text: str, is_html: bool = False) -> str:
+        return self.translate_texts([text], is_html)[0]
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        """
+        Translate the texts in one request.
+
+        :param texts: The texts to translate.
+        :param is_html: [Optional] Whether the texts are html.
+        :return: The translations, in the same order.
+        :raises TranslationFailed: If the request failed, with the subclass giving the reason.
+        """
+        logger.debug(
+            f"Requesting translation of {sum(len(t.encode('utf-8')) for t in texts):n} bytes, "
+            f"{sum(len(t) for t in texts):n} chars, split into {len(texts)} texts."
+        )
+        try:
+            results = self.translator().translate_text(
+                texts,
+                source_lang=self._source_language or None,
+                target_lang=self._target_language,
+                preserve_formatting=self.config().tl_preserve_formatting,
+                tag_handling="html" if is_html else None,
+            )
+        except deepl.QuotaExceededException as e:
+            raise bi.QuotaExceeded(str(e)) from e
+        except deepl.TooManyRequestsException as e:
+            raise bi.TooManyRequests(str(e)) from e
+        except (deepl.DeepLException, ValueError) as e:
+            raise bi.TranslationFailed(str(e)) from e
+        return [result.text for result in results]
+
+    def translate_file(self, file_in: Path, file_type: ct.Formats, file_out: Path) -> None:
+        if file_type is not ct.Formats.TEXT:
+            raise bi.UnsupportedFileFormat(f"Unsupported file format: {file_type}")
+        try:
+            with ut.read_autodetect_encoding(file_in) as f:
+                text = f.read()
+        except OSError as e:
+            raise bi.TranslationFailed(f"Error reading file: {e}") from e
+        file_out.write_text(self.translate_text(text))
 
     def status(self) -> bi.BackendStatus:
         """
         Contains status information specific to the backend.
         E.g. remaining characters, connection good/bad etc.
         """
-        return bi.BackendStatus()
+        if self._translator is None:
+            return bi.BackendStatus(self._status)
+        try:
+            usage = self._translator.get_usage().character
+        except deepl.DeepLException as e:
+            logger.warning(f"Failed to get the DeepL usage: {e}")
+            return bi.BackendStatus(bi.ConnectionStatus.Error)
+        limit = None if usage.limit in (None, DEEPL_USAGE_UNLIMITED) else usage.limit
+        return bi.BackendStatus(self._status, usage.count, limit)
@@ -1,6 +1,7 @@
 import deepqt.constants as ct
 import deepqt.backends.mock_backend as mb
 import deepqt.backends.deepl_backend as db
+import deepqt.backends.simulated_backend as sb
 
 # This is a mapping of backend names to their respective classes.
 # File separated out to prevent circular imports.
@@ -10,7 +11,8 @@ backend_to_config = {
     ct.Backend.DEEPL: db.DeepLConfig,
 }
 
+# The mock is simulated, so it behaves like a real service would, just without sending anything.
 backend_to_class = {
-    ct.Backend.MOCK: mb.MockBackend,
+    ct.Backend.MOCK: sb.SimulatedBackend,
     ct.Backend.DEEPL: db.DeepLBackend,
 }
@@ -1,5 +1,4 @@
-from itertools import cycle
-from io import StringIO
+import re
 from itertools import cycle
 from pathlib import Path
 
@@ -9,6 +8,57 @@ import deepqt.backends.backend_interface as bi
 import deepqt.constants as ct
 import deepqt.utils as ut
 
+MOCK_WORD = "translated"
+# Runs of letters, plus the odd non-decimal numeric character, which is handled separately.
+letter_runs_re = re.compile(r"[^\W\d_]+")
+# Tags and character references, which html translations must leave alone.
+html_markup_re = re.compile(r"(<[^>]*>|&#?\w+;)")
+
+
+def mock_translate(text: str) -> str:
+    """
+    Replaces all alphabetical characters with "translated", preserving the case.
+    The word continues across runs of letters, as if it were cycled through character by character.
+    """
+    offset = 0
+
+    def replace(match: re.Match) -> str:
+        nonlocal offset
+        run = match.group()
+        if not run.isalpha():
+            # Numeric characters like ² are kept and don't advance the word.
+            start = offset % len(MOCK_WORD)
+            letters = cycle(MOCK_WORD[start:] + MOCK_WORD[:start])
+            result = []
+            for char in run:
+                if char.isalpha():
+                    letter = next(letters)
+                    result.append(letter.upper() if char.isupper() else letter)
+                    offset += 1
+                else:
+                    result.append(char)
+            return "".join(result)
+
+        start = offset % len(MOCK_WORD)
+        letters = (MOCK_WORD * ((start + len(run)) // len(MOCK_WORD) + 1))[start : start + len(run)]
+        offset += len(run)
+        if run.islower():
+            return letters
+        return "".join(
+            letter.upper() if char.isupper() else letter for char, letter in zip(run, letters)
+        )
+
+    return letter_runs_re.sub(replace, text)
+
+
+def mock_translate_html(text: str) -> str:
+    """
+    Mock translate only the text between the tags, like a real service handling html would.
+    """
+    parts = html_markup_re.split(text)
+    # The split puts the markup at the odd indices.
+    return "".join(part if i % 2 else mock_translate(part) for i, part in enumerate(parts))
+
 
 # Note: dataclass attributes MUST have a type annotation, otherwise they won't be loaded from the subclass.
 @define
@@ -51,7 +101,7 @@ class MockConfig(bi.BackendConfig):
             "wait_time": bi.AttributeMetadata(
                 name="Wait time",
                 type=ct.Milliseconds,
-                description="Time to wait between chunks (ms).",
+                description="Simulated latency of each request (ms).",
             ),
         }
 
@@ -99,21 +149,22 @@ class MockBackend(bi.ReliableBackend):
     def set_config(self, config: MockConfig) -> None:
         self._config = config
 
-    def translate_text(self, text: str) -> str:
+    def capabilities(self) -> bi.BackendCapabilities:
+        # Nothing is sent anywhere, so there are no limits worth speaking of.
+        return bi.BackendCapabilities(
+            max_request_bytes=None,
+            max_texts_per_request=50,
+            supports_concurrency=True,
+            max_concurrency=4,
+        )
+
+    def translate_text(self, text: str, is_html: bool = False) -> str:
         """
         Replaces all alphabetical characters with "translated", preserving the case.
         """
-        translation = cycle("translated")
-        buffer = StringIO()
-        for char in text:
-            if char.isalpha():
-                if char.isupper():
-                    buffer.write(next(translation).upper())
-                else:
-                    buffer.write(next(translation))
-            else:
-                buffer.write(char)
-        return buffer.getvalue()
+        if is_html:
+            return mock_translate_html(text)
+        return mock_translate(text)
 
     def translate_file(self, file_in: Path, file_type: ct.Formats, file_out: Path) -> None:
         if file_type is ct.Formats.TEXT:
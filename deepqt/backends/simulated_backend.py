@@ -0,0 +1,207 @@
+"""
+A simulated translation service, for load testing the scheduling without a network or quota.
+
+The simulator models what a real API does to the client:
+latency depending on the request size, a maximum request size, a rate limit answered with 429s,
+a character quota, and random transient errors.
+It can be used in-process through SimulatedBackend, or served over HTTP as a stand-in
+for the DeepL API, see simulated_server.py.
+"""
+
+import math
+import random
+import threading
+import time
+
+from attrs import define, evolve, Factory
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.mock_backend as mb
+
+
+class RequestTooLarge(bi.TranslationFailed):
+    pass
+
+
+class TooManyRequests(bi.TooManyRequests):
+    pass
+
+
+class QuotaExceeded(bi.QuotaExceeded):
+    pass
+
+
+class TransientError(bi.TranslationFailed):
+    pass
+
+
+@define
+class SimulationProfile:
+    """
+    The behavior of the simulated service.
+    Latency is drawn from a log-normal distribution around the base plus per-KB latency,
+    with the jitter as its standard deviation relative to the mean.
+    A rate limit or quota of None means unlimited.
+    The time scale is applied to all sleeping, 0 makes requests instantaneous for tests,
+    without changing how the rate limit counts time.
+    """
+
+    latency_base_ms: float = 50
+    latency_per_kb_ms: float = 20
+    latency_jitter: float = 0.2
+    max_request_bytes: int = 128 * 1024
+    max_texts_per_request: int = 50
+    max_concurrency: int = 4
+    rate_limit_per_second: float | None = None
+    rate_limit_burst: int = 5
+    quota_chars: int | None = None
+    transient_error_rate: float = 0.0
+    time_scale: float = 1.0
+    seed: int | None = None
+
+
+@define
+class SimulationStats:
+    requests: int = 0
+    translated_chars: int = 0
+    too_large: int = 0
+    rate_limited: int = 0
+    quota_exceeded: int = 0
+    transient_errors: int = 0
+    simulated_seconds: float = 0
+
+
+@define
+class TranslationSimulator:
+    """
+    Handles requests like the service would, thread-safe.
+    """
+
+    profile: SimulationProfile = Factory(SimulationProfile)
+    stats: SimulationStats = Factory(SimulationStats)
+    used_chars: int = 0
+    _rng: random.Random = Factory(random.Random)
+    _lock: threading.Lock = Factory(threading.Lock)
+    # Token bucket for the rate limit.
+    _tokens: float = 0
+    _last_refill: float = 0
+
+    def __attrs_post_init__(self) -> None:
+        self._rng.seed(self.profile.seed)
+        self._tokens = self.profile.rate_limit_burst
+        self._last_refill = time.monotonic()
+
+    def latency(self, request_bytes: int) -> float:
+        """
+        Draw the time a request of the given size takes, in seconds.
+        """
+        mean = (
+            self.profile.latency_base_ms + self.profile.latency_per_kb_ms * request_bytes / 1024
+        ) / 1000
+        if mean <= 0 or self.profile.latency_jitter <= 0:
+            return max(mean, 0)
+        # Parameters of the log-normal distribution with the given mean and relative deviation.
+        sigma_squared = math.log(1 + self.profile.latency_jitter**2)
+        mu = math.log(mean) - sigma_squared / 2
+        with self._lock:
+            return self._rng.lognormvariate(mu, math.sqrt(sigma_squared))
+
+    def admit(self, texts: list[str]) -> None:
+        """
+        Check whether the request is accepted, and charge it against the rate limit and quota.
+
+        :param texts: The texts of the request.
+        :raises TranslationFailed: If the request is rejected, with the subclass giving the reason.
+        """
+        request_bytes = sum(len(text.encode("utf-8")) for text in texts)
+        chars = sum(len(text) for text in texts)
+        with self._lock:
+            self.stats.requests += 1
+            if (
+                request_bytes > self.profile.max_request_bytes
+                or len(texts) > self.profile.max_texts_per_request
+            ):
+                self.stats.too_large += 1
+                raise RequestTooLarge(f"Request of {request_bytes} bytes is too large.")
+
+            if self.profile.rate_limit_per_second is not None:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.profile.rate_limit_burst,
+                    self._tokens + (now - self._last_refill) * self.profile.rate_limit_per_second,
+                )
+                self._last_refill = now
+                if self._tokens < 1:
+                    self.stats.rate_limited += 1
+                    raise TooManyRequests("Too many requests, please wait and resend.")
+                self._tokens -= 1
+
+            if (
+                self.profile.quota_chars is not None
+                and self.used_chars + chars > self.profile.quota_chars
+            ):
+                self.stats.quota_exceeded += 1
+                raise QuotaExceeded("Quota for this billing period has been exceeded.")
+
+            if self._rng.random() < self.profile.transient_error_rate:
+                self.stats.transient_errors += 1
+                raise TransientError("Service temporarily unavailable.")
+
+            self.used_chars += chars
+
+    def translate(self, texts: list[str], is_html: bool = False) -> list[str]:
+        """
+        Handle a translation request, sleeping for the simulated latency.
+
+        :param texts: The texts to translate.
+        :param is_html: [Optional] Whether to leave the html markup untranslated.
+        :return: The mock translations.
+        :raises TranslationFailed: If the request is rejected, with the subclass giving the reason.
+        """
+        self.admit(texts)
+        seconds = self.latency(sum(len(text.encode("utf-8")) for text in texts))
+        if self.profile.time_scale > 0:
+            time.sleep(seconds * self.profile.time_scale)
+        mock_translate = mb.mock_translate_html if is_html else mb.mock_translate
+        translations = [mock_translate(text) for text in texts]
+        with self._lock:
+            self.stats.translated_chars += sum(len(text) for text in texts)
+            self.stats.simulated_seconds += seconds
+        return translations
+
+
+class SimulatedBackend(mb.MockBackend):
+    """
+    The mock backend, but with the behavior of a real service, as configured in the profile.
+    """
+
+    simulator: TranslationSimulator
+
+    def __init__(self, profile: SimulationProfile | None = None) -> None:
+        super().__init__()
+        self.simulator = TranslationSimulator(profile or SimulationProfile())
+
+    def set_config(self, config: mb.MockConfig) -> None:
+        super().set_config(config)
+        # The mock's wait time stands in for the latency of each request.
+        self.simulator.profile = evolve(self.simulator.profile, latency_base_ms=config.wait_time)
+
+    def capabilities(self) -> bi.BackendCapabilities:
+        profile = self.simulator.profile
+        return bi.BackendCapabilities(
+            max_request_bytes=profile.max_request_bytes,
+            max_texts_per_request=profile.max_texts_per_request,
+            supports_concurrency=profile.max_concurrency > 1,
+            max_concurrency=profile.max_concurrency,
+        )
+
+    def translate_text(self, text: str, is_html: bool = False) -> str:
+        return self.simulator.translate([text], is_html)[0]
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        return self.simulator.translate(texts, is_html)
+
+    def status(self) -> bi.BackendStatus:
+        return bi.BackendStatus(
+            self._status, self.simulator.used_chars, self.simulator.profile.quota_chars
+        )
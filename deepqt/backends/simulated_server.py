@@ -0,0 +1,229 @@
+"""
+A local stand-in for the DeepL API, backed by the translation simulator.
+
+This serves the endpoints DeepQt uses on the address the DeepL backend's server URL can be
+pointed at, so the real client code, including its retries on 429s, can be load tested offline:
+    python -m deepqt.backends.simulated_server --rate-limit 2 --quota 100000
+"""
+
+import argparse
+import json
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from loguru import logger
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.simulated_backend as sb
+
+DEFAULT_HOST = "localhost"
+DEFAULT_PORT = 3000
+
+# DeepL's status code for an exhausted quota.
+HTTP_STATUS_QUOTA_EXCEEDED = 456
+
+# Enough to make the language selection work.
+SIMULATED_LANGUAGES = [
+    ("DE", "German"),
+    ("EN", "English"),
+    ("EN-GB", "English (British)"),
+    ("EN-US", "English (American)"),
+    ("FR", "French"),
+    ("JA", "Japanese"),
+]
+
+# The status code for each rejection of the simulator.
+error_statuses: dict[type[Exception], int] = {
+    sb.RequestTooLarge: HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+    sb.TooManyRequests: HTTPStatus.TOO_MANY_REQUESTS,
+    sb.QuotaExceeded: HTTP_STATUS_QUOTA_EXCEEDED,
+    sb.TransientError: HTTPStatus.SERVICE_UNAVAILABLE,
+}
+
+
+class SimulatedApiHandler(BaseHTTPRequestHandler):
+    # Set on the subclass created by SimulatedServer.
+    simulator: sb.TranslationSimulator
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(f"Simulated API: {format % args}")
+
+    def send_json(self, status: int, content: dict | list) -> None:
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_params(self) -> dict[str, list[str]]:
+        """
+        Collect the parameters from the query string and the body, which may be JSON or a form.
+        Every value is returned as a list, like repeated form fields.
+        """
+        params = parse_qs(urlsplit(self.path).query)
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return params
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            for key, value in json.loads(body).items():
+                params[key] = value if isinstance(value, list) else [value]
+        else:
+            for key, values in parse_qs(body.decode("utf-8")).items():
+                params.setdefault(key, []).extend(values)
+        return params
+
+    def do_GET(self) -> None:
+        self.handle_request()
+
+    def do_POST(self) -> None:
+        self.handle_request()
+
+    def handle_request(self) -> None:
+        route = urlsplit(self.path).path.rstrip("/")
+        try:
+            params = self.read_params()
+        except (ValueError, UnicodeDecodeError) as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"message": f"Malformed request: {e}"})
+            return
+
+        if route == "/v2/translate":
+            self.handle_translate(params)
+        elif route == "/v2/usage":
+            usage = {"character_count": self.simulator.used_chars}
+            if self.simulator.profile.quota_chars is not None:
+                usage["character_limit"] = self.simulator.profile.quota_chars
+            self.send_json(HTTPStatus.OK, usage)
+        elif route == "/v2/languages":
+            is_target = params.get("type", ["source"])[0] == "target"
+            languages = [
+                {"language": code, "name": name}
+                | ({"supports_formality": False} if is_target else {})
+                for code, name in SIMULATED_LANGUAGES
+                if is_target or "-" not in code
+            ]
+            self.send_json(HTTPStatus.OK, languages)
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"message": f"Unknown endpoint {route}"})
+
+    def handle_translate(self, params: dict[str, list[str]]) -> None:
+        texts = [str(text) for text in params.get("text", [])]
+        if not texts:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"message": "Parameter 'text' not specified."})
+            return
+        try:
+            is_html = params.get("tag_handling", [""])[0] in ("html", "xml")
+            translations = self.simulator.translate(texts, is_html)
+        except bi.TranslationFailed as e:
+            self.send_json(error_statuses.get(type(e), HTTPStatus.BAD_REQUEST), {"message": str(e)})
+            return
+
+        self.send_json(
+            HTTPStatus.OK,
+            {
+                "translations": [
+                    {
+                        "detected_source_language": "EN",
+                        "text": translation,
+                        "billed_characters": len(text),
+                    }
+                    for text, translation in zip(texts, translations)
+                ]
+            },
+        )
+
+
+class SimulatedServer:
+    """
+    Serves the simulated API from a background thread.
+    """
+
+    simulator: sb.TranslationSimulator
+    server: ThreadingHTTPServer
+    thread: threading.Thread | None
+
+    def __init__(
+        self,
+        profile: sb.SimulationProfile | None = None,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+    ) -> None:
+        """
+        :param profile: [Optional] The behavior of the simulated service.
+        :param host: The address to listen on.
+        :param port: The port to listen on, 0 picks a free one.
+        """
+        self.simulator = sb.TranslationSimulator(profile or sb.SimulationProfile())
+        handler = type("Handler", (SimulatedApiHandler,), {"simulator": self.simulator})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Simulated DeepL API listening on {self.url}")
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __enter__(self) -> "SimulatedServer":
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.stop()
+
+
+def main() -> None:
+    defaults = sb.SimulationProfile()
+    parser = argparse.ArgumentParser(description="Serve a simulated DeepL API for load testing.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-base-ms", type=float, default=defaults.latency_base_ms)
+    parser.add_argument("--latency-per-kb-ms", type=float, default=defaults.latency_per_kb_ms)
+    parser.add_argument("--latency-jitter", type=float, default=defaults.latency_jitter)
+    parser.add_argument("--max-request-bytes", type=int, default=defaults.max_request_bytes)
+    parser.add_argument("--rate-limit", type=float, help="Requests per second, unlimited if unset.")
+    parser.add_argument("--rate-limit-burst", type=int, default=defaults.rate_limit_burst)
+    parser.add_argument("--quota", type=int, help="Characters, unlimited if unset.")
+    parser.add_argument("--error-rate", type=float, default=defaults.transient_error_rate)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    profile = sb.SimulationProfile(
+        latency_base_ms=args.latency_base_ms,
+        latency_per_kb_ms=args.latency_per_kb_ms,
+        latency_jitter=args.latency_jitter,
+        max_request_bytes=args.max_request_bytes,
+        rate_limit_per_second=args.rate_limit,
+        rate_limit_burst=args.rate_limit_burst,
+        quota_chars=args.quota,
+        transient_error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    server = SimulatedServer(profile, args.host, args.port)
+    server.start()
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info(f"Served {server.simulator.stats}")
+
+
+if __name__ == "__main__":
+    main()
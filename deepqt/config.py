@@ -11,6 +11,7 @@ from loguru import logger
 from collections import namedtuple
 
 import deepqt.backends.backend_interface as bi
+import deepqt.backends.deepl_backend as deepl_b
 import deepqt.backends.lookups as b_lut  # backend lookup table
 import deepqt.constants as ct
 import deepqt.utils as ut
@@ -28,6 +29,10 @@ class Config:
     glossary_path: str = ""
     use_glossary: bool = True
 
+    # Apply the pre- and postprocessing rules, blank path means the bundled quote protection.
+    use_quote_protection: bool = False
+    processing_rules_path: str = ""
+
     # Advanced options not shown on the mainwindow:
     dump_on_abort: bool = True
     epub_nuke_kobo: bool = True
@@ -36,11 +41,45 @@ class Config:
     epub_crush: bool = False
     epub_make_text_horizontal: bool = True
     epub_ignore_empty_html: bool = True
+    epub_lazy_loading: bool = True  # Only fully load epubs once their contents are needed.
+    epub_cache_max_mb: int = 500  # Least recently used books are evicted beyond this size.
+    lean_memory: bool = False  # Only keep the text being translated, recompute the others.
+    deduplicate: bool = True  # Translate text repeated within and across files only once.
+    progress_updates_per_second: int = 10  # How often translation progress is shown.
 
     # Backend configs:
     current_backend: bi.BackendID = bi.BackendIdNone
     backend_configs: dict[bi.BackendID, bi.BackendConfig] = Factory(dict)
 
+    def epub_options(self) -> dict[str, bool]:
+        """
+        Collect the options used to initialize epub files.
+
+        :return: The keyword arguments for EpubFile.initialize_files.
+        """
+        return {
+            "nuke_ruby": self.epub_nuke_ruby,
+            "nuke_kobo": self.epub_nuke_kobo,
+            "nuke_indents": self.epub_nuke_indents,
+            "crush_html": self.epub_crush,
+            "make_text_horizontal": self.epub_make_text_horizontal,
+            "ignore_empty": self.epub_ignore_empty_html,
+        }
+
+    def chunking(self) -> tuple[int, int]:
+        """
+        Get the chunking options of the current backend.
+        Backends without any use the defaults of the DeepL backend.
+
+        :return: The maximum number of chunks and the minimum chunk size.
+        """
+        default = deepl_b.DeepLConfig()
+        backend_config = self.backend_configs.get(self.current_backend)
+        return (
+            getattr(backend_config, "tl_max_chunks", default.tl_max_chunks),
+            getattr(backend_config, "tl_min_chunk_size", default.tl_min_chunk_size),
+        )
+
     def save(self, path: Path = None) -> bool:
         """
         Write to a temporary file and then move it to the destination.
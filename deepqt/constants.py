@@ -27,6 +27,7 @@ class Command(Enum):
     FILES = "files"
     TEXT = "text"
     CLIPBOARD = "clipboard"
+    PLAN = "plan"
 
 
 class Backend(StrEnum):
@@ -0,0 +1,160 @@
+"""
+Translates text repeated within and across the files of a batch only once.
+
+Light novel series and subtitle batches repeat a lot of text verbatim: chapter headers,
+separator lines, table of contents entries, disclaimers. Before each request, the texts are
+split into segments at the lines repeated across the batch, and segments that were already
+translated during the run are reused instead of sent again. The translations are reassembled
+in place, so the output has the same layout as if everything had been sent.
+
+Short repeated lines, like dialogue ("Yes."), stay in their chunk, since they rely on the
+surrounding text to be translated well. Only longer lines, and lines without any words,
+like separators, are split off. Identical whole texts are always reused.
+"""
+
+import re
+from collections import Counter
+from typing import Callable, Iterable
+
+# Repeated lines shorter than this are left in context, unless they hold no words at all.
+MIN_REPEATED_LINE_CHARS = 20
+WORD_PATTERN = re.compile(r"\w")
+
+# A piece of text, and whether it needs translating. Whitespace is kept as is.
+Segment = tuple[str, bool]
+
+
+def is_line_worth_splitting(line: str) -> bool:
+    return bool(line) and (len(line) >= MIN_REPEATED_LINE_CHARS or not WORD_PATTERN.search(line))
+
+
+def find_repeated_lines(texts: Iterable[str], min_count: int = 2) -> set[str]:
+    """
+    Find the lines occurring at least min_count times in all texts together.
+    Lines are compared without their surrounding whitespace.
+
+    :param texts: The texts to search.
+    :param min_count: [Optional] How often a line must occur.
+    :return: The repeated lines, stripped.
+    """
+    counts = Counter(
+        stripped
+        for text in texts
+        for line in text.splitlines()
+        if is_line_worth_splitting(stripped := line.strip())
+    )
+    return {line for line, count in counts.items() if count >= min_count}
+
+
+def translatable(text: str) -> Segment:
+    return text, bool(text.strip())
+
+
+class Deduplicator:
+    """
+    Remembers the translations of a run, to send every unique segment only once.
+    """
+
+    repeated_lines: set[str]
+    remember_all: bool
+    memory: dict[str, str]
+    saved_chars: int  # The characters that weren't sent because they were repeated.
+
+    def __init__(self, repeated_lines: set[str] | None = None, remember_all: bool = True) -> None:
+        """
+        :param repeated_lines: [Optional] The lines to split off and translate separately.
+        :param remember_all: [Optional] Remember the translations of all segments, to reuse
+            identical chunks. Otherwise only the repeated lines are remembered, to save memory.
+        """
+        self.repeated_lines = repeated_lines or set()
+        self.remember_all = remember_all
+        self.memory = {}
+        self.saved_chars = 0
+
+    def segments(self, text: str) -> list[Segment]:
+        """
+        Split the text at the repeated lines.
+        Line breaks around each segment and whitespace around the repeated lines are
+        kept as they are, so that they can't be lost in translation.
+
+        :param text: The text to split.
+        :return: The segments, in order.
+        """
+        segments = []
+        run_start = 0
+        position = 0
+        for line in text.splitlines(keepends=True):
+            content = line.strip()
+            if content in self.repeated_lines:
+                segments += split_line_breaks(text[run_start:position])
+                start = position + line.index(content)
+                end = start + len(content)
+                segments.append((text[position:start], False))
+                segments.append((content, True))
+                segments.append((text[end : position + len(line)], False))
+                run_start = position + len(line)
+            position += len(line)
+        segments += split_line_breaks(text[run_start:])
+        return [segment for segment in segments if segment[0]]
+
+    def translate(
+        self,
+        texts: list[str],
+        translate_batch: Callable[[list[str]], list[str]],
+        split_lines: bool = True,
+    ) -> list[str]:
+        """
+        Translate the texts, sending only the segments not translated before.
+
+        :param texts: The texts to translate.
+        :param translate_batch: Translates a list of texts in one go. Only called if
+            anything needs to be sent.
+        :param split_lines: [Optional] Split the texts at the repeated lines. Markup can't be split,
+            so html texts are only reused as a whole.
+        :return: The translations, in the same order as the texts.
+        """
+        if split_lines:
+            text_segments = [self.segments(text) for text in texts]
+        else:
+            text_segments = [[translatable(text)] for text in texts]
+
+        pending: dict[str, None] = {}  # Ordered set.
+        for segments in text_segments:
+            for segment, needs_translation in segments:
+                if not needs_translation:
+                    continue
+                if segment in self.memory or segment in pending:
+                    self.saved_chars += len(segment)
+                else:
+                    pending[segment] = None
+
+        translations = {}
+        if pending:
+            batch = list(pending)
+            translations = dict(zip(batch, translate_batch(batch)))
+
+        results = []
+        for segments in text_segments:
+            parts = []
+            for segment, needs_translation in segments:
+                if not needs_translation:
+                    parts.append(segment)
+                elif segment in translations:
+                    parts.append(translations[segment])
+                else:
+                    parts.append(self.memory[segment])
+            results.append("".join(parts))
+
+        for segment, translation in translations.items():
+            if self.remember_all or segment in self.repeated_lines:
+                self.memory[segment] = translation
+        return results
+
+
+def split_line_breaks(text: str) -> list[Segment]:
+    """
+    Split off the leading and trailing line breaks, which are kept as they are.
+    """
+    content = text.strip("\r\n")
+    start = len(text) - len(text.lstrip("\r\n"))
+    return [(text[:start], False), translatable(content), (text[start + len(content) :], False)]
@@ -102,7 +102,6 @@ class EpubPreview(Qw.QDialog, Ui_EpubPreview):
         """
         Save the current state of the epub.
         """
-        # ut.zip_folder_to_epub(self.epub_file.cache_dir, self.epub_file.cache_dir.parent / self.epub_file.path.name)
         if self.radioButton_original.isChecked():
             process_level = st.ProcessLevel.RAW
             name_suffix = "original"
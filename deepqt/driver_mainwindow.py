@@ -1,16 +1,16 @@
+from __future__ import annotations
+
 import sys
-import shutil
+import time
 from functools import partial
 from math import ceil
 from pathlib import Path
 import platform
 from enum import Enum
 
-import psutil
 import PySide6.QtCore as Qc
 import PySide6.QtGui as Qg
 import PySide6.QtWidgets as Qw
-import deepl
 from PySide6.QtCore import Signal, Slot
 from loguru import logger
 
@@ -22,11 +22,15 @@ import deepqt.backends.lookups as b_lut
 import deepqt.config as cfg
 import deepqt.glossary as gl
 import deepqt.memory_watcher as mw
+import deepqt.progress_aggregator as pa
 import deepqt.structures as st
+import deepqt.throughput as tp
+import deepqt.tracing as trc
 import deepqt.worker_thread as wt
 import deepqt.constants as ct
 import deepqt.utils as ut
 import deepqt.gui_utils as gu
+import deepqt.planner as planner
 import deepqt.issue_reporter_driver as ird
 import deepqt.driver_backend_configuration as dbc
 from deepqt import __program__, __version__
@@ -34,6 +38,10 @@ from deepqt import __program__, __version__
 from deepqt.file_table import Column, make_output_filename
 from deepqt.ui_generated_files.ui_mainwindow import Ui_MainWindow
 
+# Not needed to show the window, so they are imported on first use.
+deepl = ut.LazyModule("deepl")
+psutil = ut.LazyModule("psutil")
+
 
 # noinspection PyUnresolvedReferences
 class MainWindow(Qw.QMainWindow, Ui_MainWindow):
@@ -41,6 +49,9 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
     glossary: st.Glossary = None
     translating: bool
     debug: bool
+    epub_writers: dict[str, st.EpubStreamWriter]  # Streaming outputs of the current translation.
+    text_writers: dict[str, st.TextStreamWriter]  # Likewise, for memory mapped text files.
+    progress_aggregator: pa.ProgressAggregator | None  # Of the current translation.
 
     translation_mode: ct.TranslationMode
 
@@ -85,6 +96,10 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         self.theme_is_dark = ut.Shared[bool](True)
 
         self.translating = False  # If true, the translation is in progress.
+        self.epub_writers = {}
+        self.text_writers = {}
+        self.progress_aggregator = None
+        self.deduplicated_chars = 0
         self.glossary = st.Glossary()  # Create a dummy glossary
         self.hamburger_menu = Qw.QMenu()
 
@@ -98,6 +113,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         self.config.backend_configs[bi.BackendID("0")] = mock_b.MockConfig()
         self.config.save()
         self.config.pretty_log()
+        self.throughput = tp.ThroughputModel.load(ut.get_throughput_path())
         # Share config with the file table.
         self.file_table.set_config(self.config)
 
@@ -192,12 +208,13 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         self.file_table.not_ready_for_translation.connect(self.not_ready_to_translate)
         self.file_table.statusbar_message.connect(self.statusbar.showMessage)
         self.file_table.recalculate_char_total.connect(self.recalculate_char_total)
+        self.file_table.epub_files_loaded.connect(self.epub_files_loaded)
 
     def post_init(self) -> None:
         """
         Post-initialization tasks, mostly stuff that needs to happen after the window is shown.
         """
-        nuke_epub_cache()
+        ut.prune_epub_cache(self.config.epub_cache_max_mb * 1024**2)
         self.load_glossary()
 
         def exception_handler(exctype, value, traceback) -> None:
@@ -224,7 +241,8 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
             Qc.QCoreApplication.processEvents()
             self.threadpool.waitForDone()
 
-        nuke_epub_cache()
+        st.shutdown_html_pool()
+        ut.prune_epub_cache(self.config.epub_cache_max_mb * 1024**2)
         event.accept()
 
     def load_config(self) -> cfg.Config:
@@ -330,8 +348,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         #     self.label_backend_logo.setPixmap(backend_config.load_icon().pixmap(Qc.QSize(24, 24)))
 
         return
-        # Ignore the mock because it cannot give language options. It is only to be used for translation.
-        translator = self.open_translator(use_mock=False)
+        translator = self.open_translator()
 
         self.show_api_status(translator is not None)
         self.update_current_usage(translator)
@@ -506,7 +523,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
 
     # ======================================= Misc. Helpers =======================================
 
-    def open_translator(self, use_mock: bool = True) -> deepl.Translator | None:
+    def open_translator(self) -> deepl.Translator | None:
         """
         Open a translator instance.
 
@@ -518,22 +535,43 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
             logger.warning("No API key set")
             return None
         try:
-            if self.config.tl_mock and use_mock:
-                logger.info("Opening mock translator.")
-                return deepl.Translator(
-                    auth_key="1234567890",
-                    server_url="http://localhost:3000",
-                )
-            else:
-                logger.info("Opening translator.")
-                translator = deepl.Translator(auth_key=self.config.api_key)
-                # Test the api, since initialization doesn't mean success.
-                translator.get_source_languages()
-                return translator
+            logger.info("Opening translator.")
+            translator = deepl.Translator(auth_key=self.config.api_key)
+            # Test the api, since initialization doesn't mean success.
+            translator.get_source_languages()
+            return translator
         except Exception as e:
             show_warning(self, "API Error", f"Failed to connect to DeepL API\n\n{e}")
             return None
 
+    def open_backend(self) -> bi.Backend | None:
+        """
+        Connect to the current backend, set up with its config and the chosen languages.
+
+        :return: The connected backend, or None if it failed, after warning the user.
+        """
+        backend_config = self.config.backend_configs.get(self.config.current_backend)
+        if backend_config is None:
+            gu.show_warning(
+                self, "Backend Error", "No translation service selected. Please configure one."
+            )
+            return None
+        backend = b_lut.backend_to_class[backend_config.backend_type]()
+        backend.set_config(backend_config)
+        backend.set_languages(self.config.lang_from, self.config.lang_to)
+        try:
+            logger.info(f"Connecting to {backend_config.name}.")
+            backend.connect()
+        except bi.TranslationFailed as e:
+            logger.error(f"Failed to connect to {backend_config.name}: {e}")
+            gu.show_warning(
+                self,
+                "Backend Error",
+                f"Failed to connect to {backend_config.name}. Please check its settings.\n\n{e}",
+            )
+            return None
+        return backend
+
     def update_file_table_params(self) -> None:
         """
         Update the file table with the current parameters.
@@ -605,14 +643,19 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
     """
 
     def start_translating(self) -> None:
+        # Lazily loaded epubs only have an estimated char count, so load them for an accurate total.
+        # This happens in the background, starting the translation once they're loaded.
+        if self.file_table.load_all_epub_files():
+            logger.info("Loading lazy epub files before translating.")
+            self.statusbar.showMessage("Loading epub files...")
+            return
+
         logger.info("Starting translation.")
         # Check if the API is ready.
-        translator = self.open_translator()
-        if translator is None:
-            gu.show_warning(
-                self, "API Error", "Failed to open DeepL translator. Please check account settings."
-            )
-        if self.config.tl_mock:
+        backend = self.open_backend()
+        if backend is None:
+            return
+        if isinstance(backend, mock_b.MockBackend):
             gu.show_warning(
                 self,
                 "Mock Mode",
@@ -620,7 +663,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
             )
         else:
             # Skip the char count warning when mocking because then we can't load usage stats and it doesn't matter.
-            if not self.char_count_warning(translator):
+            if not self.char_count_warning(backend):
                 return
 
         # Restrict user interaction.
@@ -634,23 +677,70 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         self.label_progress.setText("Preparing...")
         self.statusbar.showMessage("Translating...")
 
+        # Epub files are written chapter by chapter as they are translated.
+        # Memory mapped text files chunk by chunk, so their translation is never held in memory.
+        self.epub_writers = {}
+        self.text_writers = {}
+        for file_id, file in self.file_table.files.items():
+            if not isinstance(file, (st.EpubFile, st.MappedTextFile)):
+                continue
+            path_out = make_output_filename(file, self.config)
+            try:
+                if isinstance(file, st.EpubFile):
+                    self.epub_writers[file_id] = st.EpubStreamWriter(file, path_out)
+                else:
+                    self.text_writers[file_id] = st.TextStreamWriter(path_out)
+            except OSError as e:
+                # It's written all at once at the end instead.
+                logger.warning(f"Failed to create streaming output {path_out}: {e}")
+
+        # The worker reports its progress to the aggregator, which passes it on at a steady rate.
+        self.progress_aggregator = pa.ProgressAggregator(
+            self.config.progress_updates_per_second, self
+        )
+        self.progress_aggregator.updated.connect(self.translation_worker_progress)
+        self.progress_aggregator.start()
+
         # Send the data off to the worker.
         worker = ai.DeeplWorker(
-            translator=translator, input_files=self.file_table.files, config=self.config
+            backend=backend,
+            input_files=self.file_table.files,
+            config=self.config,
+            epub_writers=self.epub_writers,
+            text_writers=self.text_writers,
+            progress=self.progress_aggregator,
+            throughput=self.throughput,
         )
+        self.deduplicated_chars = 0
         worker.signals.result.connect(self.translation_worker_result)
-        worker.signals.progress.connect(self.translation_worker_progress)
         worker.signals.error.connect(self.translation_worker_error)
+        worker.signals.deduplicated.connect(self.translation_worker_deduplicated)
         self.abort_translation_worker.connect(worker.abort)
         self.threadpool.start(worker)
 
-    def char_count_warning(self, translator: deepl.Translator) -> bool:
+    def epub_files_loaded(self, success: bool) -> None:
+        """
+        Start the translation that was waiting for the lazy epubs to load.
+
+        :param success: False if an epub failed to load.
+        """
+        if not success:
+            self.statusbar.showMessage("Failed to load epub files.", 10_000)
+            gu.show_warning(
+                self,
+                "Epub Error",
+                "Failed to load an epub file, see the file table. Remove it to translate the others.",
+            )
+            return
+        self.start_translating()
+
+    def char_count_warning(self, backend: bi.Backend) -> bool:
         # Make sure the user is aware of how many characters will be translated.
         # Check if the allotted character count won't exceed the quota.
         total_chars = sum(file.char_count for file in self.file_table.files.values())
-        api_usage = translator.get_usage()
-        if api_usage.character.limit != DEEPL_USAGE_UNLIMITED:
-            allowed_chars = api_usage.character.limit - api_usage.character.count
+        status = backend.status()
+        if status.usage_limit is not None and status.usage_count is not None:
+            allowed_chars = status.usage_limit - status.usage_count
             remaining_chars = allowed_chars - total_chars
             warning_msg = (
                 f"You are about to translate {ut.format_char_count(total_chars)} "
@@ -659,7 +749,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
                 f"{ut.f_plural(remaining_chars, 'character')}."
                 f"\nProceed?"
             )
-            if api_usage.character.limit_reached:
+            if allowed_chars <= 0:
                 warning_msg = "You have reached your character limit.\nProceed anyway?"
             elif total_chars > allowed_chars:
                 warning_msg = (
@@ -673,14 +763,38 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
                 f"{ut.f_plural(total_chars, 'character')}."
                 f"\nProceed?"
             )
+        # Show what the translation will take, planned without sending anything.
+        plan = self.plan_translation(backend)
+        warning_msg = f"{plan.summary()}\n\n{warning_msg}"
         # Ask the user if he wants to proceed, just in case.
-        logger.info(f"Character limit warning: {warning_msg}")
-        affirmation = gu.show_question(self, "API Limit", warning_msg)
+        logger.info(f"Character limit warning: {warning_msg}\n{plan.breakdown()}")
+        affirmation = gu.show_question(
+            self, "API Limit", warning_msg, detailed_text=plan.breakdown()
+        )
         if not affirmation:
             logger.info("Translation cancelled.")
             return False
         return True
 
+    def plan_translation(self, backend: bi.Backend) -> planner.TranslationPlan:
+        """
+        Partition the files like the translation would, to report the requests and time needed.
+
+        :param backend: The backend to translate with, to batch the requests like it will be.
+        """
+        max_chunks, min_chunk_size = self.config.chunking()
+        return planner.plan_translation(
+            list(self.file_table.files.values()),
+            max_chunks,
+            min_chunk_size,
+            self.throughput,
+            self.config.current_backend,
+            self.config.lang_from,
+            self.config.lang_to,
+            self.config.deduplicate,
+            backend.capabilities(),
+        )
+
     def translation_worker_result(self, exit_code: ai.State) -> None:
         """
         If we made it here, the translation was either successful or aborted.
@@ -690,11 +804,19 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         """
 
         logger.info(f"Translation finished with exit code {exit_code}")
+        self.stop_progress_updates()
         self.text_output_changed.emit()
 
         if exit_code == ai.State.DONE:
             self.statusbar.showMessage("Translation finished.")
-            gu.show_info(self, "Finished", "Translations successfully completed.")
+            message = "Translations successfully completed."
+            if self.deduplicated_chars:
+                message += (
+                    f"\n\n{ut.format_char_count(self.deduplicated_chars)} repeated "
+                    f"{ut.f_plural(self.deduplicated_chars, 'character')} "
+                    "were translated only once."
+                )
+            gu.show_info(self, "Finished", message)
             for file_id in self.file_table.files:
                 self.write_output_file(file_id)
 
@@ -717,26 +839,38 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
 
         self.translation_worker_finished()
 
-    def translation_worker_progress(
-        self, key: str, message: str, processed_chars: int | None, total_chars: int | None
-    ) -> None:
+    def translation_worker_deduplicated(self, saved_chars: int) -> None:
+        self.deduplicated_chars = saved_chars
+
+    def translation_worker_progress(self, progress: pa.ProgressSnapshot) -> None:
+        """
+        Update the file table and status labels with the progress since the last update.
+
+        :param progress: The latest message of each file and the latest char counts.
         """
-        Update the file with the key in the file table to display this message.
+        for key, message in progress.messages.items():
+            self.file_table.show_file_progress(key, message)
+        if progress.has_counts():
+            self.update_translation_status(progress.processed_chars, progress.total_chars)
 
-        :param key: InputFile ID.
-        :param message: Progress status.
-        :param processed_chars: Number of characters processed.
-        :param total_chars: Total number of characters to process.
+    def stop_progress_updates(self) -> None:
         """
-        logger.debug(f"Translation progress: {key} {message} {processed_chars} {total_chars}")
-        self.file_table.show_file_progress(key, message)
-        if processed_chars is not None and total_chars is not None:
-            self.update_translation_status(processed_chars, total_chars)
+        Show the final progress of the translation, and stop updating it.
+        """
+        if self.progress_aggregator is None:
+            return
+        self.progress_aggregator.stop()
+        self.progress_aggregator.deleteLater()
+        self.progress_aggregator = None
 
     def translation_worker_error(self, error: wt.WorkerError) -> None:
         logger.error(f"Translation failed.\n{error}")
+        self.stop_progress_updates()
         self.statusbar.showMessage(f"Translation failed.")
         gu.show_warning(self, "Translation Error", f"Translation failed.\n\n{error.value}")
+        if self.config.dump_on_abort:
+            for file_id in self.file_table.files:
+                self.write_output_file(file_id)
         self.translation_worker_finished()
 
     def translation_worker_finished(self) -> None:
@@ -749,8 +883,29 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         self.abort_button_enabled(False)
         self.show_button_start()
         self.hide_progress()
+        # Remove partial outputs that weren't dumped.
+        for writer in [*self.epub_writers.values(), *self.text_writers.values()]:
+            writer.discard()
+        self.epub_writers = {}
+        self.text_writers = {}
         self.config.save()  # Save the last average time/1000 characters.
+        self.throughput.save()
         self.load_config_to_ui()
+        self.export_stage_timings()
+
+    def export_stage_timings(self) -> None:
+        """
+        Export the timings of the stages since the last export, which includes the
+        preprocessing of the files and the translation run itself.
+        """
+        if not trc.tracer.spans():
+            return
+        logger.info(f"Stage timings:\n{trc.tracer.format_summary()}")
+        try:
+            trc.tracer.export(ut.get_trace_path(), time.strftime("%Y-%m-%d_%H-%M-%S"))
+        except OSError as e:
+            logger.error(f"Failed to export the stage timings: {e}")
+        trc.tracer.clear()
 
     def abort_translating(self) -> None:
         logger.info("Aborting translation.")
@@ -767,12 +922,13 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
 
         file = self.file_table.files[file_id]
         try:
-            if isinstance(file, st.TextFile):
-                self.write_output_text_file(file_id)
-            elif isinstance(file, st.EpubFile):
-                self.write_output_epub_file(file_id)
-            else:
-                raise TypeError(f"Unknown file type: {file}")
+            with trc.span("write", "io", file=file.path.name):
+                if isinstance(file, st.TextFile):
+                    self.write_output_text_file(file_id)
+                elif isinstance(file, st.EpubFile):
+                    self.write_output_epub_file(file_id)
+                else:
+                    raise TypeError(f"Unknown file type: {file}")
 
         except OSError as e:
             path_out = make_output_filename(file, self.config)
@@ -803,9 +959,23 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         :param file_id: InputFile ID.
         """
         file = self.file_table.files[file_id]
-        text_out = file.get_translated_text()
         path_out = make_output_filename(file, self.config)
+        writer = self.text_writers.pop(file_id, None)
+        if writer is not None:
+            # The translation was streamed to the output, it only needs to be moved into place.
+            if not writer.written_chunks:  # Case 1.
+                logger.info(f"Skipping file {file_id} because it has not been translated.")
+                self.file_table.show_file_progress(file_id, "Not translated.")
+                writer.discard()
+            elif writer.written_chunks < file.chunk_count():  # Case 3.
+                writer.finalize(path_out, incomplete=True)
+                self.file_table.show_file_progress(file_id, "Incomplete output written.")
+            else:  # Case 2.
+                writer.finalize(path_out)
+                self.file_table.show_file_progress(file_id, "Translation written.")
+            return
 
+        text_out = file.get_translated_text()
         if text_out is None:  # Case 1.
             logger.info(f"Skipping file {file_id} because it has not been translated.")
             self.file_table.show_file_progress(file_id, "Not translated.")
@@ -838,14 +1008,21 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         """
         file: st.EpubFile = self.file_table.files[file_id]
         path_out = make_output_filename(file, self.config)
+        writer = self.epub_writers.pop(file_id, None)
 
         if not file.translation_incomplete() and not file.is_translated():
             # Skip this because we have nothing to dump.
             logger.info(f"Skipping file {file_id} because nothing has been translated.")
             self.file_table.show_file_progress(file_id, "Not translated.")
+            if writer is not None:
+                writer.discard()
             return
 
-        file.write(st.ProcessLevel.TRANSLATED, path_out)
+        if writer is None:
+            file.write(st.ProcessLevel.TRANSLATED, path_out)
+        else:
+            # Most of it was streamed already, just add the rest.
+            writer.finalize(path_out)
 
     """
     Log file
@@ -988,7 +1165,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         count_str = ut.format_char_count(count)
         limit_str = ut.format_char_count(limit)
 
-        if limit == DEEPL_USAGE_UNLIMITED:
+        if limit == deepl_b.DEEPL_USAGE_UNLIMITED:
             self.label_api_usage.setText(f"{count_str} characters / Unlimited")
         else:
             self.label_api_usage.setText(f"{percentage:.2f}%  {count_str} / {limit_str} characters")
@@ -1038,11 +1215,42 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
             self.label_stats.setText("")
             return
 
-        time_total = ceil(self.config.avg_time_per_mille * char_total / 1000)
+        time_total = self.estimate_translation_time()
         char_text = ut.format_char_count(char_total) + ut.f_plural(char_total, " character")
         time_text = f"Approx. {ut.f_time(time_total)}"
         self.label_stats.setText(char_text + "   " + time_text)
 
+    def estimate_translation_time(self, remaining_share: float = 1.0) -> int:
+        """
+        Estimate how long translating the files takes, using the measured throughput of the
+        backend, language pair and content type of each file. Without any measurements,
+        fall back on the average time per 1000 characters.
+
+        :param remaining_share: [Optional] The share of the characters still to translate.
+        :return: The estimate in seconds.
+        """
+        # This runs on every progress update, so each content type is only estimated once.
+        chars_by_type = {content_type: 0 for content_type in tp.ContentType}
+        for file in self.file_table.files.values():
+            content_type = (
+                tp.ContentType.HTML if isinstance(file, st.EpubFile) else tp.ContentType.TEXT
+            )
+            chars_by_type[content_type] += file.char_count
+
+        seconds = 0.0
+        for content_type, chars in chars_by_type.items():
+            key = tp.profile_key(
+                self.config.current_backend,
+                self.config.lang_from,
+                self.config.lang_to,
+                content_type,
+            )
+            estimate = self.throughput.estimate(key, chars)
+            if estimate is None:
+                estimate = self.config.avg_time_per_mille * chars / 1000
+            seconds += estimate
+        return ceil(seconds * remaining_share)
+
     def update_translation_status(self, processed_chars: int, char_total: int) -> None:
         """
         Update the translation status label.
@@ -1051,7 +1259,7 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
             logger.info("Total character count is 0. Nothing to do.")
             return
         char_text = ut.format_char_count(processed_chars) + " / " + ut.format_char_count(char_total)
-        time_total = ceil(self.config.avg_time_per_mille * (char_total - processed_chars) / 1000)
+        time_total = self.estimate_translation_time(1 - processed_chars / char_total)
         self.label_progress.setText(
             f"Translated {char_text} {ut.f_plural(char_total, 'character')}\n"
             f"Approximately {ut.f_time(time_total)} remaining"
@@ -1234,25 +1442,3 @@ class MainWindow(Qw.QMainWindow, Ui_MainWindow):
         font = self.label_oom_message.font()
         font.setPointSize(round(font.pointSize() * 1.5))
         self.label_oom_message.setFont(font)
-
-
-def nuke_epub_cache() -> None:
-    """
-    Perform a sanity check first. The folder must exist and be named "epub".
-    """
-    epub_cache_path = ut.epub_cache_path()
-    if not epub_cache_path.is_dir():
-        logger.info("Epub cache folder does not exist. Nothing to do.")
-        return
-
-    if epub_cache_path.name != "epubs":
-        logger.error(
-            f"Epub cache folder is not named 'epubs', instead {epub_cache_path}. Aborting."
-        )
-        return
-
-    try:
-        shutil.rmtree(epub_cache_path)
-    except OSError as e:
-        logger.error("Failed to delete epub cache folder.", exc_info=e)
-        return
@@ -4,6 +4,9 @@ import deepqt.config as cfg
 import deepqt.structures as st
 from deepqt.ui_generated_files.ui_text_preview import Ui_TextPreview
 
+# Memory mapped files are too large to preview, only show their beginning.
+MAPPED_PREVIEW_BYTES = 1024**2
+
 
 class TextPreview(Qw.QDialog, Ui_TextPreview):
     """
@@ -31,19 +34,44 @@ class TextPreview(Qw.QDialog, Ui_TextPreview):
         """
         Determine how many previews to generate and show each in a tab.
         """
-        self.add_preview("Original", self.text_file.text)
+        if isinstance(self.text_file, st.MappedTextFile):
+            self.preview_mapped_text()
+            return
+
+        # Released texts are recomputed here, so only fetch the ones actually shown.
+        self.add_preview("Original", self.text_file.level_text(st.ProcessLevel.RAW))
 
         if self.text_file.process_level & st.ProcessLevel.GLOSSARY:
-            self.add_preview("Glossary", self.text_file.text_glossary)
+            self.add_preview("Glossary", self.text_file.level_text(st.ProcessLevel.GLOSSARY))
 
         if self.text_file.process_level == st.ProcessLevel.PROTECTED:
-            self.add_preview("Protected", self.text_file.text_protected)
+            self.add_preview("Protected", self.text_file.level_text(st.ProcessLevel.PROTECTED))
         elif self.text_file.process_level == st.ProcessLevel.GLOSSARY_PROTECTED:
-            self.add_preview("Glossary Protected", self.text_file.text_glossary_protected)
+            self.add_preview(
+                "Glossary Protected",
+                self.text_file.level_text(st.ProcessLevel.GLOSSARY_PROTECTED),
+            )
 
         if self.text_file.translation:
             self.add_preview("Translation", self.text_file.translation)
 
+    def preview_mapped_text(self) -> None:
+        """
+        Show the beginning of a memory mapped file, with the chunk processors applied to it.
+        """
+        text_file: st.MappedTextFile = self.text_file  # Reinterpret type.
+        excerpt = text_file.head(MAPPED_PREVIEW_BYTES)
+        self.add_preview("Original (Excerpt)", excerpt)
+
+        if text_file.chunk_processors:
+            processed = excerpt
+            for processor in text_file.chunk_processors:
+                processed = processor(processed)
+            self.add_preview("Processed (Excerpt)", processed)
+
+        if text_file.translation:
+            self.add_preview("Translation", text_file.translation)
+
     def add_preview(self, title: str, text: str) -> None:
         """
         Add a preview tab to the dialog.
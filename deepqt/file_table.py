@@ -1,4 +1,3 @@
-from enum import IntEnum
 from functools import partial
 from pathlib import Path
 from uuid import uuid4
@@ -13,41 +12,52 @@ import deepqt.config as cfg
 import deepqt.driver_epub_preview as dep
 import deepqt.driver_text_preview as dtp
 import deepqt.glossary as gls
+import deepqt.gui_utils as gu
+import deepqt.job_scheduler as js
 import deepqt.utils as ut
-import deepqt.quote_protection as qp
+import deepqt.processing_rules as pr
 import deepqt.structures as st
 import deepqt.worker_thread as wt
-from deepqt.CustomQ.CTableWidget import CTableWidget
-
-
-class Column(IntEnum):
-    ID = 0
-    FILENAME = 1
-    STATUS = 2
-    CHARS = 3
-    OUTPUT = 4
+from deepqt.CustomQ.CTableView import CTableView
+from deepqt.file_table_model import Column, FileTableModel
 
 
 # noinspection PyUnresolvedReferences
-class FileTable(CTableWidget):
+class FileTable(CTableView):
     """
     Extends the functionality with custom helpers
     """
 
     config: cfg.Config  # Reference to the MainWindow's config.
     files: dict[str, st.TextFile | st.EpubFile]
+    table_model: FileTableModel
+    scheduler: js.JobScheduler  # Runs the preprocessing, one job per file at a time.
+    glossary: st.Glossary | None  # The glossary of the last parameter update.
+    pending_epub_loads: set[str]  # Lazy epubs to load before translating.
+    failed_epub_loads: set[str]
 
     request_text_param_update = Qc.Signal()
     ready_for_translation = Qc.Signal()
     not_ready_for_translation = Qc.Signal()
     statusbar_message = Qc.Signal(str, int)
     recalculate_char_total = Qc.Signal()
+    # Whether all lazy epubs were loaded, or one of them failed to load.
+    epub_files_loaded = Qc.Signal(bool)
 
     def __init__(self, parent=None) -> None:
-        CTableWidget.__init__(self, parent)
+        CTableView.__init__(self, parent)
 
         self.files = {}
+        self.table_model = FileTableModel(self)
+        self.setModel(self.table_model)
         self.threadpool = Qc.QThreadPool.globalInstance()
+        self.scheduler = js.JobScheduler(self.threadpool, parent=self)
+        self.scheduler.job_finished.connect(self.file_process_worker_finished)
+        # Connected second, so that it sees the jobs the first slot submits.
+        self.scheduler.job_finished.connect(self.continue_epub_loads)
+        self.glossary = None
+        self.pending_epub_loads = set()
+        self.failed_epub_loads = set()
         self.finished_drop.connect(lambda: self.request_text_param_update.emit())
 
         # Make icons larger so the epub covers are more visible.
@@ -81,30 +91,26 @@ class FileTable(CTableWidget):
             ut.show_warning(None, "Failed to add file", f"Failed to add file {path}\n\n{e}")
             return
 
-        # Add the new file to the table.
+        # Add the new file to the table, with an icon next to its name.
         file = self.files[file_id]
-        self.appendRow(
-            file_id,
-            path.name,
-            "File added",
-            ut.format_char_count(file.char_count),
-            str(make_output_filename(file, self.config)),
-            select_new=True,
-        )
-        # Add icon to the filename column.
-        logger.debug(f"Adding icon to {file_id}")
         if isinstance(file, st.TextFile):
-            self.item(self.rowCount() - 1, Column.FILENAME).setIcon(
-                Qg.QIcon.fromTheme("text-x-generic")
-            )
+            icon = Qg.QIcon.fromTheme("text-x-generic")
+        elif file.cover_image is not None:
+            # The cover was extracted while scanning the epub.
+            icon = Qg.QIcon(str(file.cache_dir / file.cover_image))
         else:
-            self.item(self.rowCount() - 1, Column.FILENAME).setIcon(
-                Qg.QIcon.fromTheme("application-epub+zip")
-            )
-        # Align Char count to the right.
-        self.item(self.rowCount() - 1, Column.CHARS).setTextAlignment(
-            Qg.Qt.AlignRight | Qg.Qt.AlignVCenter
+            icon = Qg.QIcon.fromTheme("application-epub+zip")
+        row = self.table_model.append_row(
+            file_id,
+            {
+                Column.FILENAME: path.name,
+                Column.STATUS: "File added",
+                Column.CHARS: format_file_char_count(file),
+                Column.OUTPUT: str(make_output_filename(file, self.config)),
+            },
+            icon,
         )
+        self.selectRow(row)
 
     @staticmethod
     def initialize_file(path: Path) -> st.TextFile | st.EpubFile:
@@ -116,7 +122,10 @@ class FileTable(CTableWidget):
         """
         logger.debug(f"Initializing file {path}")
         if path.suffix.lower() == ".epub":
-            return st.EpubFile(path=path, cache_dir=cfg.epub_cache_path())
+            return st.EpubFile(path=path, cache_dir=ut.epub_cache_path())
+        elif path.stat().st_size >= st.MAPPED_TEXT_MIN_BYTES:
+            logger.info(f"Memory mapping large text file {path}")
+            return st.MappedTextFile(path=path)
         else:
             return st.TextFile(path=path)
 
@@ -127,13 +136,12 @@ class FileTable(CTableWidget):
         The file names need to match the output directory preference and target language.
         Don't update locked files.
         """
-        for row in range(self.rowCount()):
-            file_id = self.item(row, Column.ID).text()
+        for file_id in self.table_model.file_ids():
             file = self.files[file_id]
             if file.locked:
                 continue
             new_output_filename = make_output_filename(file, self.config)
-            self.item(row, Column.OUTPUT).setText(str(new_output_filename))
+            self.update_table_cell(file_id, Column.OUTPUT, str(new_output_filename))
 
         logger.debug("All output filenames updated.")
 
@@ -149,62 +157,120 @@ class FileTable(CTableWidget):
         Also apply the glossary to epub files.
         """
         # Abort if no text files.
-        if self.rowCount() == 0:
-            return
-
-        # Try again in 0.5 seconds if the threadpool is busy.
-        if self.threadpool.activeThreadCount() > 0:
-            self.statusbar_message.emit("Waiting for previous threads to finish...", 1000)
-            Qc.QTimer.singleShot(500, partial(self.update_all_text_params, glossary))
+        if not self.files:
             return
 
+        self.glossary = glossary
         self.statusbar_message.emit("Processing...", 5000)
 
         # Show a progress message for all files.
-        for row in range(self.rowCount()):
+        for file_id, file in self.files.items():
             # If the file is locked, skip it.
-            if not self.files[self.item(row, Column.ID).text()].locked:
-                self.item(row, Column.STATUS).setText("Processing...")
+            if not file.locked:
+                self.show_file_progress(file_id, "Processing...")
 
         logger.debug("Updating all text params")
-        for row in range(self.rowCount()):
-            self.update_file_params(row, glossary)
+        for file_id in self.table_model.file_ids():
+            self.update_file_params(file_id, glossary)
 
-    def update_file_params(self, row: int, glossary: st.Glossary) -> None:
+    def update_file_params(self, file_id: str, glossary: st.Glossary) -> None:
         """
-        Update the text file parameters for the given row.
+        Update the text file parameters for the given file.
         This means processing the glossary and quote protection, if so configured.
+        The processing is handed to the scheduler, which supersedes any job still pending for the
+        file, unless it would do the same work anyway.
 
-        :param row: The row in the table to update.
+        :param file_id: The ID of the file to update.
         :param glossary: The glossary to apply.
         """
-        logger.debug(f"Updating text parameters for {row}")
-        file_id = self.item(row, Column.ID).text()
+        logger.debug(f"Updating text parameters for {file_id}")
         file = self.files[file_id]
         file_is_epub = isinstance(file, st.EpubFile)
         file_needs_preprocessing = file_is_epub and not file.initialized
 
+        # Leave lazily loaded epubs alone until their contents are actually needed.
+        if (
+            file_needs_preprocessing
+            and self.config.epub_lazy_loading
+            and not (self.config.use_glossary and glossary.is_valid())
+        ):
+            # A running job is re-evaluated when it stops.
+            if self.scheduler.cancel(file_id):
+                return
+            self.show_file_progress(file_id, "Ready")
+            if self.all_files_ready():
+                self.ready_for_translation.emit()
+            return
+
         # If not processing, check if the label should be updated to say that changes were reverted.
         if (
             not file_needs_preprocessing
             and not (self.config.use_glossary and glossary.is_valid())
             and (not self.config.use_quote_protection or file_is_epub)
         ):
+            if self.scheduler.cancel(file_id):
+                return
             if file.process_level != st.ProcessLevel.RAW:
                 file.process_level = st.ProcessLevel.RAW
-                self.item(row, Column.STATUS).setText("Reset to original")
+                self.show_file_progress(file_id, "Reset to original")
                 self.recalculate_char_count(file_id)
                 return
 
-        if self.config.use_glossary and glossary.is_valid() and glossary.hash != file.glossary_hash:
+        # Mapped files only apply the glossary lazily, so it must always be handed over.
+        if (
+            self.config.use_glossary
+            and glossary.is_valid()
+            and (glossary.hash != file.glossary_hash or isinstance(file, st.MappedTextFile))
+        ):
             glossary_to_pass = glossary
         else:
             glossary_to_pass = None
 
-        # Test and set lock.
-        if file.locked:
-            logger.warning(f"File {file.path} is locked, access denied.")
-            return
+        rule_set = None
+        if self.config.use_quote_protection and not file_is_epub:
+            try:
+                rule_set = pr.load_rule_set(
+                    Path(self.config.processing_rules_path)
+                    if self.config.processing_rules_path
+                    else None
+                )
+            except pr.RuleError as e:
+                logger.error(f"Failed to load the processing rules: {e}")
+                self.show_file_progress(file_id, "Invalid processing rules")
+                return
+
+        apply_glossary = self.config.use_glossary and glossary.is_valid()
+        signature = (
+            glossary_to_pass.hash if glossary_to_pass is not None else None,
+            apply_glossary,
+            rule_set.content_hash if rule_set is not None else None,
+            tuple(self.config.epub_options().items()) if file_is_epub else None,
+        )
+        self.scheduler.submit(
+            file_id,
+            signature,
+            partial(self.make_file_worker, file_id, glossary_to_pass, apply_glossary, rule_set),
+        )
+
+    def make_file_worker(
+        self,
+        file_id: str,
+        glossary: st.Glossary | None,
+        apply_glossary: bool,
+        rule_set: pr.RuleSet | None,
+    ) -> wt.Worker:
+        """
+        Create the worker to process a file, locking the file until it finishes.
+        Called by the scheduler once it starts the job, which aborts it if it is superseded.
+
+        :param file_id: The ID of the file to process.
+        :param glossary: The glossary to apply. None if no glossary is to be applied.
+        :param apply_glossary: True if the glossary is to be applied.
+        :param rule_set: The preprocessing rules to apply. None if no rules are to be applied.
+        :return: The worker.
+        """
+        file = self.files[file_id]
+        file_is_epub = isinstance(file, st.EpubFile)
         file.locked = True
 
         # Crunch time begins for the worker. Bless his soul.
@@ -213,37 +279,39 @@ class FileTable(CTableWidget):
             # Start the text file worker.
             worker = wt.Worker(
                 self.text_process_work,
+                abortable=True,
                 file_id=file_id,
                 text_file=file,
-                glossary=glossary_to_pass,
-                apply_glossary=self.config.use_glossary and glossary.is_valid(),
-                apply_protection=self.config.use_quote_protection,
+                glossary=glossary,
+                apply_glossary=apply_glossary,
+                rule_set=rule_set,
             )
             logger.debug(
                 f"Worker Thread processing text file {file.path}: "
-                f"Glossary: {glossary_to_pass is not None} | Protection: {self.config.use_quote_protection}"
+                f"Glossary: {glossary is not None} | Protection: {rule_set is not None}"
             )
         else:
             # Start the epub file worker.
             worker = wt.Worker(
                 self.epub_process_work,
+                abortable=True,
                 file_id=file_id,
                 epub_file=file,
-                glossary=glossary_to_pass,
-                apply_glossary=self.config.use_glossary and glossary.is_valid(),
+                glossary=glossary,
+                apply_glossary=apply_glossary,
             )
             logger.debug(
                 f"Worker Thread processing epub file {file.path}: "
-                f"Glossary: {glossary_to_pass is not None}"
+                f"Glossary: {glossary is not None}"
             )
 
         worker.signals.result.connect(self.file_process_worker_result)
         worker.signals.progress.connect(self.file_process_worker_progress)
         worker.signals.error.connect(self.file_process_worker_error)
-        worker.signals.finished.connect(self.file_process_worker_finished)
-        # Execute.
+        worker.signals.aborted.connect(self.file_process_worker_aborted)
+        # The scheduler executes it.
         logger.info(f"Executing worker thread {file.path}")
-        self.threadpool.start(worker)
+        return worker
 
     """
     Workers
@@ -255,37 +323,67 @@ class FileTable(CTableWidget):
         text_file: st.TextFile,
         glossary: st.Glossary,
         apply_glossary: bool,
-        apply_protection: bool,
+        rule_set: pr.RuleSet | None,
         progress_callback: Qc.Signal,
+        abort_flag: wt.SharableFlag,
     ):
         """
         Apply the glossary to the given text file.
+        The results are only assigned once complete, so an aborted run leaves the file as it was.
 
         :param file_id: The ID of the file to process.
         :param text_file: The text file to apply the glossary to.
         :param glossary: The glossary to apply. None if no glossary is to be applied.
         :param apply_glossary: True if the glossary is to be applied.
-        :param apply_protection: Whether to apply quote protection.
+        :param rule_set: The preprocessing rules to apply. None if no rules are to be applied.
         :param progress_callback: A callback to call with the progress of the processing.
+        :param abort_flag: Set when the job was superseded, checked between steps.
         """
+        check_aborted = abort_flag.raise_if_set
+        check_aborted()
+
+        text_file.rule_set = rule_set
+        if isinstance(text_file, st.MappedTextFile):
+            # Large files are processed chunk by chunk during translation instead.
+            text_file.chunk_processors = []
+            text_file.process_level = st.ProcessLevel.RAW
+            if apply_glossary:
+                text_file.glossary_hash = glossary.hash
+                text_file.chunk_processors.append(partial(gls.process_text, glossary=glossary))
+                text_file.process_level |= st.ProcessLevel.GLOSSARY
+            if rule_set is not None:
+                text_file.chunk_processors.append(rule_set.preprocess)
+                text_file.process_level |= st.ProcessLevel.PROTECTED
+            progress_callback.emit((file_id, "Ready"))
+            return file_id
 
         if apply_glossary:
             progress_callback.emit((file_id, "Applying glossary..."))
             if (
                 glossary is not None
             ):  # In this case, the glossary was already applied and still cached.
-                text_file.text_glossary = gls.process_text(text_file.text, glossary)
+                glossary_processor = partial(gls.process_text, glossary=glossary)
+                text_glossary = glossary_processor(
+                    text_file.level_text(st.ProcessLevel.RAW), check_aborted=check_aborted
+                )
+                text_file.glossary_processor = glossary_processor
+                text_file.text_glossary = text_glossary
                 text_file.glossary_hash = glossary.hash
             # Set it either way, so that the file knows it's been processed.
             text_file.process_level = st.ProcessLevel.GLOSSARY
 
-            if apply_protection:
+            if rule_set is not None:
+                check_aborted()
                 progress_callback.emit((file_id, "Applying EQP next..."))
-                text_file.text_glossary_protected = qp.protect_text(text_file.text_glossary)
+                text_file.text_glossary_protected = rule_set.preprocess(
+                    text_file.level_text(st.ProcessLevel.GLOSSARY)
+                )
                 text_file.process_level = st.ProcessLevel.GLOSSARY_PROTECTED
-        elif apply_protection:
+        elif rule_set is not None:
             progress_callback.emit((file_id, "Applying EQP..."))
-            text_file.text_protected = qp.protect_text(text_file.text)
+            text_file.text_protected = rule_set.preprocess(
+                text_file.level_text(st.ProcessLevel.RAW)
+            )
             text_file.process_level = st.ProcessLevel.PROTECTED
 
         progress_callback.emit((file_id, "Ready"))
@@ -301,6 +399,7 @@ class FileTable(CTableWidget):
         glossary: st.Glossary,
         apply_glossary: bool,
         progress_callback: Qc.Signal,
+        abort_flag: wt.SharableFlag,
     ):
         """
         Apply the glossary to the given epub file.
@@ -310,17 +409,18 @@ class FileTable(CTableWidget):
         :param glossary: The glossary to apply. None if no glossary is to be applied.
         :param apply_glossary: True if the glossary is to be applied.
         :param progress_callback: A callback to call with the progress of the processing.
+        :param abort_flag: Set when the job was superseded, checked while extracting and processing.
         """
+        check_aborted = abort_flag.raise_if_set
 
         # Pre-process the epub file.
         progress_callback.emit((file_id, "Loading epub..."))
         epub_file.initialize_files(
-            nuke_ruby=self.config.epub_nuke_ruby,
-            nuke_kobo=self.config.epub_nuke_kobo,
-            nuke_indents=self.config.epub_nuke_indents,
-            crush_html=self.config.epub_crush,
-            make_text_horizontal=self.config.epub_make_text_horizontal,
-            ignore_empty=self.config.epub_ignore_empty_html,
+            **self.config.epub_options(),
+            progress_callback=lambda done, total: progress_callback.emit(
+                (file_id, f"{done} / {total} files prepared")
+            ),
+            check_aborted=check_aborted,
         )
 
         if apply_glossary:
@@ -328,7 +428,7 @@ class FileTable(CTableWidget):
             if (
                 glossary is not None
             ):  # In this case, the glossary was already applied and still cached.
-                gls.process_epub_file(epub_file, glossary)
+                gls.process_epub_file(epub_file, glossary, check_aborted)
             # Set it either way, so that the file knows it's been processed.
             epub_file.process_level = st.ProcessLevel.GLOSSARY
 
@@ -353,18 +453,6 @@ class FileTable(CTableWidget):
             return
 
         self.recalculate_char_count(file_id)
-        # Try to add the cover as the icon, if this was an epub.
-        file = self.files[file_id]
-        if isinstance(file, st.EpubFile) and file.cover_image is not None:
-            absolute_path = file.cache_dir / file.cover_image
-            try:
-                row = self.findItems(file_id, Qc.Qt.MatchExactly)[0].row()
-                self.item(row, Column.FILENAME).setIcon(Qg.QIcon(str(absolute_path)))
-                logger.info(f"Set cover image for {file_id} to {absolute_path}")
-                file.cover_image = None  # Clear the cover image so it's not loaded again.
-            except OSError as e:
-                logger.error(f"Could not load cover image {absolute_path}")
-                logger.exception(e)
 
     def file_process_worker_progress(self, progress: tuple[str, str]) -> None:
         """
@@ -387,15 +475,28 @@ class FileTable(CTableWidget):
         # Extract the row from the WorkerError's kwargs.
         file_id = error.kwargs["file_id"]
         file = self.files[file_id]
+        if file_id in self.pending_epub_loads:
+            # Don't try again, it would only fail again.
+            self.failed_epub_loads.add(file_id)
         logger.error(f"Failed to process {file.path.name}\n{error}")
         self.update_table_cell(file_id, Column.STATUS, "Failed to process.")
 
-    def file_process_worker_finished(self, initial_args: tuple[list, dict]) -> None:
+    def file_process_worker_aborted(self, initial_args: tuple[list, dict]) -> None:
         """
-        Unlock the file after processing is finished.
+        Log that a superseded job stopped early. The scheduler takes it from here.
         """
         args, kwargs = initial_args
-        file_id = kwargs["file_id"]
+        logger.info(f"Processing of {kwargs['file_id']} aborted.")
+
+    def file_process_worker_finished(self, file_id: str, superseded: bool) -> None:
+        """
+        Unlock the file after processing is finished.
+        A superseded job may have left the file in an outdated state, so unless another job
+        already took its place, the file is brought up to date with the current parameters.
+
+        :param file_id: The ID of the file.
+        :param superseded: True if the job was superseded while it was running.
+        """
         try:
             text_file = self.files[file_id]
         except KeyError:
@@ -407,6 +508,9 @@ class FileTable(CTableWidget):
 
         text_file.locked = False
         logger.debug(f"Worker thread {text_file.path} finished.")
+        if superseded and not self.scheduler.is_busy(file_id) and self.glossary is not None:
+            self.update_file_params(file_id, self.glossary)
+            return
         if self.all_files_ready():
             self.ready_for_translation.emit()
 
@@ -416,9 +520,10 @@ class FileTable(CTableWidget):
 
     def update_table_cell(self, file_id: str, column: int, message: str) -> None:
         """
-        Show the translation progress in the table.
+        Change a cell of the file's row.
+        Only the stored text changes right away, the table is repainted with the next batch of changes.
         """
-        self.item(self.findItems(file_id, Qc.Qt.MatchExactly)[0].row(), column).setText(message)
+        self.table_model.set_text(file_id, column, message)
 
     def show_file_progress(self, file_id: str, message: str) -> None:
         """
@@ -428,7 +533,7 @@ class FileTable(CTableWidget):
 
     def all_files_ready(self) -> bool:
         """
-        Check if all files' process level matches the expected value and are not locked.
+        Check if all files' process level matches the expected value and none are being processed.
         If no files exist, return False.
         Note: Epub files don't use quote protection, so ignore that option.
 
@@ -442,26 +547,18 @@ class FileTable(CTableWidget):
         if self.config.use_quote_protection:
             expected_process_level_text |= st.ProcessLevel.PROTECTED
 
-        if self.rowCount() == 0:
+        if not self.files or self.scheduler.has_jobs():
             return False
 
-        for row in range(self.rowCount()):
-            file = self.files[self.item(row, Column.ID).text()]
-
+        for file in self.files.values():
             if file.locked:
                 return False
 
             if isinstance(file, st.TextFile):
-                if (
-                    self.files[self.item(row, Column.ID).text()].process_level
-                    != expected_process_level_text
-                ):
+                if file.process_level != expected_process_level_text:
                     return False
             else:
-                if (
-                    self.files[self.item(row, Column.ID).text()].process_level
-                    != expected_process_level_epub
-                ):
+                if file.process_level != expected_process_level_epub:
                     return False
         return True
 
@@ -481,25 +578,25 @@ class FileTable(CTableWidget):
         """
         Open the preview window for the selected file.
         """
-        selected_row = self.selectedItems()[0].row()
-        file_id = self.item(selected_row, Column.ID).text()
+        file_id = self.table_model.file_id(self.selectedRows()[0])
         file = self.files[file_id]
         if isinstance(file, st.TextFile):
             dtp.TextPreview(self, file, self.config).exec()
         else:
+            self.load_epub_file(file_id)
             dep.EpubPreview(self, file, self.config).exec()
 
     def remove_selected_file(self) -> None:
         """
         Remove the selected file from the table.
         """
-        selected_row = self.selectedItems()[0].row()
-        file_id = self.item(selected_row, Column.ID).text()
-        self.removeRow(selected_row)
-        # This isn't automatically emitted when removing a row, but is necessary to update the buttons.
-        self.itemSelectionChanged.emit()
+        file_id = self.table_model.file_id(self.selectedRows()[0])
+        self.table_model.remove_row(file_id)
+        self.scheduler.cancel(file_id)
 
-        del self.files[file_id]
+        file = self.files.pop(file_id)
+        if isinstance(file, st.MappedTextFile):
+            file.close()
         if self.all_files_ready():
             self.ready_for_translation.emit()
         else:
@@ -510,7 +607,12 @@ class FileTable(CTableWidget):
         """
         Remove all files from the table.
         """
-        self.clearAll()
+        self.table_model.clear()
+        for file_id in self.files:
+            self.scheduler.cancel(file_id)
+        for file in self.files.values():
+            if isinstance(file, st.MappedTextFile):
+                file.close()
         self.files.clear()
         self.not_ready_for_translation.emit()
         self.recalculate_char_total.emit()
@@ -524,9 +626,83 @@ class FileTable(CTableWidget):
         file = self.files[file_id]
         char_count = file.char_count
         logger.debug(f"Recalculating char count for {file.path.name} ({char_count} chars).")
-        self.update_table_cell(file_id, Column.CHARS, ut.format_char_count(char_count))
+        self.update_table_cell(file_id, Column.CHARS, format_file_char_count(file))
         self.recalculate_char_total.emit()
 
+    def load_epub_file(self, file_id: str) -> None:
+        """
+        Fully load an epub file that was only scanned so far.
+        This blocks the gui thread, so it is only done when the contents are needed right away.
+        Locked files are being loaded by a worker already, so they are left alone.
+
+        :param file_id: The ID of the file to load.
+        """
+        file = self.files[file_id]
+        if not isinstance(file, st.EpubFile) or file.initialized or file.locked:
+            return
+
+        logger.info(f"Loading lazy epub file {file.path.name}")
+        self.show_file_progress(file_id, "Loading epub...")
+        Qc.QCoreApplication.processEvents()
+        with gu.wait_cursor():
+            file.initialize_files(**self.config.epub_options())
+        self.show_file_progress(file_id, "Ready")
+        self.recalculate_char_count(file_id)
+
+    def load_all_epub_files(self) -> bool:
+        """
+        Fully load all epub files that were only scanned so far, in the background.
+        Once they are all loaded, epub_files_loaded is emitted.
+
+        :return: True if there are epubs to load, False if there is nothing to wait for.
+        """
+        self.pending_epub_loads = {
+            file_id
+            for file_id, file in self.files.items()
+            if isinstance(file, st.EpubFile) and not file.initialized
+        }
+        if not self.pending_epub_loads:
+            return False
+        self.failed_epub_loads = set()
+        self.not_ready_for_translation.emit()
+        self.continue_epub_loads()
+        return True
+
+    def continue_epub_loads(self, *_) -> None:
+        """
+        Schedule loading the pending epubs that have no job yet.
+        An epub that is being processed already is loaded by that job, unless it is superseded,
+        in which case it is checked again once the job finished.
+        """
+        if not self.pending_epub_loads:
+            return
+        for file_id in list(self.pending_epub_loads):
+            file = self.files.get(file_id)
+            if file is None or file.initialized or file_id in self.failed_epub_loads:
+                self.pending_epub_loads.discard(file_id)
+            elif not self.scheduler.is_busy(file_id):
+                self.show_file_progress(file_id, "Loading epub...")
+                # The same job the preprocessing submits without a glossary, so it isn't superseded.
+                signature = (None, False, None, tuple(self.config.epub_options().items()))
+                self.scheduler.submit(
+                    file_id, signature, partial(self.make_file_worker, file_id, None, False, None)
+                )
+        if not self.pending_epub_loads:
+            self.epub_files_loaded.emit(not self.failed_epub_loads)
+
+
+def format_file_char_count(file: st.InputFile) -> str:
+    """
+    Format the char count of a file for the table.
+    Epub files that haven't been loaded yet only have an estimate, marked with a tilde.
+
+    :param file: The file to format the char count of.
+    :return: The formatted char count.
+    """
+    if isinstance(file, st.EpubFile) and not file.initialized:
+        return "~" + ut.format_char_count(file.char_count)
+    return ut.format_char_count(file.char_count)
+
 
 def make_output_filename(input_file: st.InputFile, config: cfg.Config) -> Path:
     # Append the language code to the file stem.
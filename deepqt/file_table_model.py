@@ -0,0 +1,206 @@
+"""
+The model behind the file table.
+
+Rows are looked up by file id through an index, so updating a file's cells doesn't scan the table.
+Cell updates only change the stored values right away, the views are notified in batches:
+all rows changed since the last notification are covered by a single dataChanged signal,
+so a flood of progress messages doesn't make the views repaint for every single one.
+"""
+
+from enum import IntEnum
+
+import PySide6.QtCore as Qc
+import PySide6.QtGui as Qg
+from attrs import define, Factory
+
+# The views are notified of changed cells at most this often.
+DATA_CHANGED_INTERVAL_MS = 100
+
+
+class Column(IntEnum):
+    ID = 0
+    FILENAME = 1
+    STATUS = 2
+    CHARS = 3
+    OUTPUT = 4
+
+
+COLUMN_HEADERS = {
+    Column.ID: "ID",
+    Column.FILENAME: "File Name",
+    Column.STATUS: "Status",
+    Column.CHARS: "Characters",
+    Column.OUTPUT: "Output Path",
+}
+
+
+@define
+class FileRow:
+    file_id: str
+    texts: list[str] = Factory(lambda: [""] * len(Column))
+    icon: Qg.QIcon | None = None
+
+
+class FileTableModel(Qc.QAbstractTableModel):
+    rows: list[FileRow]
+    row_index: dict[str, int]  # Maps the file id to its row.
+    # The range of rows and columns with changes the views weren't notified of yet.
+    dirty_rows: tuple[int, int] | None
+    dirty_columns: tuple[int, int] | None
+    change_timer: Qc.QTimer
+
+    def __init__(self, parent=None) -> None:
+        Qc.QAbstractTableModel.__init__(self, parent)
+        self.rows = []
+        self.row_index = {}
+        self.dirty_rows = None
+        self.dirty_columns = None
+
+        self.change_timer = Qc.QTimer(self)
+        self.change_timer.setSingleShot(True)
+        self.change_timer.setInterval(DATA_CHANGED_INTERVAL_MS)
+        self.change_timer.timeout.connect(self.flush_changes)
+
+    """
+    Qt model interface
+    """
+
+    def rowCount(self, parent: Qc.QModelIndex = Qc.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent: Qc.QModelIndex = Qc.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(Column)
+
+    def data(self, index: Qc.QModelIndex, role: int = Qc.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+        if role == Qc.Qt.DisplayRole:
+            return row.texts[column]
+        if role == Qc.Qt.DecorationRole and column == Column.FILENAME:
+            return row.icon
+        if role == Qc.Qt.TextAlignmentRole and column == Column.CHARS:
+            return int(Qc.Qt.AlignRight | Qc.Qt.AlignVCenter)
+        return None
+
+    def headerData(
+        self, section: int, orientation: Qc.Qt.Orientation, role: int = Qc.Qt.DisplayRole
+    ):
+        if role != Qc.Qt.DisplayRole:
+            return None
+        if orientation == Qc.Qt.Horizontal:
+            return COLUMN_HEADERS.get(section)
+        return str(section + 1)
+
+    """
+    Helpers
+    """
+
+    def append_row(
+        self, file_id: str, texts: dict[Column, str], icon: Qg.QIcon | None = None
+    ) -> int:
+        """
+        Add a row for a file to the bottom of the table.
+
+        :param file_id: The ID of the file.
+        :param texts: The text of each column, the ID column is filled in automatically.
+        :param icon: [Optional] The icon shown next to the file name.
+        :return: The new row.
+        """
+        self.flush_changes()
+        row = FileRow(file_id, icon=icon)
+        row.texts[Column.ID] = file_id
+        for column, text in texts.items():
+            row.texts[column] = text
+
+        position = len(self.rows)
+        self.beginInsertRows(Qc.QModelIndex(), position, position)
+        self.rows.append(row)
+        self.row_index[file_id] = position
+        self.endInsertRows()
+        return position
+
+    def remove_row(self, file_id: str) -> None:
+        """
+        Remove the row of a file.
+
+        :param file_id: The ID of the file.
+        """
+        self.flush_changes()
+        position = self.row_index.pop(file_id)
+        self.beginRemoveRows(Qc.QModelIndex(), position, position)
+        del self.rows[position]
+        # Only the rows below shift up.
+        for index in range(position, len(self.rows)):
+            self.row_index[self.rows[index].file_id] = index
+        self.endRemoveRows()
+
+    def clear(self) -> None:
+        self.change_timer.stop()
+        self.dirty_rows = self.dirty_columns = None
+        self.beginResetModel()
+        self.rows.clear()
+        self.row_index.clear()
+        self.endResetModel()
+
+    def file_id(self, row: int) -> str:
+        return self.rows[row].file_id
+
+    def file_ids(self) -> list[str]:
+        """
+        Get the file ids in table order.
+        """
+        return [row.file_id for row in self.rows]
+
+    def row_of(self, file_id: str) -> int | None:
+        return self.row_index.get(file_id)
+
+    def text(self, file_id: str, column: Column) -> str:
+        return self.rows[self.row_index[file_id]].texts[column]
+
+    def set_text(self, file_id: str, column: Column, text: str) -> None:
+        """
+        Change the text of a cell. The views are notified with the next batch of changes.
+        Unknown files are ignored, they may have been removed while a worker was busy with them.
+
+        :param file_id: The ID of the file.
+        :param column: The column to change.
+        :param text: The new text.
+        """
+        position = self.row_index.get(file_id)
+        if position is None:
+            return
+        texts = self.rows[position].texts
+        if texts[column] == text:
+            return
+        texts[column] = text
+        self.mark_dirty(position, column)
+
+    def mark_dirty(self, row: int, column: int) -> None:
+        """
+        Include a cell in the next batch of changes, scheduling it if needed.
+        """
+        if self.dirty_rows is None:
+            self.dirty_rows = (row, row)
+            self.dirty_columns = (column, column)
+        else:
+            self.dirty_rows = (min(self.dirty_rows[0], row), max(self.dirty_rows[1], row))
+            self.dirty_columns = (
+                min(self.dirty_columns[0], column),
+                max(self.dirty_columns[1], column),
+            )
+        if not self.change_timer.isActive():
+            self.change_timer.start()
+
+    def flush_changes(self) -> None:
+        """
+        Notify the views of all changes since the last batch, with a single signal.
+        """
+        self.change_timer.stop()
+        if self.dirty_rows is None:
+            return
+        top_left = self.index(self.dirty_rows[0], self.dirty_columns[0])
+        bottom_right = self.index(self.dirty_rows[1], self.dirty_columns[1])
+        self.dirty_rows = self.dirty_columns = None
+        self.dataChanged.emit(top_left, bottom_right)
@@ -1,16 +1,19 @@
 import re
 from pathlib import Path
-from typing import Any
-
-import pyexcel
-import pyexcel_io
-import pyexcel_odsr
-import pyexcel_xls
-import pyexcel_xlsx
-import pyexcel_htmlr
+from typing import Any, Callable
+
 from loguru import logger
 
 import deepqt.structures as st
+import deepqt.tracing as trc
+import deepqt.utils as ut
+
+# Pyexcel and its plugins take a while to import, and are only needed once a glossary is loaded.
+pyexcel = ut.LazyModule("pyexcel")
+
+
+# Lines between two cancellation checkpoints when applying a glossary.
+CHECKPOINT_INTERVAL = 256
 
 
 class UnsupportedFileType(Exception):
@@ -25,6 +28,13 @@ def make_imports_used_so_they_dont_get_auto_removed() -> None:
     # Never call this function.
     # It purely serves to distract the linter from removing the imports,
     # so that they get included in pyinstaller builds.
+    # They are imported here, since pyexcel finds its plugins by itself at runtime.
+    import pyexcel_io
+    import pyexcel_odsr
+    import pyexcel_xls
+    import pyexcel_xlsx
+    import pyexcel_htmlr
+
     pyexcel_io.io.get_data()
     pyexcel_odsr.get_data()
     pyexcel_xls.get_data()
@@ -32,39 +42,48 @@ def make_imports_used_so_they_dont_get_auto_removed() -> None:
     pyexcel_htmlr.get_data()
 
 
-def process_text(text: str, glossary: st.Glossary) -> str:
+@trc.traced("glossary", "preprocessing")
+def process_text(
+    text: str, glossary: st.Glossary, check_aborted: Callable[[], None] | None = None
+) -> str:
     """
     Process a text string with the glossary.
 
     :param text: The text to process.
     :param glossary: The glossary to use.
+    :param check_aborted: [Optional] Called regularly, raises an exception to stop processing.
     :return: The processed text.
     """
     lines_in = text.splitlines()
     lines_out = ["\n"] * len(lines_in)
 
-    process_lines(lines_in, lines_out, glossary)
+    process_lines(lines_in, lines_out, glossary, check_aborted=check_aborted)
 
     return "\n".join(lines_out)
 
 
-def process_epub_file(epub: st.EpubFile, glossary: st.Glossary) -> None:
+def process_epub_file(
+    epub: st.EpubFile, glossary: st.Glossary, check_aborted: Callable[[], None] | None = None
+) -> None:
     """
     Process an epub file with the glossary.
+    If aborted, the epub keeps its previous glossary hash, so it is processed again next time.
 
     :param epub: The epub file to process.
     :param glossary: The glossary to use.
+    :param check_aborted: [Optional] Called regularly, raises an exception to stop processing.
     """
 
     # Process the html files.
     for html_file in epub.html_files:
-        html_file.text_glossary = process_text(html_file.text, glossary)
+        html_file.text_glossary = process_text(html_file.text, glossary, check_aborted)
 
     # Process toc.
     glossary_snippets = [
-        process_text(snippet, glossary) for snippet in epub.toc_file.get_texts(epub.toc_file.text)
+        process_text(snippet, glossary, check_aborted) for snippet in epub.toc_file.texts
     ]
-    epub.toc_file.text_glossary = epub.toc_file.set_texts(epub.toc_file.text, glossary_snippets)
+    epub.toc_file.texts_glossary = glossary_snippets
+    epub.toc_file.text_glossary = epub.toc_file.set_texts(glossary_snippets)
     epub.toc_file.process_level = st.ProcessLevel.GLOSSARY
 
     epub.glossary_hash = glossary.hash
@@ -203,6 +222,7 @@ def process_lines(
     glossary: st.Glossary,
     start_index: int = 0,
     count: int = -1,
+    check_aborted: Callable[[], None] | None = None,
 ):
     """
     Perform substitutions on a list of lines, given a start index and count.
@@ -213,11 +233,14 @@ def process_lines(
     :param start_index: The index to start at.
     :param count: The number of lines to process.
     :param glossary: The glossary to use for substitutions.
+    :param check_aborted: [Optional] Called every few lines, raises an exception to stop processing.
     """
     if count == -1:
         count = len(lines_in) - start_index
 
     for i in range(start_index, start_index + count):
+        if check_aborted is not None and (i - start_index) % CHECKPOINT_INTERVAL == 0:
+            check_aborted()
         line = lines_in[i]
 
         if line == "\n":
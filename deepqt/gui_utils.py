@@ -1,4 +1,5 @@
 import sys
+from contextlib import contextmanager
 from importlib import resources
 from pathlib import Path
 from types import TracebackType
@@ -10,13 +11,22 @@ import PySide6.QtWidgets as Qw
 from loguru import logger
 
 import deepqt.worker_thread as wt
-from deepqt.data import color_themes, custom_icons
+from deepqt import data
+from deepqt.data import color_themes, custom_icons, theme_icons
 from deepqt.error_dialog_driver import ErrorDialog
 
 
 # For all show functions, pad the dialog message, so that the dialog is not too narrow for the window title.
 MIN_MSG_LENGTH = 50
 
+# The compiled bundle of icons and color themes, see icons/build_resource_bundle.py.
+RESOURCE_BUNDLE = "resources.rcc"
+resource_bundle_loaded = False
+
+# Icons by name and theme, and palettes by theme, so they are only ever loaded once.
+icon_cache: dict[tuple[str, str], Qg.QIcon] = {}
+palette_cache: dict[str, Qg.QPalette] = {}
+
 
 class SelectableMessageBox(Qw.QMessageBox):
     """
@@ -115,12 +125,18 @@ def show_info(parent, title: str, msg: str, **kwargs) -> None:
 
 
 def show_question(
-    parent, title: str, msg: str, buttons=Qw.QMessageBox.Yes | Qw.QMessageBox.Cancel
+    parent,
+    title: str,
+    msg: str,
+    buttons=Qw.QMessageBox.Yes | Qw.QMessageBox.Cancel,
+    detailed_text: str = "",
 ) -> int:
     msg = msg.ljust(MIN_MSG_LENGTH)
     dlg = Qw.QMessageBox(parent)
     dlg.setWindowTitle(title)
     dlg.setText(msg)
+    if detailed_text:
+        dlg.setDetailedText(detailed_text)
     dlg.setStandardButtons(buttons)
     dlg.setIcon(Qw.QMessageBox.Question)
     return dlg.exec()
@@ -138,6 +154,18 @@ def open_file(path: Path) -> None:
         show_exception(None, "File Error", "Failed to open file.")
 
 
+@contextmanager
+def wait_cursor() -> None:
+    """
+    Show the busy cursor while blocking work is done in the gui thread.
+    """
+    Qw.QApplication.setOverrideCursor(Qc.Qt.WaitCursor)
+    try:
+        yield
+    finally:
+        Qw.QApplication.restoreOverrideCursor()
+
+
 # Mapping between KDE color keys and QPalette roles
 section_role_mapping = {
     "Colors:Button": {
@@ -198,18 +226,73 @@ def apply_color_effect(
     return Qg.QColor(r, g, b)
 
 
+def load_resource_bundle() -> bool:
+    """
+    Register the compiled bundle of icons and color themes, making them available under :/ paths.
+    Qt maps the bundle into memory, so looking them up no longer touches the filesystem.
+    Without the bundle, such as when running from source without building it first,
+    the files are loaded from the package data instead.
+
+    :return: True if the bundle is registered.
+    """
+    global resource_bundle_loaded
+    if resource_bundle_loaded:
+        return True
+
+    with resources.files(data) as data_path:
+        bundle_path = data_path / RESOURCE_BUNDLE
+
+    if bundle_path.is_file() and Qc.QResource.registerResource(str(bundle_path)):
+        logger.debug(f"Registered resource bundle {bundle_path}")
+        resource_bundle_loaded = True
+    else:
+        logger.warning(f"Resource bundle {bundle_path} unavailable, loading icons from files.")
+    return resource_bundle_loaded
+
+
+def init_icon_search_paths() -> None:
+    """
+    Make the bundled icon themes available, from the resource bundle if possible.
+    Qt searches :/icons for icon themes by default, so only the fallback to files needs a path.
+    """
+    if load_resource_bundle():
+        Qg.QIcon.setFallbackSearchPaths([":/icons"])
+        return
+
+    with resources.files(theme_icons) as data_path:
+        theme_icon_dir = str(data_path)
+    Qg.QIcon.setThemeSearchPaths(Qg.QIcon.themeSearchPaths() + [theme_icon_dir])
+    Qg.QIcon.setFallbackSearchPaths([":/icons", theme_icon_dir])
+
+
+def bundled_data_dir(prefix: str, package) -> str:
+    """
+    Get the directory to load bundled data from.
+
+    :param prefix: The data's prefix in the resource bundle.
+    :param package: The data's package, used if the bundle isn't loaded.
+    :return: The resource path if the bundle is loaded, otherwise the package's path.
+    """
+    if resource_bundle_loaded:
+        return f":/{prefix}"
+    with resources.files(package) as data_path:
+        return Path(data_path).as_posix()
+
+
 def load_color_palette(theme: str) -> Qg.QPalette:
     """
     Provide a theme name and get a QPalette object.
     The name should match one of the files in the themes folder.
+    Each theme is only parsed once, switching back to it reuses the palette.
 
     :param theme: The name of the theme.
     :return: A QPalette object.
     """
-    palette = Qg.QPalette()
+    if theme in palette_cache:
+        return Qg.QPalette(palette_cache[theme])
 
-    with resources.files(color_themes) as data_path:
-        file_path = data_path / theme
+    palette = Qg.QPalette()
+    file_path = f"{bundled_data_dir('color_themes', color_themes)}/{theme}"
 
     file = Qc.QFile(file_path)
     if file.open(Qc.QFile.ReadOnly | Qc.QFile.Text):
@@ -294,10 +377,11 @@ def load_color_palette(theme: str) -> Qg.QPalette:
     if not palette.color(Qg.QPalette.Shadow).isValid():
         palette.setColor(Qg.QPalette.Shadow, Qg.QColor(0, 0, 0))
 
+    palette_cache[theme] = Qg.QPalette(palette)
     return palette
 
 
-def custom_icon_path(icon_name: str, theme: Literal["dark", "light"] | str = "") -> Path:
+def custom_icon_path(icon_name: str, theme: Literal["dark", "light"] | str = "") -> str:
     """
     Loads the given icon from the dark, light, or color-agnostic set of custom icons.
     File names may omit the extension, in which case .svg and .png are checked.
@@ -305,20 +389,19 @@ def custom_icon_path(icon_name: str, theme: Literal["dark", "light"] | str = "")
     :param icon_name: The icon's filename, with or without extension.
     :param theme: Indicate if the icon should be pulled from the light or dark theme,
         if applicable, otherwise leave blank.
-    :return: A full path to the file.
+    :return: The resource path of the file, or its full path if the resource bundle isn't loaded.
     """
-    with resources.files(custom_icons) as data_path:
-        custom_icon_dir: Path = data_path
+    custom_icon_dir = bundled_data_dir("custom_icons", custom_icons)
 
     if theme:
-        custom_icon_dir = custom_icon_dir / theme
+        custom_icon_dir = f"{custom_icon_dir}/{theme}"
 
     for extension in ("", ".svg", ".png"):
-        icon_path = custom_icon_dir / (icon_name + extension)
-        if icon_path.is_file():
+        icon_path = f"{custom_icon_dir}/{icon_name}{extension}"
+        if Qc.QFileInfo(icon_path).isFile():
             return icon_path
 
-    raise FileNotFoundError(f"Failed to load '{custom_icon_dir / icon_name}'")
+    raise FileNotFoundError(f"Failed to load '{custom_icon_dir}/{icon_name}'")
 
 
 def load_custom_icon(icon_name: str, theme: Literal["dark", "light"] | str = "") -> Qg.QIcon:
@@ -326,15 +409,18 @@ def load_custom_icon(icon_name: str, theme: Literal["dark", "light"] | str = "")
     Loads the given icon from the dark, light, or color-agnostic set of custom icons.
     File names may omit the extension, in which case .svg and .png are checked.
     If the file could not be found, a QIcon with a null pixmap is returned.
+    Icons are cached, so each is only looked up once per theme.
 
     :param icon_name: The icon's filename, with or without extension.
     :param theme: Indicate if the icon should be pulled from the light or dark theme,
         if applicable, otherwise leave blank.
     :return: A QIcon that may have a null pixmap.
     """
-    try:
-        icon_path = custom_icon_path(icon_name, theme)
-        return Qg.QIcon(str(icon_path))
-    except FileNotFoundError as e:
-        logger.error(e)
-        return Qg.QIcon()
+    key = (icon_name, theme)
+    if key not in icon_cache:
+        try:
+            icon_cache[key] = Qg.QIcon(custom_icon_path(icon_name, theme))
+        except FileNotFoundError as e:
+            logger.error(e)
+            icon_cache[key] = Qg.QIcon()
+    return icon_cache[key]
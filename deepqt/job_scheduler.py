@@ -0,0 +1,150 @@
+"""
+Schedules background jobs per key, such as the preprocessing of each input file.
+
+- At most one job runs per key, so two jobs never work on the same file at once.
+- Submitting a job identical to the one already running or waiting for its key does nothing.
+- Submitting a different job supersedes the older ones: a waiting job is dropped outright,
+  and a running job is asked to abort, with the new job starting as soon as it has stopped.
+- Jobs of different keys run as soon as one of the scheduler's slots is free,
+  regardless of any unrelated work on the thread pool.
+"""
+
+from typing import Callable, Hashable
+
+import PySide6.QtCore as Qc
+from attrs import define
+from loguru import logger
+
+import deepqt.worker_thread as wt
+
+
+@define
+class Job:
+    key: str
+    # Identifies what the job does, jobs with equal signatures are interchangeable.
+    signature: Hashable
+    # Creates the worker when the job starts, so that it works with the state at that time.
+    make_worker: Callable[[], wt.Worker]
+    # Kept while running, otherwise the worker and its signals could be collected early.
+    worker: wt.Worker | None = None
+    superseded: bool = False
+
+
+class JobScheduler(Qc.QObject):
+    """
+    Runs the jobs on a thread pool, at most one per key.
+    """
+
+    # The key and whether the job was superseded before it finished.
+    job_finished = Qc.Signal(str, bool)
+
+    threadpool: Qc.QThreadPool
+    max_running: int
+    running: dict[str, Job]
+    waiting: dict[str, Job]  # In submission order.
+
+    def __init__(
+        self, threadpool: Qc.QThreadPool, max_running: int | None = None, parent=None
+    ) -> None:
+        """
+        :param threadpool: The pool to run the workers on.
+        :param max_running: [Optional] The number of jobs to run at once.
+            Defaults to the pool's thread count.
+        :param parent: [Optional] The parent QObject.
+        """
+        Qc.QObject.__init__(self, parent)
+        self.threadpool = threadpool
+        self.max_running = max(1, max_running or threadpool.maxThreadCount())
+        self.running = {}
+        self.waiting = {}
+
+    def submit(self, key: str, signature: Hashable, make_worker: Callable[[], wt.Worker]) -> bool:
+        """
+        Schedule a job, superseding any other job for the same key.
+
+        :param key: The key to serialize the jobs on, usually the file id.
+        :param signature: Identifies what the job does, to skip duplicate submissions.
+        :param make_worker: Creates the worker once the job is started.
+        :return: True if the job was scheduled, False if an identical job was already scheduled.
+        """
+        waiting = self.waiting.get(key)
+        running = self.running.get(key)
+        if waiting is not None and waiting.signature == signature:
+            return False
+        if waiting is None and running is not None and running.signature == signature:
+            if running.superseded:
+                # It was cancelled, but the same work was requested again, so let it finish.
+                # Should the worker have stopped already, it is started again once finished.
+                running.superseded = False
+                running.worker.aborted.set(False)
+                logger.debug(f"Job for {key} resumed, aborting it is no longer needed.")
+            # Otherwise it would simply be repeated.
+            return False
+
+        if waiting is not None:
+            logger.debug(f"Job for {key} superseded before it started.")
+            del self.waiting[key]
+        if running is not None:
+            self.abort_job(running)
+        self.waiting[key] = Job(key, signature, make_worker)
+        self.start_waiting_jobs()
+        return True
+
+    def cancel(self, key: str) -> bool:
+        """
+        Drop the waiting job for the key, and ask the running one to abort.
+
+        :param key: The key of the jobs to cancel.
+        :return: True if a job is still running and will finish later.
+        """
+        self.waiting.pop(key, None)
+        running = self.running.get(key)
+        if running is None:
+            return False
+        self.abort_job(running)
+        return True
+
+    def is_busy(self, key: str) -> bool:
+        return key in self.running or key in self.waiting
+
+    def has_jobs(self) -> bool:
+        return bool(self.running or self.waiting)
+
+    def abort_job(self, job: Job) -> None:
+        if job.superseded:
+            return
+        logger.debug(f"Running job for {job.key} superseded, aborting it.")
+        job.superseded = True
+        job.worker.abort()
+
+    def start_waiting_jobs(self) -> None:
+        """
+        Start waiting jobs, oldest first, while there are free slots.
+        Keys that still have a job running must wait for it to stop.
+        """
+        for key in list(self.waiting):
+            if len(self.running) >= self.max_running:
+                break
+            if key in self.running:
+                continue
+            job = self.waiting.pop(key)
+            job.worker = job.make_worker()
+            job.worker.signals.finished.connect(lambda _, job=job: self.worker_finished(job))
+            self.running[key] = job
+            logger.debug(f"Starting job for {key}.")
+            self.threadpool.start(job.worker)
+
+    def worker_finished(self, job: Job) -> None:
+        if self.running.get(job.key) is job:
+            del self.running[job.key]
+        stopped_early = job.worker.stopped_early
+        job.worker = None
+        if stopped_early and not job.superseded:
+            # The job was resumed too late to keep the worker from stopping, so run it again.
+            logger.debug(f"Job for {job.key} stopped before it was resumed, restarting it.")
+            if job.key not in self.waiting:
+                self.waiting[job.key] = Job(job.key, job.signature, job.make_worker)
+            self.job_finished.emit(job.key, True)
+        else:
+            self.job_finished.emit(job.key, job.superseded)
+        self.start_waiting_jobs()
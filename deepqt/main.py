@@ -1,7 +1,8 @@
 import argparse
+import multiprocessing
 import platform
 import sys
-from importlib import resources
+from pathlib import Path
 
 import PySide6.QtGui as Qg
 import PySide6.QtWidgets as Qw
@@ -11,7 +12,7 @@ import deepqt.utils as ut
 from deepqt import __program__, __display_name__, __version__, __description__
 from deepqt.constants import Command, Backend
 import deepqt.gui_utils as gu
-import deepqt.data.theme_icons as theme_icons_data
+import deepqt.planner as planner
 from deepqt.driver_mainwindow import MainWindow
 
 
@@ -21,6 +22,10 @@ from deepqt.driver_mainwindow import MainWindow
 
 
 def main() -> None:
+    # In a frozen executable, the processes of the html pool start by running main again.
+    # This makes them run the pool's work instead of launching the gui.
+    multiprocessing.freeze_support()
+
     # Parse command line arguments.
     parser = argparse.ArgumentParser(
         description=__description__,
@@ -29,7 +34,8 @@ def main() -> None:
         f"  {__program__} \t\t\t\t\t\t| to simply launch the GUI\n"
         f"  {__program__} {Command.FILES.value} file1.txt ebook2.epub --translate-now \t| to immediately start translating the given files\n"
         f'  {__program__} {Command.TEXT.value} "Hello world" --api=deepl \t\t| to pre-fill the given text into the interactive session and select the deepl api\n'
-        f"  {__program__} {Command.CLIPBOARD.value} \t\t\t\t\t| to pre-fill the current clipboard text in the interactive session\n",
+        f"  {__program__} {Command.CLIPBOARD.value} \t\t\t\t\t| to pre-fill the current clipboard text in the interactive session\n"
+        f"  {__program__} {Command.PLAN.value} file1.txt ebook2.epub \t\t\t| to show the requests and time needed, without translating\n",
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
 
@@ -53,10 +59,23 @@ def main() -> None:
         "clipboard", help="Translate text from clipboard. Usage: clipboard [--options]"
     )
 
+    parser_plan = subparsers.add_parser(
+        "plan",
+        help="Plan the translation of files without sending anything, then exit. "
+        "Usage: plan file1.txt file2.epub [--options]",
+    )
+    parser_plan.add_argument("file", nargs="+", help="Files to plan")
+    parser_plan.add_argument(
+        "--max-chunks", type=int, default=None, help="Maximum number of chunks per text file"
+    )
+    parser_plan.add_argument(
+        "--min-chunk-size", type=int, default=None, help="Minimum characters per chunk"
+    )
+
     supported_backends = list(Backend)
 
     # Common arguments
-    for p in [parser_files, parser_text, parser_clipboard, parser]:
+    for p in [parser_files, parser_text, parser_clipboard, parser_plan, parser]:
         p.add_argument(
             "--api",
             choices=supported_backends,
@@ -113,18 +132,24 @@ def main() -> None:
     if args.debug:
         logger.debug(f"Launch arguments: {args}")
 
+    command = Command(args.command)
+    if command == Command.PLAN:
+        # The plan is only printed, so the gui isn't needed.
+        exit_code = planner.run_headless(
+            [Path(path) for path in args.file], args.max_chunks, args.min_chunk_size
+        )
+        logger.info(ut.SHUTDOWN_MESSAGE + "\n")
+        sys.exit(exit_code)
+
     # Start Qt runtime.
     app = Qw.QApplication(sys.argv)
 
-    theme_icons = str(resources.files(theme_icons_data))
-
-    Qg.QIcon.setFallbackSearchPaths([":/icons", theme_icons])
+    gu.init_icon_search_paths()
     # We need to set an initial theme on Windows, otherwise the icons will fail to load
     # later on, even when switching the theme again.
     if platform.system() != "Linux" or ut.running_in_flatpak():
         Qg.QIcon.setThemeName("breeze")
 
-    command = Command(args.command)
     inputs = None
     if command == Command.FILES:
         inputs = args.file
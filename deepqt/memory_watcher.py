@@ -1,13 +1,10 @@
-import psutil
 from PySide6.QtCore import Signal, QObject, QTimer
 
-# Attempt to import pynvml for GPU monitoring
-try:
-    import pynvml
+import deepqt.utils as ut
 
-    _pynvml_available = True
-except ImportError:
-    _pynvml_available = False
+psutil = ut.LazyModule("psutil")
+# Imported with the first check, pynvml is optional for GPU monitoring.
+pynvml = None
 
 
 class MemoryWatcher(QObject):
@@ -19,18 +16,22 @@ class MemoryWatcher(QObject):
         super().__init__(parent)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.check_memory)
-        self.gpu_available = False
+        # Unknown until the first check, initializing NVML would only delay startup.
+        self.gpu_available = None
 
-        if _pynvml_available:
-            try:
-                pynvml.nvmlInit()
-                device_count = pynvml.nvmlDeviceGetCount()
-                if device_count > 0:
-                    self.gpu_available = True
-            except pynvml.NVMLError:
-                self.gpu_available = False
-        else:
-            self.gpu_available = False
+    def init_gpu_monitoring(self) -> bool:
+        # Attempt to import pynvml for GPU monitoring.
+        global pynvml
+        try:
+            import pynvml
+        except ImportError:
+            return False
+
+        try:
+            pynvml.nvmlInit()
+            return pynvml.nvmlDeviceGetCount() > 0
+        except pynvml.NVMLError:
+            return False
 
     def start(self):
         # Start the timer to check memory every second (2000 ms)
@@ -61,6 +62,8 @@ class MemoryWatcher(QObject):
                 oom = True
 
         # Monitor VRAM if GPUs are available
+        if self.gpu_available is None:
+            self.gpu_available = self.init_gpu_monitoring()
         if self.gpu_available:
             try:
                 device_count = pynvml.nvmlDeviceGetCount()
@@ -85,7 +88,7 @@ class MemoryWatcher(QObject):
             self.oom_relaxed.emit()
 
     def __del__(self):
-        if self.gpu_available and _pynvml_available:
+        if self.gpu_available:
             try:
                 pynvml.nvmlShutdown()
             except pynvml.NVMLError:
@@ -0,0 +1,379 @@
+"""
+Plans a translation without sending anything, to size a batch before spending any quota.
+
+The files are partitioned and batched exactly like the translation worker does it, so the plan
+shows the real number of requests and their sizes. The time is projected with the measured
+throughput of the backend, language pair and content type.
+Text repeated within and across the files is only translated once, so the plan also shows
+how much deduplication saves, see the deduplication module.
+"""
+
+from math import ceil
+from pathlib import Path
+
+from attrs import define, frozen, Factory
+from loguru import logger
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.lookups as b_lut
+import deepqt.config as cfg
+import deepqt.deduplication as dd
+import deepqt.structures as st
+import deepqt.throughput as tp
+import deepqt.translation_engine as te
+import deepqt.translation_interface as ti
+import deepqt.utils as ut
+
+
+@frozen
+class FilePlan:
+    name: str
+    content_type: tp.ContentType
+    chars: int
+    request_bytes: list[int]  # The size of each request, in UTF-8 bytes.
+    repeated_requests: int = 0  # Requests that needn't be sent, all of it was repeated.
+    repeated_chars: int = 0  # Chars that needn't be sent.
+    seconds: float | None = None  # None if there are no measurements to go by.
+    loaded: bool = True  # Unloaded epubs only have an estimated char count, and no requests.
+
+    @property
+    def requests(self) -> int:
+        return len(self.request_bytes)
+
+
+@define
+class TranslationPlan:
+    files: list[FilePlan] = Factory(list)
+
+    @property
+    def chars(self) -> int:
+        return sum(file.chars for file in self.files)
+
+    @property
+    def requests(self) -> int:
+        return sum(file.requests for file in self.files)
+
+    @property
+    def request_bytes(self) -> list[int]:
+        return [size for file in self.files for size in file.request_bytes]
+
+    @property
+    def repeated_requests(self) -> int:
+        return sum(file.repeated_requests for file in self.files)
+
+    @property
+    def repeated_chars(self) -> int:
+        return sum(file.repeated_chars for file in self.files)
+
+    @property
+    def seconds(self) -> float | None:
+        if any(file.seconds is None for file in self.files if file.chars):
+            return None
+        return sum(file.seconds or 0 for file in self.files)
+
+    def summary(self) -> str:
+        """
+        Describe the plan in a few lines, for the confirmation dialog.
+        """
+        sizes = self.request_bytes
+        lines = [
+            f"{ut.format_char_count(self.chars)} {ut.f_plural(self.chars, 'character')} "
+            f"in {self.requests} {ut.f_plural(self.requests, 'request')}"
+        ]
+        if sizes:
+            lines.append(
+                f"Request size: {format_bytes(min(sizes))} to {format_bytes(max(sizes))}, "
+                f"{format_bytes(sum(sizes) / len(sizes))} on average"
+            )
+        if self.repeated_chars:
+            requests_text = ut.f_plural(self.repeated_requests, "request")
+            chars_text = ut.f_plural(self.repeated_chars, "character")
+            lines.append(
+                f"Deduplicated: {self.repeated_requests} {requests_text} skipped, "
+                f"{ut.format_char_count(self.repeated_chars)} repeated {chars_text} not sent"
+            )
+        seconds = self.seconds
+        if seconds is None:
+            lines.append("Projected time: unknown, no translation speed measured yet")
+        else:
+            lines.append(f"Projected time: {ut.f_time(ceil(seconds))}")
+        unloaded = [file.name for file in self.files if not file.loaded]
+        if unloaded:
+            lines.append(f"Not loaded yet, char count estimated: {', '.join(unloaded)}")
+        return "\n".join(lines)
+
+    def breakdown(self) -> str:
+        """
+        Tabulate the plan of each file.
+        """
+        width = max([len("File")] + [len(file.name) for file in self.files])
+        lines = [
+            f"{'File':<{width}}  {'Type':<4}  {'Chars':>9}  {'Requests':>8}  "
+            f"{'Max size':>9}  {'Repeated':>8}  {'Time':>8}"
+        ]
+        for file in self.files:
+            max_size = format_bytes(max(file.request_bytes)) if file.request_bytes else "-"
+            time = "?" if file.seconds is None else ut.f_time(ceil(file.seconds))
+            lines.append(
+                f"{file.name:<{width}}  {file.content_type:<4}  {file.chars:>9}  "
+                f"{file.requests:>8}  {max_size:>9}  {file.repeated_requests:>8}  {time:>8}"
+            )
+        return "\n".join(lines)
+
+
+def format_bytes(size: float) -> str:
+    if size < 1024:
+        return f"{size:.0f} B"
+    return f"{size / 1024:.1f} KiB"
+
+
+@frozen
+class Request:
+    size: int  # In UTF-8 bytes.
+    chars: int
+    # Unknown for memory mapped files, which are only read when translating.
+    texts: list[str] | None = None
+
+
+def batch_requests(
+    pieces: list[str], capabilities: bi.BackendCapabilities, chars_per_byte: float | None = None
+) -> list[Request]:
+    """
+    Group the pieces into requests like the translation engine does.
+
+    :param pieces: The texts handed to the engine at once.
+    :param capabilities: The capabilities of the backend.
+    :param chars_per_byte: [Optional] Extrapolate the chars from the size, for html,
+        which only counts the chars of the text, not the tags.
+    :return: The requests.
+    """
+    requests = []
+    for batch in te.make_batches(pieces, capabilities):
+        texts = [pieces[i] for i in batch]
+        size = sum(len(text.encode("utf-8")) for text in texts)
+        if chars_per_byte is None:
+            chars = sum(len(text) for text in texts)
+        else:
+            chars = round(size * chars_per_byte)
+        requests.append(Request(size, chars, texts))
+    return requests
+
+
+def text_file_requests(
+    file: st.TextFile,
+    max_chunks: int,
+    min_chunk_size: int,
+    capabilities: bi.BackendCapabilities | None = None,
+) -> list[Request]:
+    """
+    Partition a text file into requests like the worker does, leaving the file unchanged.
+    The chunks are handed to the engine a window at a time, which batches their pieces.
+
+    :param file: The text file.
+    :param max_chunks: The maximum number of chunks to aim for.
+    :param min_chunk_size: The minimum size of each chunk.
+    :param capabilities: [Optional] The capabilities of the backend, one piece per request
+        if not given.
+    :return: The requests.
+    """
+    capabilities = capabilities or bi.BackendCapabilities()
+    max_bytes = min(ti.API_MAX_BYTES, capabilities.max_request_bytes or ti.API_MAX_BYTES)
+    window_size = te.window_size(capabilities)
+    if isinstance(file, st.MappedTextFile):
+        chunk_spans = file.chunk_spans
+        try:
+            file.partition(max_chunks, min_chunk_size, ti.API_MAX_BYTES)
+            spans = file.chunk_spans
+        finally:
+            file.chunk_spans = chunk_spans
+        # Reading the chunks would take too long, so the chars are extrapolated from the size.
+        # Chunks are rarely split any further, so each is taken to be one piece.
+        chars_per_byte = file.char_count / max(file.size, 1)
+        requests = []
+        for window_start in range(0, len(spans), window_size):
+            sizes = [end - start for start, end in spans[window_start : window_start + window_size]]
+            for batch in te.make_size_batches(sizes, capabilities):
+                size = sum(sizes[i] for i in batch)
+                requests.append(Request(size, round(size * chars_per_byte)))
+        return requests
+
+    text = file.current_text()
+    spans = ti.partition_text(text, max_chunks, min_chunk_size)
+    requests = []
+    for window_start in range(0, len(spans), window_size):
+        pieces = [
+            piece
+            for start, end in spans[window_start : window_start + window_size]
+            for piece in ti.partition_text_max_bytes(text[start:end], max_bytes)
+        ]
+        requests += batch_requests(pieces, capabilities)
+    return requests
+
+
+def epub_file_requests(
+    file: st.EpubFile, capabilities: bi.BackendCapabilities | None = None
+) -> list[Request]:
+    """
+    Split an epub into requests like the worker does: the table of contents is translated
+    on its own, then each html file, split by size.
+
+    :param file: The initialized epub file.
+    :param capabilities: [Optional] The capabilities of the backend, one piece per request
+        if not given.
+    :return: The requests.
+    """
+    capabilities = capabilities or bi.BackendCapabilities()
+    requests = []
+    if file.toc_file is not None:
+        requests += batch_requests(file.toc_file.get_texts(), capabilities)
+    for html_file in file.html_files:
+        html_text = html_file.current_text()
+        chars_per_byte = html_file.char_count / max(len(html_text.encode("utf-8")), 1)
+        pieces = ti.partition_text_max_bytes(html_text, ti.API_MAX_BYTES)
+        requests += batch_requests(pieces, capabilities, chars_per_byte)
+    return requests
+
+
+def plan_translation(
+    files: list[st.InputFile],
+    max_chunks: int,
+    min_chunk_size: int,
+    throughput: tp.ThroughputModel | None = None,
+    backend: str = "",
+    lang_from: str = "",
+    lang_to: str = "",
+    deduplicate: bool = True,
+    capabilities: bi.BackendCapabilities | None = None,
+) -> TranslationPlan:
+    """
+    Plan the translation of the files at their current process level.
+
+    :param files: The files to translate.
+    :param max_chunks: The maximum number of chunks to split each text file into.
+    :param min_chunk_size: The minimum size of each chunk.
+    :param throughput: [Optional] The model to project the time with.
+    :param backend: [Optional] The backend, to pick the throughput measurements.
+    :param lang_from: [Optional] The source language, blank if detected.
+    :param lang_to: [Optional] The target language.
+    :param deduplicate: [Optional] Whether repeated text is only translated once.
+    :param capabilities: [Optional] The capabilities of the backend, to batch the requests.
+        Without them, every piece is counted as a request of its own.
+    :return: The plan.
+    """
+    plan = TranslationPlan()
+    deduplicator = None
+    if deduplicate:
+        texts = (
+            file.current_text()
+            for file in files
+            if isinstance(file, st.TextFile) and not isinstance(file, st.MappedTextFile)
+        )
+        deduplicator = dd.Deduplicator(dd.find_repeated_lines(texts))
+    for file in files:
+        if isinstance(file, st.EpubFile):
+            content_type = tp.ContentType.HTML
+            loaded = file.initialized
+            requests = epub_file_requests(file, capabilities) if loaded else []
+        else:
+            content_type = tp.ContentType.TEXT
+            loaded = True
+            requests = text_file_requests(file, max_chunks, min_chunk_size, capabilities)
+
+        repeated_requests = 0
+        repeated_chars = 0
+        for request in requests:
+            if deduplicator is None or request.texts is None:
+                continue
+            # Translate the request like the worker would, without sending anything.
+            sent = []
+            saved_before = deduplicator.saved_chars
+            deduplicator.translate(
+                request.texts,
+                lambda batch: sent.extend(batch) or batch,
+                split_lines=content_type == tp.ContentType.TEXT,
+            )
+            if sent:
+                repeated_chars += deduplicator.saved_chars - saved_before
+            else:
+                repeated_requests += 1
+                repeated_chars += request.chars
+
+        chars = file.char_count
+        seconds = None
+        if throughput is not None:
+            key = tp.profile_key(backend, lang_from, lang_to, content_type)
+            seconds = throughput.estimate(key, chars, len(requests) if loaded else None)
+        plan.files.append(
+            FilePlan(
+                name=file.path.name,
+                content_type=content_type,
+                chars=chars,
+                request_bytes=[request.size for request in requests],
+                repeated_requests=repeated_requests,
+                repeated_chars=repeated_chars,
+                seconds=seconds,
+                loaded=loaded,
+            )
+        )
+    return plan
+
+
+def run_headless(
+    paths: list[Path], max_chunks: int | None = None, min_chunk_size: int | None = None
+) -> int:
+    """
+    Print the plan for the files, without starting the gui.
+    The glossary and processing rules aren't applied, so the plan shows the raw files.
+
+    :param paths: The files to plan.
+    :param max_chunks: [Optional] Overrides the backend's maximum number of chunks.
+    :param min_chunk_size: [Optional] Overrides the backend's minimum chunk size.
+    :return: The exit code.
+    """
+    config = cfg.Config()
+    config_path = ut.get_config_path()
+    if config_path.exists():
+        config, *_ = cfg.load_config(config_path)
+    default_max_chunks, default_min_chunk_size = config.chunking()
+    if max_chunks is None:
+        max_chunks = default_max_chunks
+    if min_chunk_size is None:
+        min_chunk_size = default_min_chunk_size
+
+    files = []
+    for path in paths:
+        try:
+            if path.suffix.lower() == ".epub":
+                file = st.EpubFile(path=path, cache_dir=ut.epub_cache_path())
+                file.initialize_files(**config.epub_options())
+            elif path.stat().st_size >= st.MAPPED_TEXT_MIN_BYTES:
+                file = st.MappedTextFile(path=path)
+            else:
+                file = st.TextFile(path=path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load {path}: {e}")
+            print(f"Failed to load {path}: {e}")
+            return 1
+        files.append(file)
+
+    # The capabilities are known without connecting, without a backend each piece is counted.
+    capabilities = None
+    backend_config = config.backend_configs.get(config.current_backend)
+    if backend_config is not None:
+        capabilities = b_lut.backend_to_class[backend_config.backend_type]().capabilities()
+
+    plan = plan_translation(
+        files,
+        max_chunks,
+        min_chunk_size,
+        tp.ThroughputModel.load(ut.get_throughput_path()),
+        config.current_backend,
+        config.lang_from,
+        config.lang_to,
+        config.deduplicate,
+        capabilities,
+    )
+    print(plan.breakdown())
+    print()
+    print(plan.summary())
+    return 0
@@ -0,0 +1,310 @@
+"""
+Declarative pre- and postprocessing rules, applied to texts before and after translation.
+
+A rule set is a YAML file listing regex rules, each belonging to a stage:
+    rules:
+      - name: Direct speech
+        stage: pre
+        pattern: '^「(.*)」$'
+        replacement: '[QUOTE]\\n\\1\\n[ENDQUOTE]'
+        flags: m
+
+The rules of each stage are compiled into a single pattern, so the text is only scanned once
+per stage, no matter how many rules there are. Where several rules could match at the same
+position, the one listed first wins.
+Since the rules share one pattern, they may use numbered groups in their replacements,
+but neither named groups nor backreferences within their patterns.
+
+The post stage undoes what the pre stage did to the translation, which may have left the markers
+nested or mangled. Should the matches overlap, or leave anything for the rules to match, the order
+the rules are applied in matters, so they are applied one after another instead.
+"""
+
+import hashlib
+import re
+import time
+from importlib import resources
+from pathlib import Path
+
+import yaml
+from attrs import define, Factory
+from loguru import logger
+
+from deepqt.data import processing_rules as bundled_rules
+
+DEFAULT_RULES_FILE = "quote_protection.yaml"
+
+STAGES = ("pre", "post")
+
+# The inline flags a rule may scope to its own pattern.
+RULE_FLAGS = set("imsx")
+
+# Backreferences or named groups, which would break once the patterns are combined.
+unsupported_syntax_re = re.compile(r"\\[1-9]|\(\?P[<=]")
+# Global inline flags like (?i), which are only allowed at the start of the combined pattern.
+global_flags_re = re.compile(r"(?<!\\)\(\?[aiLmsux]+\)")
+# Group references in replacements: \1 or \g<1>.
+replacement_group_re = re.compile(r"\\(?:(\d+)|g<(\d+)>)")
+
+
+class RuleError(Exception):
+    pass
+
+
+@define
+class Rule:
+    name: str
+    pattern: str
+    replacement: str = ""
+    stage: str = "pre"
+    flags: str = ""
+
+
+@define
+class RuleStats:
+    matches: int = 0
+    seconds: float = 0
+
+
+@define
+class CompiledStage:
+    """
+    The rules of one stage, combined into a single pattern.
+    Each rule is wrapped in a group, which is the last to close when it matches,
+    so the match's lastindex identifies the rule.
+    """
+
+    rules: list[Rule]
+    pattern: re.Pattern | None = None
+    # The rules compiled on their own, with their replacements, for applying them in turn.
+    sequence: list[tuple[Rule, re.Pattern]] = Factory(list)
+    # The rule and replacement template, with its group numbers shifted, by outer group index.
+    dispatch: dict[int, tuple[Rule, str]] = Factory(dict)
+
+    def __attrs_post_init__(self) -> None:
+        if not self.rules:
+            return
+        alternatives = []
+        group_index = 1
+        for rule in self.rules:
+            compiled = compile_rule(rule)
+            self.sequence.append((rule, compiled))
+            shifted = shift_replacement_groups(rule.replacement, group_index, compiled.groups)
+            self.dispatch[group_index] = (rule, shifted)
+            flags = f"(?{rule.flags}:" if rule.flags else "(?:"
+            alternative = f"{flags}({rule.pattern}))"
+            try:
+                re.compile(alternative)
+            except re.error as e:
+                raise RuleError(f"Rule '{rule.name}' can't be combined with the others: {e}")
+            alternatives.append(alternative)
+            group_index += compiled.groups + 1
+        self.pattern = re.compile("|".join(alternatives))
+
+
+@define
+class RuleSet:
+    rules: list[Rule]
+    content_hash: str = ""
+    stages: dict[str, CompiledStage] = Factory(dict)
+    # Collected while applying the rules, if enabled.
+    collect_stats: bool = False
+    stats: dict[str, RuleStats] = Factory(dict)
+
+    def __attrs_post_init__(self) -> None:
+        for rule in self.rules:
+            if rule.stage not in STAGES:
+                raise RuleError(f"Rule '{rule.name}' has an invalid stage '{rule.stage}'.")
+        for stage in STAGES:
+            self.stages[stage] = CompiledStage([rule for rule in self.rules if rule.stage == stage])
+
+    def has_stage(self, stage: str) -> bool:
+        return self.stages[stage].pattern is not None
+
+    def apply(self, stage: str, text: str, check_tangled: bool = False) -> str:
+        """
+        Apply all rules of a stage to the text in a single pass.
+
+        :param stage: Either "pre" or "post".
+        :param text: The text to process.
+        :param check_tangled: [Optional] Apply the rules one after another instead, if the
+            matches overlap or the result still contains matches.
+        :return: The processed text.
+        """
+        compiled = self.stages[stage]
+        if compiled.pattern is None:
+            return text
+
+        if not self.collect_stats and not check_tangled:
+            return compiled.pattern.sub(lambda m: m.expand(compiled.dispatch[m.lastindex][1]), text)
+
+        tangled = False
+        matches: dict[str, RuleStats] = {}
+
+        def replace(match: re.Match) -> str:
+            nonlocal tangled
+            start = time.perf_counter()
+            rule, template = compiled.dispatch[match.lastindex]
+            replacement = match.expand(template)
+            if check_tangled and compiled.pattern.search(text, match.start() + 1, match.end()):
+                tangled = True
+            stats = matches.setdefault(rule.name, RuleStats())
+            stats.matches += 1
+            stats.seconds += time.perf_counter() - start
+            return replacement
+
+        processed = compiled.pattern.sub(replace, text)
+        if check_tangled and (tangled or compiled.pattern.search(processed)):
+            logger.debug(f"Tangled matches for the {stage} stage, applying its rules in turn.")
+            processed, matches = self.apply_in_turn(compiled, text)
+
+        if self.collect_stats:
+            for name, stats in matches.items():
+                total = self.stats.setdefault(name, RuleStats())
+                total.matches += stats.matches
+                total.seconds += stats.seconds
+        return processed
+
+    @staticmethod
+    def apply_in_turn(compiled: CompiledStage, text: str) -> tuple[str, dict[str, RuleStats]]:
+        """
+        Apply the rules of a stage one after another, in the order they are listed.
+
+        :param compiled: The stage.
+        :param text: The text to process.
+        :return: The processed text and the stats of each rule that matched.
+        """
+        matches = {}
+        for rule, pattern in compiled.sequence:
+            start = time.perf_counter()
+            text, count = pattern.subn(rule.replacement, text)
+            if count:
+                matches[rule.name] = RuleStats(count, time.perf_counter() - start)
+        return text, matches
+
+    def preprocess(self, text: str) -> str:
+        return self.apply("pre", text)
+
+    def postprocess(self, text: str) -> str:
+        # The translation may have nested or mangled the markers.
+        return self.apply("post", text, check_tangled=True)
+
+    def profile(self, text: str) -> dict[str, float]:
+        """
+        Time each rule on its own, to find out which ones are expensive.
+        This scans the text once per rule, so it is only meant for diagnostics.
+
+        :param text: The text to match the rules against.
+        :return: The seconds each rule took to find all its matches, by rule name.
+        """
+        timings = {}
+        for rule in self.rules:
+            compiled = compile_rule(rule)
+            start = time.perf_counter()
+            for _ in compiled.finditer(text):
+                pass
+            timings[rule.name] = time.perf_counter() - start
+        return timings
+
+
+def compile_rule(rule: Rule) -> re.Pattern:
+    """
+    Compile a single rule's pattern, checking that it can be combined with the others.
+
+    :param rule: The rule to compile.
+    :return: The compiled pattern, including the rule's flags.
+    :raises RuleError: If the rule is invalid.
+    """
+    if not set(rule.flags) <= RULE_FLAGS:
+        raise RuleError(f"Rule '{rule.name}' has invalid flags '{rule.flags}'.")
+    if unsupported_syntax_re.search(rule.pattern):
+        raise RuleError(
+            f"Rule '{rule.name}' uses named groups or backreferences, which aren't supported."
+        )
+    if global_flags_re.search(rule.pattern):
+        raise RuleError(
+            f"Rule '{rule.name}' sets inline flags for the whole pattern, "
+            "use the rule's flags field instead."
+        )
+    try:
+        return re.compile(f"(?{rule.flags}:{rule.pattern})" if rule.flags else rule.pattern)
+    except re.error as e:
+        raise RuleError(f"Rule '{rule.name}' has an invalid pattern: {e}")
+
+
+def shift_replacement_groups(replacement: str, offset: int, group_count: int) -> str:
+    """
+    Rewrite the group references of a rule's replacement to its groups in the combined pattern.
+
+    :param replacement: The replacement template, using the rule's own group numbers.
+    :param offset: The index of the group wrapping the rule in the combined pattern.
+    :param group_count: The number of groups in the rule's pattern.
+    :return: The replacement template for the combined pattern.
+    :raises RuleError: If the replacement refers to a group the rule doesn't have.
+    """
+
+    def shift(match: re.Match) -> str:
+        group = int(match.group(1) or match.group(2))
+        if group > group_count:
+            raise RuleError(f"Replacement '{replacement}' refers to missing group {group}.")
+        return rf"\g<{offset + group}>"
+
+    return replacement_group_re.sub(shift, replacement)
+
+
+def parse_rule_set(data: bytes) -> RuleSet:
+    """
+    Parse and compile a rule set from the contents of a rule file.
+
+    :param data: The YAML contents.
+    :return: The compiled rule set.
+    :raises RuleError: If the file or any of its rules is invalid.
+    """
+    try:
+        parsed = yaml.safe_load(data)
+    except yaml.YAMLError as e:
+        raise RuleError(f"Failed to parse the rule file: {e}")
+    if not isinstance(parsed, dict) or not isinstance(parsed.get("rules"), list):
+        raise RuleError("The rule file must contain a list of rules.")
+
+    rules = []
+    for i, entry in enumerate(parsed["rules"]):
+        if not isinstance(entry, dict) or "pattern" not in entry:
+            raise RuleError(f"Rule {i + 1} must at least have a pattern.")
+        rules.append(
+            Rule(
+                name=str(entry.get("name", f"Rule {i + 1}")),
+                pattern=str(entry["pattern"]),
+                replacement=str(entry.get("replacement", "")),
+                stage=str(entry.get("stage", "pre")),
+                flags=str(entry.get("flags", "")),
+            )
+        )
+    return RuleSet(rules, content_hash=hashlib.sha256(data).hexdigest())
+
+
+# Compiled rule sets by the hash of their file contents.
+_rule_set_cache: dict[str, RuleSet] = {}
+
+
+def load_rule_set(path: Path | None = None) -> RuleSet:
+    """
+    Load a rule set from a file, reusing the compiled rules if its contents were seen before.
+
+    :param path: [Optional] The rule file. Defaults to the bundled quote protection rules.
+    :return: The compiled rule set.
+    :raises RuleError: If the file can't be read or is invalid.
+    """
+    try:
+        if path is None:
+            data = resources.files(bundled_rules).joinpath(DEFAULT_RULES_FILE).read_bytes()
+        else:
+            data = Path(path).read_bytes()
+    except OSError as e:
+        raise RuleError(f"Failed to read the rule file {path}: {e}")
+
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash not in _rule_set_cache:
+        logger.debug(f"Compiling rule set {path or DEFAULT_RULES_FILE}")
+        _rule_set_cache[content_hash] = parse_rule_set(data)
+    return _rule_set_cache[content_hash]
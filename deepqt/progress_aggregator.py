@@ -0,0 +1,115 @@
+"""
+Coalesces progress reports from worker threads before they reach the gui.
+
+Workers may report progress for every chunk they translate, which on a fast backend means
+thousands of reports per second. Emitting a signal for each would flood the gui's event loop
+with queued calls, so workers report to the aggregator instead, which merely stores the latest
+state of each file. A timer in the gui thread passes the accumulated state on at a fixed rate.
+"""
+
+import threading
+
+import PySide6.QtCore as Qc
+from attrs import define, Factory
+from loguru import logger
+
+DEFAULT_UPDATES_PER_SECOND = 10
+
+
+@define
+class ProgressSnapshot:
+    """
+    The progress reported since the last update.
+
+    - messages: The latest message of each file that reported something, in reporting order.
+    - processed_chars: The latest global count of processed chars, if any was reported.
+    - total_chars: The latest global count of chars to process, if any was reported.
+    - report_count: The number of reports that were coalesced into this snapshot.
+    """
+
+    messages: dict[str, str] = Factory(dict)
+    processed_chars: int | None = None
+    total_chars: int | None = None
+    report_count: int = 0
+
+    def has_counts(self) -> bool:
+        return self.processed_chars is not None and self.total_chars is not None
+
+
+class ProgressAggregator(Qc.QObject):
+    """
+    Collects progress reports from any thread, and emits them in batches from the gui thread.
+    It must be created in the gui thread, and started before the workers report to it.
+    """
+
+    updated = Qc.Signal(object)  # ProgressSnapshot
+
+    pending: ProgressSnapshot
+    lock: threading.Lock
+    timer: Qc.QTimer
+
+    def __init__(self, updates_per_second: float = DEFAULT_UPDATES_PER_SECOND, parent=None) -> None:
+        Qc.QObject.__init__(self, parent)
+        self.pending = ProgressSnapshot()
+        self.lock = threading.Lock()
+        self.timer = Qc.QTimer(self)
+        self.timer.setInterval(max(1, round(1000 / max(updates_per_second, 0.001))))
+        self.timer.timeout.connect(self.flush)
+
+    def start(self) -> None:
+        self.timer.start()
+
+    def stop(self) -> None:
+        """
+        Stop the timer, passing on whatever was reported last.
+        """
+        self.timer.stop()
+        self.flush()
+
+    def report(
+        self,
+        file_id: str,
+        message: str,
+        processed_chars: int | None = None,
+        total_chars: int | None = None,
+    ) -> None:
+        """
+        Record the progress of a file. This is thread-safe, and cheap enough to call for every chunk.
+
+        :param file_id: The ID of the file.
+        :param message: The progress message to show for the file.
+        :param processed_chars: [Optional] The number of chars processed across all files.
+        :param total_chars: [Optional] The number of chars to process across all files.
+        """
+        with self.lock:
+            pending = self.pending
+            # Move the file to the end, so the messages stay in the order they were last reported.
+            pending.messages.pop(file_id, None)
+            pending.messages[file_id] = message
+            if processed_chars is not None and total_chars is not None:
+                pending.processed_chars = processed_chars
+                pending.total_chars = total_chars
+            pending.report_count += 1
+
+    def take(self) -> ProgressSnapshot | None:
+        """
+        Take the progress reported since the last update.
+
+        :return: The snapshot, or None if nothing was reported.
+        """
+        with self.lock:
+            if not self.pending.report_count:
+                return None
+            snapshot, self.pending = self.pending, ProgressSnapshot()
+        return snapshot
+
+    @Qc.Slot()
+    def flush(self) -> None:
+        snapshot = self.take()
+        if snapshot is None:
+            return
+        logger.debug(
+            f"Progress of {len(snapshot.messages)} files from {snapshot.report_count} reports: "
+            f"{snapshot.processed_chars} / {snapshot.total_chars} chars"
+        )
+        self.updated.emit(snapshot)
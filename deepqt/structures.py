@@ -1,29 +1,44 @@
+import atexit
+import codecs
 import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import os
 import re
+import shutil
+import threading
 import zipfile
 from attrs import define, Factory
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from enum import IntEnum
-from functools import partial, cache
+from functools import partial
+from math import ceil
 from pathlib import Path
+from typing import Callable
 
 from loguru import logger
+from lxml import etree
 
 import deepqt.utils as ut
+import deepqt.processing_rules as pr
+import deepqt.tracing as trc
 from deepqt import trie
 from deepqt import xml_parser
 
 
-# TODO remove protected, add translated_glossary for the post-processing rules.
-# Post pre and postprocessing regex can replace quote protection
 class ProcessLevel(IntEnum):
     # Represent the values in bit increments, so that gloss_prot = gloss | prot
+    # Protection means the preprocessing rules were applied, see processing_rules.py.
     Error = -1
     RAW = 0
     GLOSSARY = 1
-    # PROTECTED = 2
-    # GLOSSARY_PROTECTED = 3
-    TRANSLATED = 2  # Only used for dumping.
-    TRANSLATED_GLOSSARY = 3  # Only used for dumping if glossary is applied.
+    PROTECTED = 2
+    GLOSSARY_PROTECTED = 3
+    TRANSLATED = 4  # Only used for dumping.
+    TRANSLATED_GLOSSARY = 5  # Only used for dumping if glossary is applied.
 
 
 @define
@@ -62,30 +77,85 @@ class TextFile(InputFile):
     text_protected: str = ""
     text_glossary_protected: str = ""
     process_level: ProcessLevel = ProcessLevel.RAW
-    text_chunks: list[str] = Factory(list)
+    # Used to recompute the glossary level after the intermediate texts were released.
+    glossary_processor: Callable[[str], str] | None = None
+    # The rules applied at the protected levels, and after translation.
+    rule_set: pr.RuleSet | None = None
+    # Set once only the current text is kept, the others are recomputed on demand.
+    texts_released: bool = False
+    # The (start, end) offsets of each chunk in the current text, or in the file if mapped.
+    chunk_spans: list[tuple[int, int]] = Factory(list)
     translation_chunks: list[str] = Factory(list)
     translation: str = ""
 
     def __attrs_post_init__(self) -> None:
         InputFile.__attrs_post_init__(self)
+        self.text = self.read_text()
+
+    @trc.traced("file_load", "io")
+    def read_text(self) -> str:
         with self.path.open("r", encoding="utf8") as f:
-            self.text = f.read()
+            return f.read()
 
-    def current_text(self) -> None:
-        match self.process_level:
+    @staticmethod
+    def level_attribute(level: ProcessLevel) -> str:
+        match level:
             case ProcessLevel.RAW:
-                return self.text
+                return "text"
             case ProcessLevel.GLOSSARY:
-                return self.text_glossary
+                return "text_glossary"
+            case ProcessLevel.PROTECTED:
+                return "text_protected"
+            case ProcessLevel.GLOSSARY_PROTECTED:
+                return "text_glossary_protected"
+
+    def level_text(self, level: ProcessLevel) -> str:
+        """
+        Get the text at the given process level.
+        If it was released, the raw text is read from disk again and the others are recomputed.
+        Recomputed texts aren't stored here, only current_text keeps the one it needs.
+
+        :param level: The process level.
+        :return: The text at that level.
+        """
+        text = getattr(self, self.level_attribute(level))
+        if text or not self.texts_released:
+            return text
+
+        match level:
+            case ProcessLevel.RAW:
+                return self.read_text()
+            case ProcessLevel.GLOSSARY:
+                return self.glossary_processor(self.level_text(ProcessLevel.RAW))
             case ProcessLevel.PROTECTED:
-                return self.text_protected
+                return self.rule_set.preprocess(self.level_text(ProcessLevel.RAW))
             case ProcessLevel.GLOSSARY_PROTECTED:
-                return self.text_glossary_protected
+                return self.rule_set.preprocess(self.level_text(ProcessLevel.GLOSSARY))
+
+    def current_text(self) -> str:
+        attribute = self.level_attribute(self.process_level)
+        text = getattr(self, attribute)
+        if text or not self.texts_released:
+            return text
+        # The process level changed after the release, so keep the new current text instead,
+        # rather than recomputing it for every chunk and character count.
+        text = self.level_text(self.process_level)
+        self.text = self.text_glossary = self.text_protected = self.text_glossary_protected = ""
+        setattr(self, attribute, text)
+        return text
+
+    def release_intermediate_texts(self) -> None:
+        """
+        Drop all texts but the one at the current process level, which is the one translated.
+        """
+        current = self.current_text()
+        self.text = self.text_glossary = self.text_protected = self.text_glossary_protected = ""
+        setattr(self, self.level_attribute(self.process_level), current)
+        self.texts_released = True
 
     @property
-    def char_count(self) -> None:
-        # Use caching to speed up the process, since the text doesn't change often, but can be very long.
-        return text_length(self.current_text())
+    def char_count(self) -> int:
+        return len(self.current_text())
 
     def get_translated_text(self) -> str | None:
         if self.translation:
@@ -106,15 +176,223 @@ class TextFile(InputFile):
         self.translation = ""
         self.translation_chunks = []
 
+    def chunk_count(self) -> int:
+        return len(self.chunk_spans)
+
+    def get_chunk(self, index: int) -> str:
+        """
+        Get the text of a chunk, ready to be translated.
+        Only this chunk is copied out of the current text.
+
+        :param index: The index of the chunk.
+        :return: The chunk's text at the current process level.
+        """
+        start, end = self.chunk_spans[index]
+        return self.current_text()[start:end]
+
+
+# Text files at least this large are memory mapped instead of read into memory.
+MAPPED_TEXT_MIN_BYTES = 64 * 1024**2
+# The size of the blocks a mapped text file is scanned in.
+MAPPED_SCAN_BLOCK_BYTES = 16 * 1024**2
+
+
+@define
+class MappedTextFile(TextFile):
+    """
+    A text file that is too large to comfortably hold in memory several times over.
+    Instead of reading it, the file is memory mapped, and partitioned into byte spans of the
+    mapping. The processing levels are then produced lazily for each chunk, as it is translated,
+    instead of being held as whole-document strings.
+    The file must be UTF-8 encoded, line endings are normalized like in text mode.
+    """
+
+    mapping: mmap.mmap | None = None
+    size: int = 0
+    raw_char_count: int = 0
+    # Applied to each chunk in order, like the glossary or preprocessing rules.
+    chunk_processors: list[Callable[[str], str]] = Factory(list)
+
+    def __attrs_post_init__(self) -> None:
+        InputFile.__attrs_post_init__(self)
+        self.size = self.path.stat().st_size
+        if self.size == 0:
+            # Empty files can't be mapped.
+            return
+        with self.path.open("rb") as f:
+            self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.raw_char_count = self.count_chars()
+
+    @trc.traced("file_load", "io")
+    def count_chars(self) -> int:
+        """
+        Count the characters as they would be read in text mode, validating the encoding.
+        Only one block is decoded at a time.
+
+        :return: The number of characters.
+        :raises UnicodeDecodeError: If the file isn't valid UTF-8.
+        """
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder("utf-8")(), translate=True
+        )
+        count = 0
+        for start in range(0, self.size, MAPPED_SCAN_BLOCK_BYTES):
+            block = self.mapping[start : start + MAPPED_SCAN_BLOCK_BYTES]
+            count += len(decoder.decode(block))
+        count += len(decoder.decode(b"", final=True))
+        return count
+
+    def decode_span(self, start: int, end: int) -> str:
+        text = self.mapping[start:end].decode("utf-8")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def head(self, max_bytes: int) -> str:
+        """
+        Get the beginning of the file, for previews.
+
+        :param max_bytes: The maximum number of bytes to read.
+        :return: The first whole lines within that many bytes.
+        """
+        if self.mapping is None:
+            return ""
+        return self.decode_span(0, self.span_end(0, max_bytes))
+
+    def current_text(self) -> str:
+        raise TypeError(f"{self.path.name} is memory mapped, read it chunk by chunk instead.")
 
-@cache
-def text_length(text: str) -> int:
+    @property
+    def char_count(self) -> int:
+        # Processing is deferred until translation, so only the raw length is known.
+        return self.raw_char_count
+
+    def span_end(self, start: int, max_bytes: int, target: int | None = None) -> int:
+        """
+        Find where a span starting at start should end.
+        Spans end after the first line break at or past the target, but may not exceed
+        max_bytes, in which case they end after the last line break that still fits.
+        Lines that don't fit at all are cut at a character boundary.
+
+        :param start: The start of the span.
+        :param max_bytes: The maximum size of the span.
+        :param target: [Optional] The preferred end of the span. Defaults to the maximum.
+        :return: The end of the span.
+        """
+        limit = min(start + max_bytes, self.size)
+        if target is not None and target < limit:
+            line_break = self.mapping.find(b"\n", max(target - 1, start), limit)
+            if line_break != -1:
+                return line_break + 1
+        if limit == self.size:
+            return limit
+        line_break = self.mapping.rfind(b"\n", start, limit)
+        if line_break != -1:
+            return line_break + 1
+        # Don't cut a multibyte character in half: back up over continuation bytes.
+        end = limit
+        while end > start + 1 and self.mapping[end] & 0xC0 == 0x80:
+            end -= 1
+        return end
+
+    def partition(self, max_chunks: int, min_chunk_size: int, max_bytes: int) -> None:
+        """
+        Partition the file into roughly evenly sized byte spans, splitting only at whole lines.
+
+        :param max_chunks: The maximum number of chunks to aim for.
+        :param min_chunk_size: The minimum size of each chunk, in bytes.
+        :param max_bytes: The maximum size of each chunk, in bytes.
+        """
+        self.chunk_spans = []
+        if self.mapping is None:
+            return
+        bucket_count = min(max_chunks, (self.size // min_chunk_size) + 1)
+        approx_chunk_size = ceil(self.size / bucket_count)
+        start = 0
+        while start < self.size:
+            end = self.span_end(start, max_bytes, target=start + approx_chunk_size)
+            self.chunk_spans.append((start, end))
+            start = end
+
+    def get_chunk(self, index: int) -> str:
+        """
+        Read a chunk from the mapping and process it.
+        Processors may swallow the final line break, which would glue chunks together,
+        so it is restored.
+
+        :param index: The index of the chunk.
+        :return: The processed text of the chunk.
+        """
+        text = self.decode_span(*self.chunk_spans[index])
+        processed = text
+        for processor in self.chunk_processors:
+            processed = processor(processed)
+        if text.endswith("\n") and not processed.endswith("\n"):
+            processed += "\n"
+        return processed
+
+    def close(self) -> None:
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+@define
+class TextStreamWriter:
     """
-    Simple wrapper to take advantage of caching.
+    Incrementally writes the translation of a text file, appending each chunk once it is ready,
+    so that the translation of a memory mapped file never has to be held in memory as a whole.
+    The text is written to a temporary .part file next to the output path,
+    finalizing atomically moves it into place.
     """
-    length = len(text)
-    logger.debug(f"Text length: {length}")
-    return length
+
+    output_path: Path
+    temp_path: Path | None = None
+    written_chunks: int = 0
+
+    def __attrs_post_init__(self) -> None:
+        self.temp_path = self.output_path.with_name(self.output_path.name + ".part")
+        self.temp_path.parent.mkdir(parents=True, exist_ok=True)
+        self.temp_path.write_text("", encoding="utf-8")
+
+    def write(self, text: str) -> None:
+        """
+        Append the translation of the next chunk.
+
+        :param text: The translated chunk, postprocessed already.
+        """
+        with self.temp_path.open("a", encoding="utf-8") as f:
+            f.write(text)
+        self.written_chunks += 1
+
+    def finalize(self, output_path: Path | None = None, incomplete: bool = False) -> Path:
+        """
+        Move the translation to the output path.
+
+        :param output_path: [Optional] The final path, if it differs from the initial output path.
+        :param incomplete: [Optional] Put the incomplete translation banner in front of it.
+        :return: The path the translation was written to.
+        """
+        if output_path is None:
+            output_path = self.output_path
+        if incomplete:
+            # Copy it behind the banner, without reading it into memory.
+            banner_path = self.temp_path.with_name(self.temp_path.name + ".banner")
+            with (
+                banner_path.open("w", encoding="utf-8") as out_file,
+                self.temp_path.open("r", encoding="utf-8") as in_file,
+            ):
+                out_file.write(incomplete_translation_banner())
+                shutil.copyfileobj(in_file, out_file)
+            os.replace(banner_path, self.temp_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.temp_path, output_path)
+        logger.info(f"Wrote translation {output_path}")
+        return output_path
+
+    def discard(self) -> None:
+        """
+        Delete the partial translation.
+        """
+        self.temp_path.unlink(missing_ok=True)
 
 
 def incomplete_translation_banner() -> str:
@@ -134,8 +412,10 @@ class CSSFile:
     text: str = ""
 
     def __attrs_post_init__(self) -> None:
-        with self.path.open("r", encoding="utf8") as f:
-            self.text = f.read()
+        # The text may have been restored from the cache already.
+        if not self.text:
+            with self.path.open("r", encoding="utf8") as f:
+                self.text = f.read()
 
 
 @define
@@ -151,8 +431,10 @@ class XMLFile:
     translation: str = ""
 
     def __attrs_post_init__(self) -> None:
-        with self.path.open("r", encoding="utf8") as f:
-            self.text = f.read()
+        # The text may have been restored from the cache already.
+        if not self.text:
+            with self.path.open("r", encoding="utf8") as f:
+                self.text = f.read()
 
     def prepare_text(self, *args, **kwargs) -> None:
         pass
@@ -204,24 +486,67 @@ class TocNCXFile(XMLFile):
     """
     The NCX file is a special XML file that contains the table of contents.
     It isn't a standard HTML file, so it needs to be handled separately.
-    Its text is contained within <text> tags.
+    Its text is contained within <text> tags, which are parsed once and then accessed by index.
     """
 
-    @staticmethod
-    def get_texts(xml: str) -> list[str]:
-        # Find the contents of the <text> tags.
-        return [
-            match.group(1) for match in re.finditer(r"<text>\s*(.*?)\s*</text>", xml, re.DOTALL)
-        ]
+    root: etree._Element | None = None
+    text_nodes: list[etree._Element] = Factory(list)
+    texts: list[str] = Factory(list)
+    texts_glossary: list[str] = Factory(list)
 
-    @staticmethod
-    def set_texts(xml: str, texts: list[str]) -> str:
-        # Replace the contents of the <text> tags in order.
-        return re.sub(r"<text>.*?</text>", lambda m: f"<text>{texts.pop(0)}</text>", xml, re.DOTALL)
+    def __attrs_post_init__(self) -> None:
+        XMLFile.__attrs_post_init__(self)
+        # Recover from broken markup, as a readable table of contents is better than none.
+        parser = etree.XMLParser(recover=True)
+        self.root = etree.fromstring(self.text.encode("utf-8"), parser)
+        if self.root is None:
+            logger.warning(f"Failed to parse {self.path.name}, ignoring its table of contents.")
+            return
+        # Ignore the namespace, the same way the tags were matched before.
+        self.text_nodes = self.root.xpath("//*[local-name()='text']")
+        self.texts = [(node.text or "").strip() for node in self.text_nodes]
+
+    def get_texts(self) -> list[str]:
+        """
+        Get the contents of the <text> tags at the current process level.
+
+        :return: A new list of the texts, in document order.
+        """
+        if self.process_level == ProcessLevel.GLOSSARY:
+            return list(self.texts_glossary)
+        return list(self.texts)
+
+    def set_texts(self, texts: list[str]) -> str:
+        """
+        Render the file with the contents of the <text> tags replaced, in order.
+        The parsed document itself is left unchanged.
+
+        :param texts: The new texts, one for each <text> tag.
+        :return: The resulting xml.
+        :raises ValueError: If the number of texts doesn't match the number of <text> tags.
+        """
+        if len(texts) != len(self.text_nodes):
+            raise ValueError(
+                f"Expected {len(self.text_nodes)} texts for {self.path.name}, got {len(texts)}."
+            )
+        if self.root is None:
+            return self.text
+
+        originals = [node.text for node in self.text_nodes]
+        try:
+            for node, text in zip(self.text_nodes, texts):
+                node.text = text
+            return etree.tostring(
+                self.root.getroottree(), encoding="UTF-8", xml_declaration=True
+            ).decode("utf-8")
+        finally:
+            for node, text in zip(self.text_nodes, originals):
+                node.text = text
 
     @property
     def char_count(self) -> None:
-        return sum(len(text) for text in self.get_texts(self.text))
+        # The texts were already extracted, so there is nothing to parse here.
+        return sum(len(text) for text in self.get_texts())
 
 
 @define
@@ -229,6 +554,10 @@ class EpubFile(InputFile):
     """
     Epub file support works by unzipping the file to a cache directory and then
     processing the html and toc files like text files.
+
+    The cache is keyed by the contents of the epub, so it can be shared across sessions.
+    Each book gets a directory with the extracted files, and the prepared html and css texts
+    for every combination of preparation options that was used.
     """
 
     cache_dir: Path | None = None
@@ -237,11 +566,54 @@ class EpubFile(InputFile):
     toc_file: TocNCXFile | None = None
     initialized: bool = False
     cover_image: Path | None = None
+    estimated_char_count: int = 0
+    package: xml_parser.EpubPackage | None = None
 
     def __attrs_post_init__(self) -> None:
         InputFile.__attrs_post_init__(self)
-        self.cache_dir = Path(self.cache_dir) / self.path.stem
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.scan()
+
+    def scan(self) -> None:
+        """
+        Cheaply gather what is needed to display the file before it is initialized.
+        Only the package document and the zip's central directory are read, the char count
+        is extrapolated from the largest chapter, and just the cover image gets extracted.
+        This also moves the cache directory to the one for this book's contents.
+
+        :raises ValueError: If the file isn't a valid epub.
+        """
+        try:
+            with zipfile.ZipFile(self.path, "r") as epub_zip:
+                book_cache_dir = Path(self.cache_dir) / epub_content_key(epub_zip)
+                self.cache_dir = book_cache_dir / "files"
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                # Mark the cache as recently used.
+                os.utime(book_cache_dir)
+
+                self.package = xml_parser.parse_epub_package(epub_zip)
+                member_sizes = {info.filename: info.file_size for info in epub_zip.infolist()}
+                spine_sizes = {
+                    path: member_sizes[path] for path in self.package.spine if path in member_sizes
+                }
+                if spine_sizes:
+                    sample_path = max(spine_sizes, key=spine_sizes.get)
+                    sample = epub_zip.read(sample_path).decode("utf-8", errors="replace")
+                    chars_per_byte = xml_parser.estimate_char_count(sample) / max(
+                        spine_sizes[sample_path], 1
+                    )
+                    self.estimated_char_count = round(sum(spine_sizes.values()) * chars_per_byte)
+
+                cover_path = self.package.cover_path
+                if cover_path is not None and cover_path in member_sizes:
+                    epub_zip.extract(cover_path, self.cache_dir)
+                    self.cover_image = Path(cover_path)
+                elif cover_path is not None:
+                    # The cover image may be referenced, but missing. That's not fatal.
+                    logger.warning(f"Cover image {cover_path} missing in {self.path.name}")
+        except (zipfile.BadZipFile, KeyError, IndexError, etree.XMLSyntaxError) as e:
+            raise ValueError(f"{self.path.name} isn't a valid epub file: {e}") from e
+
+        logger.debug(f"Scanned {self.path.name}, estimated {self.estimated_char_count} chars.")
 
     def initialize_files(
         self,
@@ -251,50 +623,144 @@ class EpubFile(InputFile):
         crush_html: bool,
         make_text_horizontal: bool,
         ignore_empty: bool,
+        progress_callback: Callable[[int, int], None] | None = None,
+        check_aborted: Callable[[], None] | None = None,
     ):
         """
         Apply heuristic improvements to html files.
+        The files are only assigned once they are all prepared, so if aborted,
+        the epub stays uninitialized and nothing half-prepared is kept in memory.
+
+        :param progress_callback: [Optional] Called with the number of prepared html files and the total.
+        :param check_aborted: [Optional] Called regularly, raises an exception to stop preparing.
         """
 
         if self.initialized:
             return
 
+        prepared_dir = self.prepared_cache_dir(
+            nuke_ruby=nuke_ruby,
+            nuke_indents=nuke_indents,
+            nuke_kobo=nuke_kobo,
+            crush_html=crush_html,
+            make_text_horizontal=make_text_horizontal,
+            ignore_empty=ignore_empty,
+        )
+        if self.load_prepared_files(prepared_dir):
+            logger.debug(f"Loaded {self.path.name} from the cache.")
+            self.initialized = True
+            return
+
         logger.debug(f"Initializing {self.path.name}...")
 
-        self.html_files, self.css_files, self.toc_file, self.cover_image = extract_epub(
-            self.path, self.cache_dir
+        html_files, css_files, toc_file = extract_epub(
+            self.path, self.cache_dir, self.package, check_aborted
         )
 
-        # Ignore files that contain no actual text (tags aside).
-        logger.debug(f"Found {len(self.html_files)} html files in {self.path}")
+        logger.debug(f"Found {len(html_files)} html files in {self.path}")
 
+        # Ignore files that contain no actual text (tags aside).
+        html_files = prepare_html_files(
+            html_files,
+            ignore_empty,
+            nuke_ruby,
+            nuke_indents,
+            nuke_kobo,
+            crush_html,
+            progress_callback,
+            check_aborted=check_aborted,
+        )
         if ignore_empty:
-            self.html_files = [
-                file for file in self.html_files if xml_parser.html_contains_text(file.text)
-            ]
-            logger.debug(f"Found {len(self.html_files)} html files with text in {self.path}")
-
-        # Sort the html files by file name.
-        self.html_files.sort(key=lambda f: f.path.name)
-
-        for html_file in self.html_files:
-            html_file.prepare_text(nuke_ruby, nuke_indents, nuke_kobo, crush_html)
+            logger.debug(f"Found {len(html_files)} html files with text in {self.path}")
 
         if make_text_horizontal:
             logger.debug(f"Making text horizontal in {self.path.name}...")
-            for css_file in self.css_files:
+            for css_file in css_files:
                 css_file.text = re.sub(
                     r"writing-mode:\s*vertical-rl;", "writing-mode: horizontal-tb;", css_file.text
                 )
 
+        self.html_files, self.css_files, self.toc_file = html_files, css_files, toc_file
+
+        try:
+            self.save_prepared_files(prepared_dir)
+        except OSError as e:
+            # The cache is merely a speed up.
+            logger.warning(f"Failed to cache the prepared files of {self.path.name}: {e}")
+
         self.initialized = True
 
+    def prepared_cache_dir(self, **options: bool) -> Path:
+        """
+        Get the cache directory for the prepared files, based on the preparation options.
+
+        :param options: The options passed to initialize_files.
+        :return: The directory to store the prepared files in.
+        """
+        key_data = json.dumps([PREPARED_CACHE_VERSION, options], sort_keys=True)
+        key = hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:16]
+        return self.cache_dir.parent / "prepared" / key
+
+    def load_prepared_files(self, prepared_dir: Path) -> bool:
+        """
+        Restore the html, css and toc files from the cache, if they were prepared before.
+
+        :param prepared_dir: The cache directory for the prepared files.
+        :return: True if the files were restored.
+        """
+        index_path = prepared_dir / PREPARED_INDEX_NAME
+        if not index_path.is_file():
+            return False
+        try:
+            index = json.loads(index_path.read_text(encoding="utf8"))
+            html_files = [
+                HTMLFile(self.cache_dir / name, (prepared_dir / name).read_text(encoding="utf8"))
+                for name in index["html"]
+            ]
+            css_files = [
+                CSSFile(self.cache_dir / name, (prepared_dir / name).read_text(encoding="utf8"))
+                for name in index["css"]
+            ]
+            toc_file = TocNCXFile(self.cache_dir / index["toc"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Failed to load the cached files of {self.path.name}: {e}")
+            return False
+
+        self.html_files, self.css_files, self.toc_file = html_files, css_files, toc_file
+        return True
+
+    def save_prepared_files(self, prepared_dir: Path) -> None:
+        """
+        Store the prepared html and css files in the cache.
+        The index is written last, so a partially written cache is never used.
+
+        :param prepared_dir: The cache directory for the prepared files.
+        """
+        for file in self.html_files + self.css_files:
+            path = prepared_dir / file.path.relative_to(self.cache_dir)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(file.text, encoding="utf8")
+
+        index = {
+            "html": [f.path.relative_to(self.cache_dir).as_posix() for f in self.html_files],
+            "css": [f.path.relative_to(self.cache_dir).as_posix() for f in self.css_files],
+            "toc": self.toc_file.path.relative_to(self.cache_dir).as_posix(),
+        }
+        temp_path = prepared_dir / (PREPARED_INDEX_NAME + ".tmp")
+        temp_path.write_text(json.dumps(index), encoding="utf8")
+        os.replace(temp_path, prepared_dir / PREPARED_INDEX_NAME)
+
     @property
     def char_count(self) -> None:
+        if not self.initialized:
+            return self.estimated_char_count
         return sum(f.char_count for f in self.html_files)
 
     @property
     def process_level(self) -> None:
+        # Nothing can have been processed before the html files were loaded.
+        if not self.initialized:
+            return ProcessLevel.RAW
         if all(f.process_level == ProcessLevel.GLOSSARY for f in self.html_files):
             return ProcessLevel.GLOSSARY
         else:
@@ -318,39 +784,25 @@ class EpubFile(InputFile):
     def file_count(self) -> None:
         return len(self.html_files) + 1  # +1 for the toc file.
 
-    def write_to_cache(self, process_level: ProcessLevel) -> None:
-        """
-        Write the current text of the given process level to the cache folder.
-        """
-        self.html_files: list[XMLFile]
-        self.toc_file: XMLFile
-
-        xml_files: list[XMLFile] = [self.toc_file] + self.html_files
-        for xml_file in xml_files:
-            if process_level == ProcessLevel.RAW:
-                text = xml_file.text
-            elif process_level == ProcessLevel.GLOSSARY:
-                text = xml_file.text_glossary
-            elif process_level == ProcessLevel.TRANSLATED:
-                text = xml_file.translation
-            else:
-                raise ValueError(f"Invalid process level: {process_level}")
-
-            xml_file.path.write_text(text, encoding="utf8")
-
-        for css_file in self.css_files:
-            css_file.path.write_text(css_file.text, encoding="utf8")
-
     def write(self, process_level: ProcessLevel, output_path: Path) -> None:
         """
         Write the current text of the given process level to the output file.
+        For translations, files that weren't translated keep their current text.
 
         :param process_level: The process level to write. Options are RAW, GLOSSARY, and TRANSLATED.
         :param output_path: The path to write the file to.
         """
-        self.write_to_cache(process_level)
-        # Rebuild the epub file.
-        ut.zip_folder_to_epub(self.cache_dir, output_path)
+        writer = EpubStreamWriter(self, output_path)
+        if process_level in (ProcessLevel.RAW, ProcessLevel.GLOSSARY):
+            for xml_file in [self.toc_file] + self.html_files:
+                if process_level == ProcessLevel.RAW:
+                    writer.write_file(xml_file, xml_file.text)
+                else:
+                    writer.write_file(xml_file, xml_file.text_glossary)
+        elif process_level != ProcessLevel.TRANSLATED:
+            writer.discard()
+            raise ValueError(f"Invalid process level: {process_level}")
+        writer.finalize()
 
     def clear_translations(self) -> None:
         for f in self.html_files:
@@ -358,41 +810,288 @@ class EpubFile(InputFile):
         self.toc_file.clear_translations()
 
 
+# Bump this when the preparation of html files changes, to invalidate cached results.
+PREPARED_CACHE_VERSION = 1
+PREPARED_INDEX_NAME = "index.json"
+
+
+def epub_content_key(epub_zip: zipfile.ZipFile) -> str:
+    """
+    Derive a cache key from the contents of an epub.
+    The zip's central directory already holds a checksum of every member, so hashing it
+    identifies the contents without having to read the whole file.
+
+    :param epub_zip: The opened epub archive.
+    :return: The hex digest identifying the contents.
+    """
+    content_hash = hashlib.sha256()
+    for info in epub_zip.infolist():
+        content_hash.update(f"{info.filename}\0{info.CRC}\0{info.file_size}\n".encode("utf-8"))
+    return content_hash.hexdigest()[:32]
+
+
+# Below this many html files, the overhead of starting worker processes isn't worth it.
+MIN_FILES_FOR_POOL = 8
+
+# Starting the processes and importing the html libraries in each is slow, so the pool is
+# created on first use and kept until the program exits.
+_html_pool: ProcessPoolExecutor | None = None
+_html_pool_workers = 0
+_html_pool_lock = threading.Lock()
+
+
+def get_html_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Get the shared process pool for preparing html files, creating it if needed.
+    It is only replaced if more workers are requested than it has.
+
+    :param workers: The number of processes needed.
+    :return: The pool.
+    """
+    global _html_pool, _html_pool_workers
+    with _html_pool_lock:
+        if _html_pool is not None and _html_pool_workers < workers:
+            _html_pool.shutdown(wait=False)
+            _html_pool = None
+        if _html_pool is None:
+            logger.debug(f"Starting a process pool with {workers} processes.")
+            # Don't fork, since this is called from a thread of a multithreaded gui application.
+            _html_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _html_pool_workers = workers
+        return _html_pool
+
+
+@atexit.register
+def shutdown_html_pool() -> None:
+    """
+    Stop the processes of the shared pool, if it was started.
+    """
+    global _html_pool
+    with _html_pool_lock:
+        if _html_pool is not None:
+            _html_pool.shutdown(cancel_futures=True)
+            _html_pool = None
+
+
+@trc.traced("html_preparation", "preprocessing")
+def prepare_html_files(
+    html_files: list[HTMLFile],
+    ignore_empty: bool,
+    nuke_ruby: bool,
+    nuke_indents: bool,
+    nuke_kobo: bool,
+    crush_html: bool,
+    progress_callback: Callable[[int, int], None] | None = None,
+    max_workers: int | None = None,
+    check_aborted: Callable[[], None] | None = None,
+) -> list[HTMLFile]:
+    """
+    Prepare the html files of an epub, fanning the work out across a process pool.
+    Results are gathered in the original order.
+
+    :param html_files: The html files to prepare.
+    :param ignore_empty: Whether to drop files that contain no actual text.
+    :param nuke_ruby: Whether to remove ruby tags.
+    :param nuke_indents: Whether to flatten indents.
+    :param nuke_kobo: Whether to strip Kobo spans.
+    :param crush_html: Whether to minify the html.
+    :param progress_callback: [Optional] Called with the number of prepared files and the total.
+    :param max_workers: [Optional] The number of processes to use. Defaults to the cpu count.
+    :param check_aborted: [Optional] Called before each file, raises an exception to stop preparing.
+        Files the pool hasn't started on yet are cancelled then.
+    :return: The prepared html files, without the empty ones if they are to be ignored.
+    """
+    total = len(html_files)
+    job = partial(
+        xml_parser.prepare_html_job,
+        ignore_empty=ignore_empty,
+        nuke_ruby=nuke_ruby,
+        nuke_indents=nuke_indents,
+        nuke_kobo=nuke_kobo,
+        crush_html_text=crush_html,
+    )
+    texts = (file.text for file in html_files)
+
+    workers = min(total, max_workers or os.cpu_count() or 1)
+    if total < MIN_FILES_FOR_POOL or workers < 2:
+        logger.debug(f"Preparing {total} html files serially.")
+        results = map(job, texts)
+        futures: list[Future] = []
+    else:
+        logger.debug(f"Preparing {total} html files with {workers} processes.")
+        futures = [get_html_pool(workers).submit(job, text) for text in texts]
+        results = (future.result() for future in futures)
+
+    prepared_files = []
+    try:
+        for index, html_file in enumerate(html_files, start=1):
+            if check_aborted is not None:
+                check_aborted()
+            try:
+                text = next(results)
+            except BrokenProcessPool:
+                # A process died, so the pool can't be used anymore. Start over next time.
+                shutdown_html_pool()
+                raise
+            if text is not None:
+                logger.debug(
+                    f"Cleaned {html_file.path.name}, {len(html_file.text)} -> {len(text)}, "
+                    f"diff: {len(html_file.text) - len(text)}"
+                )
+                html_file.text = text
+                prepared_files.append(html_file)
+            if progress_callback is not None:
+                progress_callback(index, total)
+    finally:
+        # The pool is shared, so only this call's files that haven't started are cancelled.
+        for future in futures:
+            future.cancel()
+
+    return prepared_files
+
+
+@define
+class EpubStreamWriter:
+    """
+    Incrementally writes an epub file, adding each file as soon as it is ready.
+    The archive is written to a temporary .part file next to the output path and closed after
+    every addition, so it remains a readable (partial) epub should the program crash.
+    Finalizing adds everything that wasn't written yet and atomically moves it into place.
+    """
+
+    epub_file: EpubFile
+    output_path: Path
+    temp_path: Path | None = None
+    written: set[str] = Factory(set)  # Archive names that were already added.
+
+    def __attrs_post_init__(self) -> None:
+        self.temp_path = self.output_path.with_name(self.output_path.name + ".part")
+        self.temp_path.parent.mkdir(parents=True, exist_ok=True)
+        # The mimetype must be the first file and may not be compressed.
+        with zipfile.ZipFile(self.temp_path, "w", compression=zipfile.ZIP_DEFLATED) as epub_zip:
+            epub_zip.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        self.written.add("mimetype")
+
+    def write_file(self, file: XMLFile | CSSFile, text: str) -> None:
+        """
+        Add a file of the epub to the archive.
+
+        :param file: The file to add, located in the epub's cache directory.
+        :param text: The text to write for it.
+        """
+        name = file.path.relative_to(self.epub_file.cache_dir).as_posix()
+        if name in self.written:
+            logger.warning(f"{name} was already written to {self.temp_path.name}, skipping.")
+            return
+        with zipfile.ZipFile(self.temp_path, "a", compression=zipfile.ZIP_DEFLATED) as epub_zip:
+            epub_zip.writestr(name, text)
+        self.written.add(name)
+
+    def finalize(self, output_path: Path | None = None) -> Path:
+        """
+        Add the remaining files and move the archive to the output path.
+        The toc and html files get their translation, if they have one, otherwise their current text.
+        Everything else is copied from the original epub unchanged.
+
+        :param output_path: [Optional] The final path, if it differs from the initial output path.
+        :return: The path the epub was written to.
+        """
+        if output_path is None:
+            output_path = self.output_path
+        epub = self.epub_file
+        xml_files: list[XMLFile] = [epub.toc_file] + epub.html_files
+        for xml_file in xml_files:
+            self.write_file(xml_file, xml_file.translation or xml_file.current_text())
+        for css_file in epub.css_files:
+            self.write_file(css_file, css_file.text)
+
+        with (
+            zipfile.ZipFile(self.temp_path, "a", compression=zipfile.ZIP_DEFLATED) as epub_zip,
+            zipfile.ZipFile(epub.path, "r") as source_zip,
+        ):
+            for info in source_zip.infolist():
+                if info.is_dir() or info.filename in self.written:
+                    continue
+                epub_zip.writestr(info, source_zip.read(info))
+                self.written.add(info.filename)
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(self.temp_path, output_path)
+        logger.info(f"Wrote epub {output_path}")
+        return output_path
+
+    def discard(self) -> None:
+        """
+        Delete the partial archive.
+        """
+        self.temp_path.unlink(missing_ok=True)
+
+
+@trc.traced("epub_extraction", "io")
 def extract_epub(
-    epub_path: Path, cache_dir: Path
-) -> tuple[list[HTMLFile], list[CSSFile], TocNCXFile, Path | None]:
+    epub_path: Path,
+    cache_dir: Path,
+    package: xml_parser.EpubPackage | None = None,
+    check_aborted: Callable[[], None] | None = None,
+) -> tuple[list[HTMLFile], list[CSSFile], TocNCXFile]:
     """
     Extract the epub file to the cache directory and return a list of XMLFile
     objects representing the html files.
+    The html files are ordered by the spine of the package document, so in reading order.
+    Should the package document be unusable, fall back to searching the extracted files.
+
+    :param epub_path: The path to the epub file.
+    :param cache_dir: The directory to extract to.
+    :param package: [Optional] The already parsed package document, to avoid parsing it again.
+    :param check_aborted: [Optional] Called before each member, raises an exception to stop extracting.
+    :return: The html files, css files and the toc file.
     """
     logger.debug(f"Extracting {epub_path} to {cache_dir}")
 
     with zipfile.ZipFile(epub_path, "r") as epub_zip:
-        epub_zip.extractall(cache_dir)
+        for member in epub_zip.infolist():
+            if check_aborted is not None:
+                check_aborted()
+            epub_zip.extract(member, cache_dir)
+        if package is None:
+            try:
+                package = xml_parser.parse_epub_package(epub_zip)
+            except (KeyError, IndexError, etree.XMLSyntaxError) as e:
+                logger.warning(f"Failed to parse the package document of {epub_path}: {e}")
+        member_names = set(epub_zip.namelist())
 
     html_files = []
     css_files = []
     toc_file = None
-    # Find .html and .toc files in all subfolders.
-    for xml_path in cache_dir.glob("**/*"):
-        if xml_path.suffix in (".html", ".xhtml"):
-            html_files.append(HTMLFile(xml_path))
-        elif xml_path.suffix == ".css":
-            css_files.append(CSSFile(xml_path))
-        elif xml_path.suffix == ".ncx":
-            toc_file = TocNCXFile(xml_path)
+    if package is not None:
+        # Skip anything the manifest lists, but the archive lacks.
+        html_files = [
+            HTMLFile(cache_dir / path) for path in package.html_paths() if path in member_names
+        ]
+        css_files = [
+            CSSFile(cache_dir / path) for path in package.css_paths() if path in member_names
+        ]
+        if package.ncx_path in member_names:
+            toc_file = TocNCXFile(cache_dir / package.ncx_path)
+    else:
+        # Find .html and .toc files in all subfolders.
+        for xml_path in sorted(cache_dir.glob("**/*")):
+            if xml_path.suffix in (".html", ".xhtml"):
+                html_files.append(HTMLFile(xml_path))
+            elif xml_path.suffix == ".css":
+                css_files.append(CSSFile(xml_path))
+            elif xml_path.suffix == ".ncx":
+                toc_file = TocNCXFile(xml_path)
 
     if not toc_file:
         raise ValueError(
             f"No table of contents toc.ncx file found in {epub_path}. This isn't a valid epub file."
         )
 
-    # Find cover of the epub using the metadata.
-    cover_image = xml_parser.get_epub_cover(epub_path)
-    logger.debug(f"Found cover image {cover_image} in {epub_path}")
-
     logger.debug(f"Extracted {len(html_files)} html and toc files.")
-    return html_files, css_files, toc_file, cover_image
+    return html_files, css_files, toc_file
 
 
 @define
@@ -0,0 +1,259 @@
+"""
+A model of how long translation requests take, used to estimate the remaining time.
+
+Each request is assumed to cost a fixed overhead plus a cost per character:
+
+    seconds = request_cost + char_cost * chars
+
+Both are fitted by least squares to the most recent requests, separately for each backend,
+language pair and content type, since for example html takes longer per character than plain text.
+Requests that run concurrently overlap, so the estimate divides them up into waves.
+The samples are persisted in the cache directory, so the estimates carry over between sessions.
+"""
+
+import json
+import os
+import threading
+from enum import StrEnum
+from math import ceil
+from pathlib import Path
+
+from attrs import define, frozen, Factory
+from loguru import logger
+
+# Only the most recent requests are kept, so the model follows changes in the backend's speed.
+MAX_SAMPLES = 200
+# Fewer samples than this are too noisy to tell the request cost from the char cost.
+MIN_SAMPLES_TO_FIT = 3
+FILE_VERSION = 1
+
+
+class ContentType(StrEnum):
+    TEXT = "text"
+    HTML = "html"
+
+
+@frozen
+class Sample:
+    chars: int
+    seconds: float
+
+
+@frozen
+class Fit:
+    request_cost: float  # Seconds per request.
+    char_cost: float  # Seconds per character.
+    mean_request_chars: float  # Characters per request, to guess how many requests are needed.
+
+    def request_seconds(self, chars: float) -> float:
+        return self.request_cost + self.char_cost * chars
+
+
+@define
+class Profile:
+    """
+    The recent requests of one backend, language pair and content type.
+    """
+
+    samples: list[Sample] = Factory(list)
+    concurrency: int = 1  # Of the most recent request.
+
+    def add(self, sample: Sample) -> None:
+        self.samples.append(sample)
+        del self.samples[:-MAX_SAMPLES]
+
+    def fit(self) -> Fit | None:
+        return fit_samples(self.samples)
+
+
+def fit_samples(samples: list[Sample]) -> Fit | None:
+    """
+    Fit the request and char costs to the samples.
+    Without enough spread in the request sizes, the time is attributed to the chars alone.
+    Negative costs, which noise can produce, are clamped to 0.
+
+    :param samples: The samples to fit.
+    :return: The fit, or None if there is nothing to fit.
+    """
+    samples = [sample for sample in samples if sample.chars > 0]
+    if not samples:
+        return None
+    count = len(samples)
+    total_chars = sum(sample.chars for sample in samples)
+    total_seconds = sum(sample.seconds for sample in samples)
+    mean_chars = total_chars / count
+    mean_seconds = total_seconds / count
+
+    variance = sum((sample.chars - mean_chars) ** 2 for sample in samples)
+    if count >= MIN_SAMPLES_TO_FIT and variance > 0:
+        covariance = sum(
+            (sample.chars - mean_chars) * (sample.seconds - mean_seconds) for sample in samples
+        )
+        char_cost = covariance / variance
+        request_cost = mean_seconds - char_cost * mean_chars
+        if char_cost < 0:
+            return Fit(max(mean_seconds, 0), 0, mean_chars)
+        if request_cost >= 0:
+            return Fit(request_cost, char_cost, mean_chars)
+
+    return Fit(0, max(total_seconds / total_chars, 0), mean_chars)
+
+
+def profile_key(backend: str, lang_from: str, lang_to: str, content_type: ContentType) -> str:
+    """
+    The key to store a profile under.
+    An empty source language means it is detected automatically.
+    """
+    return "|".join((str(backend), lang_from or "auto", lang_to, str(content_type)))
+
+
+class ThroughputModel:
+    """
+    Records the duration of requests from any thread, and estimates future ones.
+    """
+
+    path: Path | None
+    profiles: dict[str, Profile]
+
+    def __init__(self, path: Path | None = None) -> None:
+        """
+        :param path: [Optional] The file to persist the samples in.
+        """
+        self.path = path
+        self.profiles = {}
+        self._lock = threading.Lock()
+        # The fits by profile key, until the next request is recorded.
+        # Estimates are refreshed on every progress update, refitting each time adds up.
+        self._fits: dict[str, tuple[Fit, int] | None] = {}
+
+    def record(self, key: str, chars: int, seconds: float, concurrency: int = 1) -> None:
+        """
+        Record a finished request.
+
+        :param key: The profile key, see profile_key.
+        :param chars: The number of characters translated.
+        :param seconds: How long the request took, not counting the time waiting for a slot.
+        :param concurrency: [Optional] How many requests were allowed in flight at once.
+        """
+        if chars <= 0 or seconds < 0:
+            return
+        with self._lock:
+            profile = self.profiles.setdefault(key, Profile())
+            profile.add(Sample(chars, seconds))
+            profile.concurrency = max(1, concurrency)
+            # Profiles without samples fall back on the others, so any fit may change.
+            self._fits.clear()
+
+    def fit(self, key: str) -> tuple[Fit, int] | None:
+        """
+        Fit the profile, falling back on the other language pairs of the backend and
+        content type if the profile has no samples yet.
+
+        :param key: The profile key.
+        :return: The fit and the concurrency, or None if nothing is known.
+        """
+        with self._lock:
+            if key not in self._fits:
+                self._fits[key] = self.fit_profile(key)
+            return self._fits[key]
+
+    def fit_profile(self, key: str) -> tuple[Fit, int] | None:
+        profile = self.profiles.get(key)
+        if profile is not None and profile.samples:
+            return profile.fit(), profile.concurrency
+
+        backend, _, _, content_type = key.split("|")
+        similar = [
+            profile
+            for other_key, profile in self.profiles.items()
+            if other_key.startswith(backend + "|") and other_key.endswith("|" + content_type)
+        ]
+        samples = [sample for profile in similar for sample in profile.samples]
+        if not samples:
+            return None
+        return fit_samples(samples), max(profile.concurrency for profile in similar)
+
+    def estimate(self, key: str, chars: int, requests: int | None = None) -> float | None:
+        """
+        Estimate how long translating the characters takes.
+
+        :param key: The profile key.
+        :param chars: The number of characters.
+        :param requests: [Optional] The number of requests, estimated from the
+            average request size if not given.
+        :return: The estimate in seconds, or None if nothing is known about the profile.
+        """
+        if chars <= 0:
+            return 0.0
+        fitted = self.fit(key)
+        if fitted is None:
+            return None
+        fit, concurrency = fitted
+        if requests is None:
+            requests = ceil(chars / max(fit.mean_request_chars, 1))
+        requests = max(1, requests)
+        # Requests run in waves of up to the concurrency, each as long as one request.
+        return ceil(requests / concurrency) * fit.request_seconds(chars / requests)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "version": FILE_VERSION,
+                "profiles": {
+                    key: {
+                        "concurrency": profile.concurrency,
+                        "samples": [[sample.chars, sample.seconds] for sample in profile.samples],
+                    }
+                    for key, profile in self.profiles.items()
+                },
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict, path: Path | None = None) -> "ThroughputModel":
+        model = cls(path)
+        if data.get("version") != FILE_VERSION:
+            return model
+        for key, profile_data in data["profiles"].items():
+            profile = Profile(concurrency=int(profile_data["concurrency"]))
+            for chars, seconds in profile_data["samples"][-MAX_SAMPLES:]:
+                if chars > 0:
+                    profile.add(Sample(int(chars), float(seconds)))
+            model.profiles[key] = profile
+        return model
+
+    @classmethod
+    def load(cls, path: Path) -> "ThroughputModel":
+        """
+        Load the model from the file. A missing or broken file gives an empty model.
+
+        :param path: The file the samples are persisted in.
+        :return: The model, saving to the same file.
+        """
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return cls.from_dict(json.load(file), path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Failed to load the throughput model from {path}: {e}")
+        return cls(path)
+
+    def save(self) -> bool:
+        """
+        Write to a temporary file and then move it to the destination.
+
+        :return: True if the model was written successfully, False otherwise.
+        """
+        if self.path is None:
+            return False
+        temp_path = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self.to_dict(), file)
+            os.replace(temp_path, self.path)
+            return True
+        except OSError as e:
+            logger.error(f"Failed to save the throughput model to {self.path}: {e}")
+            temp_path.unlink(missing_ok=True)
+            return False
@@ -0,0 +1,297 @@
+"""
+Lightweight timing instrumentation for the stages of a run.
+
+Code wraps each stage in a span, or decorates the function doing it:
+
+    with trc.span("partition", file=path.name):
+        ...
+
+    @trc.traced("glossary")
+    def process_text(...):
+        ...
+
+Stages that overlap on one thread, such as the requests of concurrent coroutines, use async
+spans instead, which are shown on a track of their own:
+
+    with trc.async_span("api_request", "network"):
+        await ...
+
+Spans are recorded from any thread into the global tracer. At the end of a translation run,
+the recorded spans are exported into the log directory, as a Chrome trace that can be opened
+with chrome://tracing or https://ui.perfetto.dev, and as a plain summary table.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator
+
+from attrs import define, frozen
+from loguru import logger
+
+# Beyond this, further spans are dropped, so a huge batch can't exhaust the memory.
+MAX_SPANS = 200_000
+# The number of exported runs to keep in the trace directory.
+KEEP_EXPORTS = 10
+
+
+@frozen
+class Span:
+    name: str
+    category: str
+    start: float  # In seconds, from time.perf_counter.
+    duration: float  # In seconds.
+    thread_id: int
+    thread_name: str
+    args: dict
+    # Set for async spans, which may overlap others on the same thread.
+    async_id: int | None = None
+
+
+@define
+class StageSummary:
+    name: str
+    count: int = 0
+    total: float = 0.0  # In seconds.
+    longest: float = 0.0  # In seconds.
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class Tracer:
+    """
+    Collects spans from any thread.
+    """
+
+    enabled: bool
+    max_spans: int
+    origin: float  # The time the trace starts at.
+    dropped: int
+
+    def __init__(self, max_spans: int = MAX_SPANS) -> None:
+        self.enabled = True
+        self.max_spans = max_spans
+        self._spans: list[Span] = []
+        self._lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.dropped = 0
+        self._async_ids = itertools.count(1)
+
+    @contextmanager
+    def span(self, name: str, category: str = "", **args) -> Iterator[None]:
+        """
+        Time the enclosed block. Spans that raise are recorded too, with the exception's name.
+
+        :param name: The name of the stage.
+        :param category: [Optional] The category of the stage.
+        :param args: [Optional] Details to show with the span, such as the file name.
+        """
+        with self.timed(name, category, args, None):
+            yield
+
+    @contextmanager
+    def async_span(self, name: str, category: str = "", **args) -> Iterator[None]:
+        """
+        Time the enclosed block like span, for blocks that may overlap on the same thread,
+        such as the requests awaited by concurrent coroutines.
+
+        :param name: The name of the stage.
+        :param category: [Optional] The category of the stage.
+        :param args: [Optional] Details to show with the span, such as the file name.
+        """
+        with self.timed(name, category, args, next(self._async_ids)):
+            yield
+
+    @contextmanager
+    def timed(self, name: str, category: str, args: dict, async_id: int | None) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            thread = threading.current_thread()
+            self.add(
+                Span(
+                    name,
+                    category,
+                    start,
+                    time.perf_counter() - start,
+                    thread.ident,
+                    thread.name,
+                    args,
+                    async_id,
+                )
+            )
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            if len(self._spans) >= self.max_spans:
+                self.dropped += 1
+                return
+            self._spans.append(span)
+
+    def spans(self) -> list[Span]:
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+            self.dropped = 0
+            self.origin = time.perf_counter()
+
+    def chrome_trace(self) -> dict:
+        """
+        Convert the spans to the Chrome trace event format, which Perfetto reads as well.
+
+        :return: The trace, ready to be dumped as json.
+        """
+        pid = os.getpid()
+        events = []
+        thread_names = {}
+        for span in self.spans():
+            thread_names[span.thread_id] = span.thread_name
+            event = {
+                "name": span.name,
+                "cat": span.category or "stage",
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1_000_000, 3),
+                "dur": round(span.duration * 1_000_000, 3),
+                "pid": pid,
+                "tid": span.thread_id,
+                "args": {key: json_safe(value) for key, value in span.args.items()},
+            }
+            if span.async_id is None:
+                events.append(event)
+                continue
+            # Complete events on one thread must nest, so overlapping spans are exported as
+            # the begin and end of an async slice, paired up by their id.
+            del event["dur"]
+            event["id"] = span.async_id
+            events.append(event | {"ph": "b"})
+            end = span.start + span.duration
+            events.append(
+                event | {"ph": "e", "ts": round((end - self.origin) * 1_000_000, 3), "args": {}}
+            )
+        for thread_id, thread_name in thread_names.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": thread_id,
+                    "args": {"name": thread_name},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self) -> list[StageSummary]:
+        """
+        Sum up the time spent in each stage.
+
+        :return: The stages, the most time consuming first.
+        """
+        stages: dict[str, StageSummary] = {}
+        for span in self.spans():
+            stage = stages.setdefault(span.name, StageSummary(span.name))
+            stage.count += 1
+            stage.total += span.duration
+            stage.longest = max(stage.longest, span.duration)
+        return sorted(stages.values(), key=lambda stage: stage.total, reverse=True)
+
+    def format_summary(self) -> str:
+        """
+        Format the summary as a plain text table.
+        Note that stages may overlap, when they run in parallel or are nested.
+        """
+        stages = self.summary()
+        width = max([len("Stage")] + [len(stage.name) for stage in stages])
+        lines = [f"{'Stage':<{width}}  {'Count':>7}  {'Total s':>9}  {'Mean ms':>9}  {'Max ms':>9}"]
+        for stage in stages:
+            lines.append(
+                f"{stage.name:<{width}}  {stage.count:>7}  {stage.total:>9.3f}  "
+                f"{stage.mean * 1000:>9.2f}  {stage.longest * 1000:>9.2f}"
+            )
+        if self.dropped:
+            lines.append(f"({self.dropped} spans dropped after the first {self.max_spans})")
+        return "\n".join(lines)
+
+    def export(self, directory: Path, stem: str, keep: int = KEEP_EXPORTS) -> tuple[Path, Path]:
+        """
+        Write the Chrome trace and the summary table, pruning the oldest exports.
+
+        :param directory: The directory to write to.
+        :param stem: The file name, without extension.
+        :param keep: [Optional] The number of exports to keep in the directory.
+        :return: The paths of the trace and the summary.
+        """
+        directory.mkdir(parents=True, exist_ok=True)
+        trace_path = directory / f"{stem}.trace.json"
+        summary_path = directory / f"{stem}.summary.txt"
+        trace_path.write_text(json.dumps(self.chrome_trace()), encoding="utf-8")
+        summary_path.write_text(self.format_summary() + "\n", encoding="utf-8")
+
+        traces = sorted(directory.glob("*.trace.json"), key=lambda path: path.stat().st_mtime)
+        for old_trace in traces[:-keep] if keep > 0 else traces:
+            old_stem = old_trace.name.removesuffix(".trace.json")
+            old_trace.unlink(missing_ok=True)
+            (directory / f"{old_stem}.summary.txt").unlink(missing_ok=True)
+
+        logger.info(f"Exported the stage timings to {trace_path}")
+        return trace_path, summary_path
+
+
+def json_safe(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+# The tracer all stages report to.
+tracer = Tracer()
+
+
+def span(name: str, category: str = "", **args):
+    """
+    Time the enclosed block with the global tracer, see Tracer.span.
+    """
+    return tracer.span(name, category, **args)
+
+
+def async_span(name: str, category: str = "", **args):
+    """
+    Time the enclosed block with the global tracer, see Tracer.async_span.
+    """
+    return tracer.async_span(name, category, **args)
+
+
+def traced(name: str, category: str = "") -> Callable[[Callable], Callable]:
+    """
+    Time every call of the decorated function with the global tracer.
+    Calls in other processes, such as those of a process pool, aren't recorded.
+
+    :param name: The name of the stage.
+    :param category: [Optional] The category of the stage.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, category):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,194 @@
+"""
+Schedules translation work against any backend.
+Texts are batched into as few requests as the backend's capabilities allow,
+and the requests run concurrently if the backend supports it.
+Requests the backend is rate limited on are retried after a delay.
+"""
+
+import asyncio
+import time
+from typing import Callable
+
+from loguru import logger
+
+import deepqt.backends.backend_interface as bi
+import deepqt.tracing as trc
+
+
+def make_batches(texts: list[str], capabilities: bi.BackendCapabilities) -> list[list[int]]:
+    """
+    Group the texts into requests, without exceeding the backend's limits.
+    Empty texts are left out, they needn't be translated.
+    A text exceeding the byte limit on its own gets a request to itself,
+    splitting it is up to the caller.
+
+    :param texts: The texts to translate.
+    :param capabilities: The capabilities of the backend.
+    :return: The indices of the texts in each batch, in order.
+    """
+    return make_size_batches([len(text.encode("utf-8")) for text in texts], capabilities)
+
+
+def make_size_batches(sizes: list[int], capabilities: bi.BackendCapabilities) -> list[list[int]]:
+    """
+    Group texts of the given sizes into requests, like make_batches.
+    Useful when only the sizes are known, such as when planning.
+
+    :param sizes: The size of each text, in UTF-8 bytes. Empty texts are left out.
+    :param capabilities: The capabilities of the backend.
+    :return: The indices of the texts in each batch, in order.
+    """
+    batches = []
+    batch = []
+    batch_bytes = 0
+    max_texts = max(1, capabilities.max_texts_per_request)
+    for index, text_bytes in enumerate(sizes):
+        if not text_bytes:
+            continue
+        if batch and (
+            len(batch) >= max_texts
+            or (
+                capabilities.max_request_bytes is not None
+                and batch_bytes + text_bytes > capabilities.max_request_bytes
+            )
+        ):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(index)
+        batch_bytes += text_bytes
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def concurrency(capabilities: bi.BackendCapabilities) -> int:
+    """
+    The number of requests to have in flight at once.
+    """
+    if not capabilities.supports_concurrency:
+        return 1
+    return max(1, capabilities.max_concurrency)
+
+
+def window_size(capabilities: bi.BackendCapabilities) -> int:
+    """
+    The number of texts that keeps every concurrent request busy.
+    Callers holding large amounts of text can feed the engine this many at a time.
+    """
+    return concurrency(capabilities) * max(1, capabilities.max_texts_per_request)
+
+
+class TranslationEngine:
+    """
+    Translates lists of texts with a backend, tuned to its capabilities.
+    """
+
+    backend: bi.Backend
+    capabilities: bi.BackendCapabilities
+    max_tries: int
+    retry_delay: float
+
+    def __init__(self, backend: bi.Backend, max_tries: int = 5, retry_delay: float = 5) -> None:
+        """
+        :param backend: The connected backend to translate with.
+        :param max_tries: [Optional] How often to send a request that is rate limited.
+        :param retry_delay: [Optional] The seconds to wait before sending it again.
+        """
+        self.backend = backend
+        self.capabilities = backend.capabilities()
+        self.max_tries = max_tries
+        self.retry_delay = retry_delay
+
+    def concurrency(self) -> int:
+        return concurrency(self.capabilities)
+
+    def window_size(self) -> int:
+        return window_size(self.capabilities)
+
+    async def translate_async(
+        self,
+        texts: list[str],
+        batch_done: Callable[[list[int], list[str]], None] | None = None,
+        check_aborted: Callable[[], None] | None = None,
+        request_timed: Callable[[list[int], float], None] | None = None,
+        is_html: bool = False,
+    ) -> list[str]:
+        """
+        Translate the texts, with as many requests in flight as the backend allows.
+        If any request fails, the others are cancelled and the error is raised.
+
+        :param texts: The texts to translate.
+        :param batch_done: [Optional] Called with the indices and translations of each
+            finished batch, in the order they finish.
+        :param check_aborted: [Optional] Called before each request, raising to abort.
+        :param request_timed: [Optional] Called with the indices of each successfully
+            translated batch and the seconds its request took.
+        :param is_html: [Optional] Whether the texts are html.
+        :return: The translations, in the same order as the texts.
+        """
+        translations = [""] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency())
+
+        async def run_batch(batch: list[int]) -> None:
+            async with semaphore:
+                tries = 1
+                while True:
+                    if check_aborted is not None:
+                        check_aborted()
+                    start = time.perf_counter()
+                    try:
+                        with trc.async_span("api_request", "network", texts=len(batch)):
+                            results = await self.backend.translate_texts_async(
+                                [texts[i] for i in batch], is_html
+                            )
+                        break
+                    except bi.TooManyRequests as e:
+                        if tries >= self.max_tries:
+                            logger.error(f"Too many requests, giving up after {tries} tries: {e}")
+                            raise
+                        logger.warning(
+                            f"Too many requests. Retrying in {self.retry_delay} seconds."
+                        )
+                        tries += 1
+                        await asyncio.sleep(self.retry_delay)
+                if request_timed is not None:
+                    request_timed(batch, time.perf_counter() - start)
+            if len(results) != len(batch):
+                raise bi.TranslationFailed(
+                    f"Expected {len(batch)} translations from the backend, got {len(results)}."
+                )
+            for index, result in zip(batch, results):
+                translations[index] = result
+            if batch_done is not None:
+                batch_done(batch, results)
+
+        batches = make_batches(texts, self.capabilities)
+        logger.debug(
+            f"Translating {len(texts)} texts in {len(batches)} requests, "
+            f"{self.concurrency()} at a time."
+        )
+        tasks = [asyncio.create_task(run_batch(batch)) for batch in batches]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return translations
+
+    def translate(
+        self,
+        texts: list[str],
+        batch_done: Callable[[list[int], list[str]], None] | None = None,
+        check_aborted: Callable[[], None] | None = None,
+        request_timed: Callable[[list[int], float], None] | None = None,
+        is_html: bool = False,
+    ) -> list[str]:
+        """
+        Blocking variant of translate_async, for use in worker threads.
+        """
+        return asyncio.run(
+            self.translate_async(texts, batch_done, check_aborted, request_timed, is_html)
+        )
@@ -1,21 +1,25 @@
+from __future__ import annotations
+
 import sys
-import time
 import traceback
 from enum import IntEnum, auto
 from math import ceil
 
-import deepl
 from PySide6.QtCore import QRunnable, Slot, Signal, QObject
 from loguru import logger
 
+import deepqt.backends.backend_interface as bi
 import deepqt.config as cfg
+import deepqt.deduplication as dd
+import deepqt.progress_aggregator as pa
 import deepqt.utils as ut
-import deepqt.quote_protection as qp
 import deepqt.structures as st
+import deepqt.throughput as tp
+import deepqt.translation_engine as te
+import deepqt.tracing as trc
 import deepqt.worker_thread as wt
 import deepqt.xml_parser as xp
 
-
 # The DeepL API requires a limit of 128kB per request.
 # Use 40kB to be safe. 70kB was apparently too much in some instances, despite the limit being set to 100kB.
 # API_MAX_BYTES = 100_000
@@ -56,12 +60,17 @@ class DeeplSignals(QObject):
 
     progress
         The file_id, progress message, processed chars, and total chars.
+        Only used if the worker has no progress aggregator to report to.
+
+    deduplicated
+        The number of chars that weren't sent, because they repeated earlier text.
 
     """
 
     result = Signal(State)
     error = Signal(wt.WorkerError)
     progress = Signal(str, str, int, int)
+    deduplicated = Signal(int)
 
 
 # noinspection PyUnresolvedReferences
@@ -82,30 +91,55 @@ class DeeplWorker(QRunnable):
 
     state: State
     current_file_id: str | None
-    translator: deepl.Translator
+    backend: bi.Backend
+    engine: te.TranslationEngine
     input_files: dict[str, st.InputFile]
     config: cfg.Config
+    epub_writers: dict[str, st.EpubStreamWriter]
+    text_writers: dict[str, st.TextStreamWriter]
+    progress: pa.ProgressAggregator | None
+    throughput: tp.ThroughputModel | None
+    deduplicator: dd.Deduplicator
     total_chars: int
     processed_chars: int
 
     def __init__(
-        self, translator: deepl.Translator, input_files: dict[str, st.InputFile], config: cfg.Config
+        self,
+        backend: bi.Backend,
+        input_files: dict[str, st.InputFile],
+        config: cfg.Config,
+        epub_writers: dict[str, st.EpubStreamWriter] | None = None,
+        text_writers: dict[str, st.TextStreamWriter] | None = None,
+        progress: pa.ProgressAggregator | None = None,
+        throughput: tp.ThroughputModel | None = None,
     ) -> None:
         """
         Initialise the worker thread.
 
-        :param translator: Pre-configured deepl translator.
+        :param backend: The connected backend to translate with.
         :param input_files: The input files to translate.
         :param config: The config to use.
+        :param epub_writers: [Optional] Writers to stream translated epub files to, by file id.
+        :param text_writers: [Optional] Writers to stream translated text files to, by file id.
+            Their chunks are postprocessed one by one, instead of joined into one translation.
+        :param progress: [Optional] The aggregator to report progress to, instead of emitting
+            a progress signal for every report.
+        :param throughput: [Optional] The model to record the duration of each request in.
         """
 
         QRunnable.__init__(self)
 
         self.state = State.WORKING
         self.current_file_id = None
-        self.translator = translator
+        self.backend = backend
+        self.engine = te.TranslationEngine(backend)
         self.input_files = input_files
         self.config = config
+        self.epub_writers = epub_writers if epub_writers is not None else {}
+        self.text_writers = text_writers if text_writers is not None else {}
+        self.progress = progress
+        self.throughput = throughput
+        self.deduplicator = dd.Deduplicator()
         self.signals = DeeplSignals()  # Create new signals instance.
         self.processed_chars = 0
 
@@ -126,10 +160,13 @@ class DeeplWorker(QRunnable):
         except Abort:
             logger.warning("Deepl Aborted.")
             if self.state == State.ABORTED and self.current_file_id is not None:
-                self.signals.progress.emit(
+                self.report_progress(
                     self.current_file_id, "Translation manually aborted.", None, None
                 )
-            self.signals.result.emit(State.ABORTED)
+            if self.state == State.QUOTA_EXCEEDED:
+                self.signals.result.emit(State.QUOTA_EXCEEDED)
+            else:
+                self.signals.result.emit(State.ABORTED)
 
         except Exception:
             traceback.print_exc()
@@ -138,6 +175,44 @@ class DeeplWorker(QRunnable):
         else:
             self.signals.result.emit(State.DONE)  # Return the result of the processing
 
+    def report_progress(
+        self,
+        key: str,
+        message: str,
+        processed_chars: int | None = None,
+        total_chars: int | None = None,
+    ) -> None:
+        """
+        Report the progress of a file, to the aggregator if there is one.
+
+        :param key: The file id.
+        :param message: The progress message.
+        :param processed_chars: [Optional] The number of chars processed so far.
+        :param total_chars: [Optional] The total number of chars to process.
+        """
+        if self.progress is not None:
+            self.progress.report(key, message, processed_chars, total_chars)
+        else:
+            self.signals.progress.emit(key, message, processed_chars, total_chars)
+
+    def record_request(
+        self, content_type: tp.ContentType, chars: int, seconds: float, concurrency: int = 1
+    ) -> None:
+        """
+        Record the duration of a request in the throughput model, if there is one.
+
+        :param content_type: Whether plain text or html was translated.
+        :param chars: The number of characters translated.
+        :param seconds: How long the request took.
+        :param concurrency: [Optional] How many requests were allowed in flight at once.
+        """
+        if self.throughput is None:
+            return
+        key = tp.profile_key(
+            self.config.current_backend, self.config.lang_from, self.config.lang_to, content_type
+        )
+        self.throughput.record(key, chars, seconds, concurrency)
+
     def main(self) -> None:
         """
         The main function of the worker thread.
@@ -149,9 +224,15 @@ class DeeplWorker(QRunnable):
         self.partition_input_files()
         self.check_aborted()
 
+        self.prepare_deduplication()
         self.translate_input_files()
         self.check_aborted()
 
+        saved_chars = self.deduplicator.saved_chars
+        if saved_chars:
+            logger.info(f"Deduplication saved {saved_chars} chars from being sent.")
+            self.signals.deduplicated.emit(saved_chars)
+
     def clean_up_previous_translations(self) -> None:
         """
         Clean up any previous translations.
@@ -166,22 +247,29 @@ class DeeplWorker(QRunnable):
         """
 
         logger.info("Partitioning input files.")
+        max_chunks, min_chunk_size = self.config.chunking()
         for key, input_file in self.input_files.items():
             self.check_aborted()
             self.current_file_id = key
-            self.signals.progress.emit(key, "Partitioning file...", None, None)
+            self.report_progress(key, "Partitioning file...", None, None)
+
+            with trc.span("partition", file=input_file.path.name):
+                if isinstance(input_file, st.MappedTextFile):
+                    # Only the byte spans are stored, the text is read when translating each chunk.
+                    input_file.partition(max_chunks, min_chunk_size, API_MAX_BYTES)
+                elif isinstance(input_file, st.TextFile):
+                    input_file: st.TextFile  # Reinterpret type.
+                    if self.config.lean_memory:
+                        input_file.release_intermediate_texts()
+                    input_file.chunk_spans = partition_text(
+                        input_file.current_text(), max_chunks, min_chunk_size
+                    )
 
             if isinstance(input_file, st.TextFile):
-                input_file: st.TextFile  # Reinterpret type.
-                input_file.text_chunks = partition_text(
-                    input_file.current_text(),
-                    self.config.tl_max_chunks,
-                    self.config.tl_min_chunk_size,
-                )
                 # Share chunk statistics.
-                chunk_count = len(input_file.text_chunks)
+                chunk_count = input_file.chunk_count()
                 logger.info(f"Split {input_file.path.name} into {chunk_count} chunks.")
-                self.signals.progress.emit(
+                self.report_progress(
                     key, f"Split into {chunk_count} {ut.f_plural(chunk_count, 'chunk')}", None, None
                 )
             else:
@@ -189,13 +277,111 @@ class DeeplWorker(QRunnable):
                 # The chunks in this case are merely the number of files to handle.
                 # Just share this information with the user.
                 input_file: st.EpubFile  # Reinterpret type.
-                self.signals.progress.emit(
+                self.report_progress(
                     key,
                     f"Split into {input_file.file_count} {ut.f_plural(input_file.file_count, 'file')}",
                     None,
                     None,
                 )
 
+    def prepare_deduplication(self) -> None:
+        """
+        Find the lines repeated across the text files, to translate them only once.
+        Memory mapped files are too large to scan, but their chunks can still reuse translations.
+        """
+        if not self.config.deduplicate:
+            return
+        texts = (
+            input_file.current_text()
+            for input_file in self.input_files.values()
+            if isinstance(input_file, st.TextFile) and not isinstance(input_file, st.MappedTextFile)
+        )
+        repeated_lines = dd.find_repeated_lines(texts)
+        logger.info(f"Found {len(repeated_lines)} repeated lines to translate only once.")
+        # Remembering every translation would hold a second copy of the output.
+        self.deduplicator = dd.Deduplicator(
+            repeated_lines, remember_all=not self.config.lean_memory
+        )
+
+    def translate_deduplicated(
+        self, key: str, texts: list[str], is_html: bool = False, message: str | None = None
+    ) -> list[str]:
+        """
+        Translate the texts with the backend, sending only what wasn't translated before.
+        Unless deduplication is disabled, then the texts are sent exactly as they are.
+
+        :param key: The key of the input file. Used for error reporting.
+        :param texts: The texts to translate.
+        :param is_html: Whether the texts are html or not.
+        :param message: [Optional] The progress message to report after each request.
+        :return: The translations.
+        """
+
+        def translate_batch(batch: list[str]) -> list[str]:
+            return self.translate_texts(key, batch, is_html, message)
+
+        if not self.config.deduplicate:
+            return translate_batch(texts)
+
+        processed_chars = self.processed_chars
+        translations = self.deduplicator.translate(texts, translate_batch, split_lines=not is_html)
+        # Reused translations count as processed too.
+        self.processed_chars = processed_chars + chunk_length(texts, is_html)
+        return translations
+
+    def translate_texts(
+        self, key: str, texts: list[str], is_html: bool = False, message: str | None = None
+    ) -> list[str]:
+        """
+        Translate the texts with the backend's translation engine.
+        If the quota runs out, the texts that didn't make it are replaced with a banner,
+        and the worker stops at the next abort check, so the output can still be dumped.
+
+        :param key: The key of the input file. Used for error reporting.
+        :param texts: The texts to translate.
+        :param is_html: Whether the texts are html or not.
+        :param message: [Optional] The progress message to report after each request.
+        :return: The translations.
+        """
+        translations: list[str | None] = [None] * len(texts)
+        content_type = tp.ContentType.HTML if is_html else tp.ContentType.TEXT
+
+        def batch_done(batch: list[int], results: list[str]) -> None:
+            for index, result in zip(batch, results):
+                translations[index] = result
+            self.processed_chars += chunk_length([texts[i] for i in batch], is_html)
+            if message is not None:
+                self.report_progress(key, message, self.processed_chars, self.total_chars)
+
+        def request_timed(batch: list[int], seconds: float) -> None:
+            chars = chunk_length([texts[i] for i in batch], is_html)
+            self.record_request(content_type, chars, seconds, self.engine.concurrency())
+
+        try:
+            self.engine.translate(texts, batch_done, self.check_aborted, request_timed, is_html)
+        except bi.QuotaExceeded as e:
+            logger.error(f"Quota exceeded. Aborting.\n\n{e}")
+            # Don't raise, keep what was translated for a cleaner dump.
+            # Merely setting the flag will raise the Abort signal at the next check.
+            self.state = State.QUOTA_EXCEEDED
+            self.report_progress(key, "API Quota Exceeded!", None, None)
+        except bi.TooManyRequests as e:
+            logger.error(f"Too many requests. Aborting.\n\n{e}")
+            self.report_progress(key, "Too many requests. Aborting!", None, None)
+            self.state = State.ERROR
+            raise
+        except bi.TranslationFailed as e:
+            logger.error(f"Translation failed. Aborting: {e}")
+            self.report_progress(key, "Translation Failed!", None, None)
+            self.state = State.ERROR
+            raise
+
+        # Empty texts aren't sent, so they never had a translation to lose.
+        return [
+            translation if translation is not None else quota_exceeded_banner() if text else ""
+            for text, translation in zip(texts, translations)
+        ]
+
     def translate_input_files(self) -> None:
         logger.info("Translating text_chunks.")
         for key, input_file in self.input_files.items():
@@ -205,35 +391,33 @@ class DeeplWorker(QRunnable):
             # ------------------------------------------------------------ Text files.
             if isinstance(input_file, st.TextFile):
                 input_file: st.TextFile  # Reinterpret type.
-                for i, chunk in enumerate(input_file.text_chunks):
-                    self.check_aborted()
-                    if not chunk:
-                        logger.warning(f"Empty chunk {i + 1} in {input_file.path.name}.")
-                        continue
-                    self.signals.progress.emit(
+                chunk_count = input_file.chunk_count()
+                writer = self.text_writers.get(key)
+                self.translate_chunks(key, input_file, writer)
+                if writer is not None:
+                    # Already written to the output chunk by chunk.
+                    self.report_progress(
                         key,
-                        f"Translating chunk {i + 1} / {len(input_file.text_chunks)}",
+                        f"Translated {chunk_count} / {chunk_count} "
+                        f"{ut.f_plural(chunk_count, 'chunk')}",
                         self.processed_chars,
                         self.total_chars,
                     )
-                    if self.config.tl_mock:
-                        translation = self.mock_translate_text(chunk)
-                    else:
-                        translation = self.try_translate(chunk, key)
-
-                    input_file.translation_chunks.append(translation.text)
-                    # logger.debug(f"Translation: {translation.text}")
+                    continue
                 # Smelt the translation chunks into a single translation.
                 input_file.translation = "".join(input_file.translation_chunks)
-                # If quote protection was used, remove it.
+                input_file.translation_chunks = []
+                # If preprocessing rules were applied, undo them.
                 if input_file.process_level & st.ProcessLevel.PROTECTED:
-                    logger.debug("Restoring quote protection.")
-                    input_file.translation = qp.restore(input_file.translation)
+                    logger.debug("Applying postprocessing rules.")
+                    with trc.span("restore", file=input_file.path.name):
+                        input_file.translation = input_file.rule_set.postprocess(
+                            input_file.translation
+                        )
 
-                self.signals.progress.emit(
+                self.report_progress(
                     key,
-                    f"Translated {len(input_file.text_chunks)} / {len(input_file.text_chunks)} "
-                    f"{ut.f_plural(len(input_file.text_chunks), 'chunk')}",
+                    f"Translated {chunk_count} / {chunk_count} {ut.f_plural(chunk_count, 'chunk')}",
                     self.processed_chars,
                     self.total_chars,
                 )
@@ -241,176 +425,79 @@ class DeeplWorker(QRunnable):
             # ------------------------------------------------------------ Epub files.
             else:
                 input_file: st.EpubFile  # Reinterpret type.
-                # Epub files are processed as html_file uploads, to avoid breaking the html formatting.
+                # Epub files are translated as html, to avoid breaking the formatting.
                 # Translate the toc.ncx html_file.
-                self.signals.progress.emit(
-                    key,
-                    f"Translating file 1 / {input_file.file_count}",
-                    self.processed_chars,
-                    self.total_chars,
-                )
-                texts = input_file.toc_file.get_texts(input_file.toc_file.current_text())
-                if self.config.tl_mock:
-                    translations = self.mock_translate_text(texts)
-                else:
-                    translations = self.try_translate(texts, key)
-
-                # Unwrap the translations and apply them.
-                translations = [translation.text for translation in translations]
-                input_file.toc_file.translation = input_file.toc_file.set_texts(
-                    input_file.toc_file.current_text(), translations
-                )
+                message = f"Translating file 1 / {input_file.file_count}"
+                self.report_progress(key, message, self.processed_chars, self.total_chars)
+                texts = input_file.toc_file.get_texts()
+                translations = self.translate_deduplicated(key, texts)
+                input_file.toc_file.translation = input_file.toc_file.set_texts(translations)
 
                 # Translate the files.
                 for i, html_file in enumerate(input_file.html_files):
                     self.check_aborted()
-                    self.signals.progress.emit(
-                        key,
-                        f"Translating file {i + 2} / {input_file.file_count}",  # +2 because of toc.ncx and 0-indexing.
-                        self.processed_chars,
-                        self.total_chars,
-                    )
-                    html_text = html_file.current_text()
-                    chunks = partition_text_max_bytes(html_text, API_MAX_BYTES)
-                    translations = []
-                    for chunk in chunks:
-                        if self.config.tl_mock:
-                            translation = self.mock_translate_text(chunk, is_html=True)
-                        else:
-                            translation = self.try_translate(chunk, key, is_html=True)
-
-                        translations.append(translation.text)
-
-                        self.check_aborted()
-                        self.signals.progress.emit(
-                            key,
-                            f"Translating file {i + 2} / {input_file.file_count}",  # +2 because of toc.ncx and 0-indexing.
-                            self.processed_chars,
-                            self.total_chars,
-                        )
-
+                    # +2 because of toc.ncx and 0-indexing.
+                    message = f"Translating file {i + 2} / {input_file.file_count}"
+                    self.report_progress(key, message, self.processed_chars, self.total_chars)
+                    chunks = partition_text_max_bytes(html_file.current_text(), API_MAX_BYTES)
+                    translations = self.translate_deduplicated(key, chunks, True, message)
                     html_file.translation = "".join(translations)
-                    # logger.debug(f"Translation: {translation.text}")
-                self.signals.progress.emit(
+                    # Stream the finished file to the output right away.
+                    if key in self.epub_writers:
+                        self.epub_writers[key].write_file(html_file, html_file.translation)
+                self.report_progress(
                     key,
                     f"Translated file {input_file.file_count} / {input_file.file_count} ",
                     self.processed_chars,
                     self.total_chars,
                 )
 
-    def try_translate(
-        self, chunk: str | list[str], key: str, is_html: bool = False
-    ) -> deepl.TextResult | list[deepl.TextResult]:
+    def translate_chunks(
+        self, key: str, input_file: st.TextFile, writer: st.TextStreamWriter | None = None
+    ) -> None:
         """
-        Try to translate the text.
+        Translate the chunks of a text file with the backend's translation engine.
+        Only a window of chunks is read at a time, enough to keep all requests busy.
 
-        :param chunk: The text to translate.
-        :param key: The key of the input file. Used for error reporting.
-        :param is_html: Whether the text is html or not.
+        :param key: The file id.
+        :param input_file: The partitioned text file.
+        :param writer: [Optional] Write each chunk's translation here, postprocessed on its own,
+            like it was preprocessed, instead of collecting them in the file.
         """
-        tag_handling = "html" if is_html else None
-        tries = 1
-        while True:
-            try:
-                if isinstance(chunk, str):
-                    logger.debug(
-                        f"Requesting translation of {len(chunk.encode('utf-8')):n} bytes, {len(chunk):n} chars."
-                    )
-                else:
-                    logger.debug(
-                        f"Requesting translation of {sum(len(c.encode('utf-8')) for c in chunk):n} bytes, "
-                        f"{sum(len(c) for c in chunk):n} chars, split into {len(chunk)} chunks."
-                    )
-                t_start = time.time()
-                translation = self.translator.translate_text(
-                    chunk,
-                    source_lang=self.config.lang_from,
-                    target_lang=self.config.lang_to,
-                    preserve_formatting=self.config.tl_preserve_formatting,
-                    tag_handling=tag_handling,
-                )
-                if not translation:
-                    raise deepl.DeepLException()
-
-                # Claim the chunk as translated.
-                if is_html:
-                    length_processed = xp.get_char_count(chunk)
-                else:
-                    length_processed = (
-                        len(chunk) if isinstance(chunk, str) else sum(len(c) for c in chunk)
-                    )
-
-                self.processed_chars += length_processed
-                d_time = time.time() - t_start
-                # Calculate how long it took per 1000 chars. Update the average.
-                time_per_mille = d_time / (length_processed / 1000)
-                self.config.avg_time_per_mille = ut.weighted_average(
-                    self.config.avg_time_per_mille, time_per_mille
-                )
-                logger.info(
-                    f"Translation took {d_time:.2f} seconds, {time_per_mille:.3f} seconds per 1000 chars."
-                )
-                return translation
-
-            except deepl.TooManyRequestsException as e:
-                if tries >= 5:
-                    logger.error(f"Too many requests. Aborting.\n\n{e}")
-                    self.signals.progress.emit(key, "Too many requests. Aborting!", None, None)
-                    self.state = State.ERROR
-                    raise e
-
-                logger.warning(f"Too many requests. Sleeping for 5 seconds.")
-                self.signals.progress.emit(key, "Too many requests. Waiting...", None, None)
-                time.sleep(5)
-                tries += 1
+        chunk_count = input_file.chunk_count()
+        max_bytes = min(API_MAX_BYTES, self.engine.capabilities.max_request_bytes or API_MAX_BYTES)
+        window_size = self.engine.window_size()
+        for window_start in range(0, chunk_count, window_size):
+            self.check_aborted()
+            window_end = min(window_start + window_size, chunk_count)
+            pieces = []
+            piece_counts = []
+            for i in range(window_start, window_end):
+                chunk = input_file.get_chunk(i)
+                if not chunk:
+                    logger.warning(f"Empty chunk {i + 1} in {input_file.path.name}.")
+                    piece_counts.append(0)
+                    continue
+                # Lazily processed chunks may have grown past the limit.
+                chunk_pieces = partition_text_max_bytes(chunk, max_bytes)
+                pieces += chunk_pieces
+                piece_counts.append(len(chunk_pieces))
+
+            message = f"Translating chunks {window_start + 1}-{window_end} / {chunk_count}"
+            self.report_progress(key, message, self.processed_chars, self.total_chars)
+            translations = self.translate_deduplicated(key, pieces, message=message)
+            if writer is None:
+                input_file.translation_chunks += translations
                 continue
-            except deepl.QuotaExceededException as e:
-                logger.error(f"Quota exceeded. Aborting.\n\n{e}")
-                # Don't immediately abort, at least finish the current chunk for a cleaner dump.
-                # Merely setting the flag will raise the Abort signal when the next chunk starts.
-                self.state = State.QUOTA_EXCEEDED
-                self.signals.progress.emit(key, "API Quota Exceeded!", None, None)
-                return quota_exceeded_banner()
-            except deepl.DeepLException as e:
-                logger.error(f"Translation failed. Aborting: {e}")
-                self.signals.progress.emit(key, "Translation Failed!", None, None)
-                self.state = State.ERROR
-                raise e
-
-    def mock_translate_text(
-        self, chunk: str | list[str], is_html: bool = False
-    ) -> deepl.TextResult | list[deepl.TextResult]:
-        """
-        Mock translation.
 
-        :param chunk: The text to translate.
-        :param is_html: Whether the text is html or not.
-        """
-        logger.info("Mocking translation.")
-        if isinstance(chunk, str):
-            logger.debug(
-                f"Requesting translation of {len(chunk.encode('utf-8')):n} bytes, {len(chunk):n} chars."
-            )
-        else:
-            logger.debug(
-                f"Requesting translation of {sum(len(c.encode('utf-8')) for c in chunk):n} bytes, "
-                f"{sum(len(c) for c in chunk):n} chars, split into {len(chunk)} chunks."
-            )
-        time.sleep(1)
-        if isinstance(chunk, list):
-            return [
-                deepl.TextResult(text="Translated " + text, detected_source_lang="EN")
-                for text in chunk
-            ]
-        else:
-            translation = deepl.TextResult(text="Translated" + chunk, detected_source_lang="EN")
-        # Pretend that we make progress.
-        if is_html:
-            length_processed = xp.get_char_count(chunk)
-        else:
-            length_processed = len(chunk) if isinstance(chunk, str) else sum(len(c) for c in chunk)
-        self.processed_chars += length_processed
-        return translation
+            start = 0
+            for count in piece_counts:
+                translation = "".join(translations[start : start + count])
+                start += count
+                if input_file.process_level & st.ProcessLevel.PROTECTED:
+                    with trc.span("restore", file=input_file.path.name):
+                        translation = input_file.rule_set.postprocess(translation)
+                writer.write(translation)
 
     @Slot()
     def abort(self) -> None:
@@ -427,45 +514,59 @@ class DeeplWorker(QRunnable):
             raise Abort
 
 
-def partition_text(text: str, max_chunks: int, min_chunk_size: int) -> list[str]:
+def chunk_length(chunk: str | list[str], is_html: bool = False) -> int:
+    """
+    Count the chars of a chunk, or a list of them. Html only counts the text, not the tags.
+    """
+    chunks = [chunk] if isinstance(chunk, str) else chunk
+    if is_html:
+        return sum(xp.get_char_count(c) for c in chunks)
+    return sum(len(c) for c in chunks)
+
+
+def partition_text(
+    text: str, max_chunks: int, min_chunk_size: int, max_bytes: int = API_MAX_BYTES
+) -> list[tuple[int, int]]:
     """
     Partition the input files into text_chunks.
     The config contains a maximum number of batches and a minimum size of each chunk.
+    The chunks are returned as (start, end) offsets into the text, so that they needn't be
+    copied out of it until they are translated.
+
+    :param text: The text to partition.
+    :param max_chunks: The maximum number of chunks to aim for.
+    :param min_chunk_size: The minimum number of characters in each chunk.
+    :param max_bytes: [Optional] The maximum number of UTF-8 bytes in each chunk.
+    :return: The spans of the chunks.
     """
     # Figure out how many buckets we can even fill, since it doesn't make sense to
     # have a lot of buckets if they are all basically empty.
-    lines = text.splitlines(keepends=True)
     max_possible_chunks = (len(text) // min_chunk_size) + 1
     bucket_count = min(max_chunks, max_possible_chunks)
     approx_chunk_size = ceil(len(text) / bucket_count)
-    # logger.debug(f"Approximate chunk size: {approx_chunk_size}")
-    # logger.debug(f"Bucket count: {bucket_count}")
 
-    # Place lines into the buckets so that we have approximately the same number of characters in each chunk.
-    chunks = []
-    for i in range(bucket_count):
-        temp_chunk = []
-        current_len = 0
-        # Fill text_chunks evenly, and dump the remainder into the last bucket.
-        while lines and (current_len < approx_chunk_size or i == bucket_count - 1):
-            temp_chunk.append(lines.pop(0))
-            current_len += len(temp_chunk[-1])
-        # Smelt the temp chunk into a real chunk.
-        chunks.append("".join(temp_chunk))
-
-    # Split any chunks that exceed the API limit.
-    final_chunks = []
-    for chunk in chunks:
-        final_chunks += partition_text_max_bytes(chunk, API_MAX_BYTES)
-
-    # Sanity check.
-    if text_length(chunks) != len(text):
-        logger.error(
-            f"Text length mismatch. Expected {len(text)}, got {text_length(final_chunks)}."
-        )
-        raise ValueError("Text length mismatch.")
-
-    return final_chunks
+    # Place lines into the buckets so that we have approximately the same number of characters
+    # in each chunk, dumping the remainder into the last bucket.
+    # Any chunks that would exceed the API limit are split as well.
+    spans = []
+    buckets_filled = 0
+    chunk_start = line_start = chunk_bytes = 0
+    while line_start < len(text):
+        line_end = text.find("\n", line_start) + 1 or len(text)
+        line_bytes = len(text[line_start:line_end].encode("utf-8"))
+        if line_start > chunk_start and chunk_bytes + line_bytes > max_bytes:
+            spans.append((chunk_start, line_start))
+            chunk_start, chunk_bytes = line_start, 0
+        chunk_bytes += line_bytes
+        line_start = line_end
+        if line_end - chunk_start >= approx_chunk_size and buckets_filled < bucket_count - 1:
+            spans.append((chunk_start, line_end))
+            buckets_filled += 1
+            chunk_start, chunk_bytes = line_end, 0
+    if chunk_start < len(text):
+        spans.append((chunk_start, len(text)))
+
+    return spans
 
 
 def partition_text_max_bytes(text: str, max_size: int) -> list[str]:
@@ -480,17 +581,21 @@ def partition_text_max_bytes(text: str, max_size: int) -> list[str]:
     :return: A list of text chunks.
     """
     # Split the text into chunks of at most max_size.
-    # Split only at whole lines.
+    # Split only at whole lines, a line too long on its own gets a chunk to itself.
     chunks = []
-    lines = text.splitlines(keepends=True)
-    while lines:
-        temp_chunk = []
-        current_len = 0
-        while lines and current_len < max_size:
-            temp_chunk.append(lines.pop(0))
-            # Measure the length of the string as the number of UTF-8 bytes.
-            current_len += len(temp_chunk[-1].encode("utf-8"))
-        # Smelt the temp chunk into a real chunk.
+    temp_chunk = []
+    current_len = 0
+    for line in text.splitlines(keepends=True):
+        # Measure the length of the string as the number of UTF-8 bytes.
+        line_len = len(line.encode("utf-8"))
+        if temp_chunk and current_len + line_len > max_size:
+            # Smelt the temp chunk into a real chunk.
+            chunks.append("".join(temp_chunk))
+            temp_chunk = []
+            current_len = 0
+        temp_chunk.append(line)
+        current_len += line_len
+    if temp_chunk:
         chunks.append("".join(temp_chunk))
 
     # Sanity check.
@@ -508,15 +613,12 @@ def text_length(lines: list[str]) -> int:
     return sum([len(line) for line in lines])
 
 
-def quota_exceeded_banner() -> deepl.TextResult:
-    return deepl.TextResult(
-        """
+def quota_exceeded_banner() -> str:
+    return """
 #================================#
           
           QUOTA EXCEEDED   :‘(
           
 #================================#
 
-""",
-        detected_source_lang="FUBAR",
-    )
+"""
@@ -20,7 +20,7 @@ from PySide6.QtWidgets import (QAbstractItemView, QApplication, QCheckBox, QFram
     QLabel, QLineEdit, QMainWindow, QPlainTextEdit,
     QProgressBar, QPushButton, QSizePolicy, QSpacerItem,
     QSpinBox, QSplitter, QStackedWidget, QStatusBar,
-    QTableWidgetItem, QVBoxLayout, QWidget)
+    QVBoxLayout, QWidget)
 
 from deepqt.CustomQ.CComboBox import CComboBox
 from deepqt.CustomQ.CDropFrame import CDropFrame
@@ -374,18 +374,6 @@ class Ui_MainWindow(object):
         self.verticalLayout_6.setObjectName(u"verticalLayout_6")
         self.verticalLayout_6.setContentsMargins(0, 0, 0, 0)
         self.file_table = FileTable(self.page_files)
-        if (self.file_table.columnCount() < 5):
-            self.file_table.setColumnCount(5)
-        __qtablewidgetitem = QTableWidgetItem()
-        self.file_table.setHorizontalHeaderItem(0, __qtablewidgetitem)
-        __qtablewidgetitem1 = QTableWidgetItem()
-        self.file_table.setHorizontalHeaderItem(1, __qtablewidgetitem1)
-        __qtablewidgetitem2 = QTableWidgetItem()
-        self.file_table.setHorizontalHeaderItem(2, __qtablewidgetitem2)
-        __qtablewidgetitem3 = QTableWidgetItem()
-        self.file_table.setHorizontalHeaderItem(3, __qtablewidgetitem3)
-        __qtablewidgetitem4 = QTableWidgetItem()
-        self.file_table.setHorizontalHeaderItem(4, __qtablewidgetitem4)
         self.file_table.setObjectName(u"file_table")
         self.file_table.setFocusPolicy(Qt.NoFocus)
         self.file_table.setAcceptDrops(True)
@@ -701,16 +689,6 @@ class Ui_MainWindow(object):
         self.spinBox_auto_start.setSuffix(QCoreApplication.translate("MainWindow", u" seconds", None))
         self.pushButton_start.setText(QCoreApplication.translate("MainWindow", u"Start", None))
         self.pushButton_abort.setText(QCoreApplication.translate("MainWindow", u"Abort", None))
-        ___qtablewidgetitem = self.file_table.horizontalHeaderItem(0)
-        ___qtablewidgetitem.setText(QCoreApplication.translate("MainWindow", u"ID", None));
-        ___qtablewidgetitem1 = self.file_table.horizontalHeaderItem(1)
-        ___qtablewidgetitem1.setText(QCoreApplication.translate("MainWindow", u"File Name", None));
-        ___qtablewidgetitem2 = self.file_table.horizontalHeaderItem(2)
-        ___qtablewidgetitem2.setText(QCoreApplication.translate("MainWindow", u"Status", None));
-        ___qtablewidgetitem3 = self.file_table.horizontalHeaderItem(3)
-        ___qtablewidgetitem3.setText(QCoreApplication.translate("MainWindow", u"Characters", None));
-        ___qtablewidgetitem4 = self.file_table.horizontalHeaderItem(4)
-        ___qtablewidgetitem4.setText(QCoreApplication.translate("MainWindow", u"Output Path", None));
         self.label_drop_2.setText(QCoreApplication.translate("MainWindow", u"Drag and Drop Files or Folders Here", None))
         self.label_4.setText(QCoreApplication.translate("MainWindow", u"Translate from", None))
         self.pushButton_show_from_interactive_glossary.setText(QCoreApplication.translate("MainWindow", u"Show input after glossary", None))
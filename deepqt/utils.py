@@ -1,27 +1,29 @@
+import codecs
 import difflib
+import importlib
 import os
 import platform
 import re
 import shutil
 import sys
-import zipfile as zf
 from contextlib import contextmanager
 from importlib import resources
 from io import StringIO
 from io import TextIOWrapper
 from pathlib import Path
-from typing import get_type_hints, Generic, TypeVar, Optional
+from types import ModuleType
+from typing import get_type_hints, Generic, TypeVar, Optional, BinaryIO
 
 import PySide6
 import PySide6.QtCore as Qc
 import PySide6.QtGui as Qg
 import PySide6.QtWidgets as Qw
 import chardet
-import psutil
 from loguru import logger
 from xdg import XDG_CONFIG_HOME, XDG_CACHE_HOME
 
 import deepqt.constants as ct
+import deepqt.tracing as trc
 from deepqt import __program__, __version__
 from deepqt.data import color_themes
 
@@ -43,6 +45,37 @@ class Shared(Generic[T]):
         return self._container["data"] is None
 
 
+class LazyModule:
+    """
+    Stands in for a module that is slow to import, importing it on first attribute access.
+    Use it for dependencies that aren't needed before the main window is shown:
+
+        deepl = ut.LazyModule("deepl")
+
+    Annotations mentioning the module must not be evaluated on import either,
+    so modules using this need `from __future__ import annotations`.
+    Importing is thread-safe, so the first access may happen in any thread.
+    """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module: ModuleType | None = None
+
+    def __getattr__(self, attribute: str):
+        # Only called for attributes the proxy itself lacks.
+        if self._module is None:
+            logger.debug(f"Importing {self._name} on first use.")
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self) -> str:
+        state = "imported" if self._module is not None else "not imported yet"
+        return f"<lazy module {self._name!r}, {state}>"
+
+
+psutil = LazyModule("psutil")
+
+
 # Logging session markers.
 STARTUP_MESSAGE = "---- Starting up ----"
 SHUTDOWN_MESSAGE = "---- Shutting down ----"
@@ -160,6 +193,44 @@ def epub_cache_path(epub_path: None | Path = None) -> Path:
     return get_cache_path() / "epubs" / epub_path.name
 
 
+def prune_epub_cache(max_bytes: int, cache_path: Path | None = None) -> None:
+    """
+    Shrink the epub cache to the given size, evicting the least recently used books first.
+    Each book has its own directory, whose modification time is updated when it is used.
+
+    :param max_bytes: The maximum total size of the cache.
+    :param cache_path: [Optional] The cache directory. Defaults to the epub cache directory.
+    """
+    if cache_path is None:
+        cache_path = epub_cache_path()
+    if not cache_path.is_dir():
+        logger.info("Epub cache folder does not exist. Nothing to do.")
+        return
+
+    book_dirs = []
+    total_size = 0
+    for book_dir in cache_path.iterdir():
+        if not book_dir.is_dir():
+            continue
+        size = sum(path.stat().st_size for path in book_dir.rglob("*") if path.is_file())
+        book_dirs.append((book_dir.stat().st_mtime, size, book_dir))
+        total_size += size
+
+    # Oldest first.
+    book_dirs.sort(key=lambda entry: entry[0])
+    for _, size, book_dir in book_dirs:
+        if total_size <= max_bytes:
+            break
+        try:
+            shutil.rmtree(book_dir)
+            total_size -= size
+            logger.debug(f"Evicted {book_dir.name} from the epub cache, freeing {size} bytes.")
+        except OSError as e:
+            logger.error(f"Failed to delete epub cache folder {book_dir}: {e}")
+
+    logger.info(f"Epub cache size: {total_size / 1024 ** 2:.1f} MiB")
+
+
 def get_log_path() -> Path:
     """
     Get the path to the log file.
@@ -168,6 +239,22 @@ def get_log_path() -> Path:
     return get_cache_path() / f"{__program__}.log"
 
 
+def get_trace_path() -> Path:
+    """
+    Get the path to the directory for the stage timings of each run.
+    This is next to the log file.
+    """
+    return get_log_path().parent / "traces"
+
+
+def get_throughput_path() -> Path:
+    """
+    Get the path to the file holding the measured translation speeds.
+    Use the cache directory for this, since they can be measured again.
+    """
+    return get_cache_path() / "throughput.json"
+
+
 def get_lock_file_path() -> Path:
     """
     Get the path to the lock file.
@@ -451,51 +538,6 @@ def load_dict_to_attrs_safely(
     return recoverable_exceptions
 
 
-def zip_folder_to_epub(folder_unzipped: Path, destination: Path) -> bool:
-    """
-    Zip a folder to an epub file.
-
-    :param folder_unzipped: Path to the folder to zip.
-    :param destination: Path to the destination file.
-    :return: True if successful, False otherwise.
-    """
-    seen = set()
-
-    def add_to_zip(zip_file: zf.ZipFile, path: Path) -> None:
-        """
-        Add a file or folder to the zip file.
-        """
-        if path in seen:
-            return
-        seen.add(path)
-        if path.is_dir():
-            for child in path.iterdir():
-                add_to_zip(zip_file, child)
-        # Add everything else that isn't junk.
-        elif not path.name.endswith("Thumbs.db") and not path.name.endswith("debug.log"):
-            zip_file.write(path, path.relative_to(folder_unzipped))
-
-    # Check that this was probably an epub file.
-    if (folder_unzipped / "mimetype").is_file() and (folder_unzipped / "META-INF").is_dir():
-        # Start the epub file with the mimetype file.
-        with zf.ZipFile(destination, "w", compression=zf.ZIP_DEFLATED) as myzip:
-            add_to_zip(myzip, folder_unzipped / "mimetype")
-
-        # Append the META-INF folder.
-        with zf.ZipFile(destination, "a", compression=zf.ZIP_DEFLATED) as myzip:
-            add_to_zip(myzip, folder_unzipped / "META-INF")
-
-        # Append the rest of the files.
-        with zf.ZipFile(destination, "a", compression=zf.ZIP_DEFLATED) as myzip:
-            for file in folder_unzipped.iterdir():
-                add_to_zip(myzip, file)
-
-        return True
-    else:
-        logger.error(f"Folder {folder_unzipped} is missing mimetype and/or META-INF folder.")
-        return False
-
-
 def to_snake_case(name: str) -> str:
     """
     Convert the given name to snake case.
@@ -560,27 +602,93 @@ def read_mime_type(path: Path) -> ct.Formats:
     return ct.Formats.UNKNOWN
 
 
-def detect_encoding(file_path: Path) -> str:
-    with open(file_path, "rb") as file:
-        detector = chardet.universaldetector.UniversalDetector()
-        for line in file:
-            detector.feed(line)
-            if detector.done:
-                break
-        detector.close()
+# Encoding detection only ever looks at this many bytes at the start of a file.
+ENCODING_SAMPLE_BYTES = 1024**2
+
+# Byte order marks, the UTF-32 ones must be checked before UTF-16, which they start with.
+ENCODING_BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Detected encodings, keyed by the resolved path, modification time and size of the file.
+_encoding_cache: dict[tuple[Path, int, int], str] = {}
+
+
+def detect_sample_encoding(sample: bytes, complete: bool) -> str | None:
+    """
+    Detect the encoding of the start of a file.
+    Byte order marks are trusted first, then the sample is strictly decoded as UTF-8,
+    and only if that fails chardet is asked to guess.
+
+    :param sample: The first bytes of the file.
+    :param complete: Whether the sample is the whole file.
+    :return: The name of the encoding, or None if chardet can't tell.
+    """
+    for bom, encoding in ENCODING_BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # A cut off character at the end of a partial sample isn't an error.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=complete)
+    except UnicodeDecodeError:
+        pass
+    else:
+        # The rest of the file could still contain other characters.
+        if complete and sample.isascii():
+            return "ascii"
+        return "utf-8"
+
+    detector = chardet.universaldetector.UniversalDetector()
+    detector.feed(sample)
+    detector.close()
     return detector.result["encoding"]
 
 
+def detect_file_encoding(file: BinaryIO, file_path: Path) -> str | None:
+    """
+    Detect the encoding of an open binary file, leaving it positioned at the start.
+    Results are cached until the file is modified.
+
+    :param file: The file, opened in binary mode.
+    :param file_path: Path to the file.
+    :return: The name of the encoding, or None if it couldn't be detected.
+    """
+    stat = os.fstat(file.fileno())
+    key = (Path(file_path).resolve(), stat.st_mtime_ns, stat.st_size)
+    if key not in _encoding_cache:
+        with trc.span("encoding_detection", "io", file=Path(file_path).name):
+            sample = file.read(ENCODING_SAMPLE_BYTES)
+            file.seek(0)
+            _encoding_cache[key] = detect_sample_encoding(sample, len(sample) >= stat.st_size)
+    return _encoding_cache[key]
+
+
+def detect_encoding(file_path: Path) -> str | None:
+    with open(file_path, "rb") as file:
+        return detect_file_encoding(file, file_path)
+
+
 @contextmanager
 def read_autodetect_encoding(file_path: Path) -> TextIOWrapper:
     """
     Open a file for reading with the encoding autodetected.
+    The file is only opened once, detection reads a sample from the same handle.
 
     :param file_path: Path to the file.
     """
-    encoding = detect_encoding(file_path)
-    file = open(file_path, "r", encoding=encoding)
+    file = open(file_path, "rb")
     try:
-        yield file
-    finally:
+        encoding = detect_file_encoding(file, file_path)
+        text_file = TextIOWrapper(file, encoding=encoding)
+    except Exception:
         file.close()
+        raise
+    try:
+        yield text_file
+    finally:
+        text_file.close()
@@ -66,6 +66,13 @@ class SharableFlag:
     def set(self, value: bool) -> None:
         self._flag = value
 
+    def raise_if_set(self) -> None:
+        """
+        Raise Abort if the flag is set. Pass this as a checkpoint to long-running functions.
+        """
+        if self._flag:
+            raise Abort
+
 
 class Abort(Exception):
     """
@@ -89,10 +96,14 @@ class Worker(QRunnable):
     :param args: Arguments to pass to the callback function.
     :param no_progress_callback: [Optional] If True, the progress_callback will not be added to the kwargs.
     :param abort_signal: [Optional] A signal that will be emitted when the thread should abort.
+    :param abortable: [Optional] If True, the abort_flag is added to the kwargs even without an
+                      abort signal, so the worker can be aborted by calling abort() directly.
     :param kwargs: Keywords to pass to the callback function.
     """
 
     aborted: SharableFlag
+    # Set once the callback stopped by raising Abort, before the finished signal is emitted.
+    stopped_early: bool
 
     def __init__(
         self,
@@ -100,6 +111,7 @@ class Worker(QRunnable):
         *args,
         no_progress_callback: bool = False,
         abort_signal: Signal | None = None,
+        abortable: bool = False,
         **kwargs,
     ):
         QRunnable.__init__(self)
@@ -113,14 +125,16 @@ class Worker(QRunnable):
         # If the abort signal is received, the abort flag is set to true.
         # The worker process must abort itself when the flag is true.
         self.aborted = SharableFlag(False)
+        self.stopped_early = False
 
         # Add the callback to our kwargs.
         if not no_progress_callback:
             self.kwargs["progress_callback"] = self.signals.progress
 
         # If an abort signal is provided, provide the sharable flag to the worker.
-        if abort_signal is not None:
+        if abort_signal is not None or abortable:
             self.kwargs["abort_flag"] = self.aborted
+        if abort_signal is not None:
             abort_signal.connect(self.abort)
 
     @Slot()
@@ -140,6 +154,7 @@ class Worker(QRunnable):
             try:
                 result = self.fn(*self.args, **self.kwargs)
             except Abort:
+                self.stopped_early = True
                 self.signals.aborted.emit((self.args, self.kwargs))
             except Exception:
                 # traceback.print_exc()  # Disabled because we handle showing the error in whatever
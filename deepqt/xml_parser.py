@@ -1,19 +1,31 @@
+from __future__ import annotations
+
+import posixpath
 import re
 import warnings
 import zipfile
 from functools import cache
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from urllib.parse import unquote
 
-import minify_html
-from bs4 import BeautifulSoup
+from attrs import define, Factory
 from loguru import logger
 from lxml import etree
 
+import deepqt.tracing as trc
+import deepqt.utils as ut
+
+
+# Only needed to prepare epub html files, which is deferred until the files are used.
+bs4 = ut.LazyModule("bs4")
+minify_html = ut.LazyModule("minify_html")
+
 
 # It throws this erroneous warning when encountering xhtml, which may be found in epubs.
 warnings.filterwarnings("ignore", category=UserWarning, module="bs4")
 
 
+@trc.traced("prepare_html_text", "preprocessing")
 def prepare_html_text(
     text: str, nuke_ruby: bool, nuke_indents: bool, nuke_kobo: bool, crush_html_text: bool
 ) -> str:
@@ -29,7 +41,7 @@ def prepare_html_text(
         text = flatten_indents(text)
 
     # Perform parsed element manipulations.
-    soup = BeautifulSoup(text, "lxml")
+    soup = bs4.BeautifulSoup(text, "lxml")
     if nuke_kobo:
         soup = strip_kobo_spans(soup)
 
@@ -46,7 +58,32 @@ def prepare_html_text(
     return text
 
 
-def strip_kobo_spans(soup: BeautifulSoup) -> BeautifulSoup:
+def prepare_html_job(
+    text: str,
+    ignore_empty: bool,
+    nuke_ruby: bool,
+    nuke_indents: bool,
+    nuke_kobo: bool,
+    crush_html_text: bool,
+) -> str | None:
+    """
+    Perform all per-file work on a single html file.
+    This is a module level function, so that it can be sent to a process pool.
+
+    :param text: The raw html text.
+    :param ignore_empty: Whether to skip files that contain no actual text.
+    :param nuke_ruby: Whether to remove ruby tags.
+    :param nuke_indents: Whether to flatten indents.
+    :param nuke_kobo: Whether to strip Kobo spans.
+    :param crush_html_text: Whether to minify the html.
+    :return: The prepared text, or None if the file is empty and should be ignored.
+    """
+    if ignore_empty and not html_contains_text(text):
+        return None
+    return prepare_html_text(text, nuke_ruby, nuke_indents, nuke_kobo, crush_html_text)
+
+
+def strip_kobo_spans(soup: bs4.BeautifulSoup) -> bs4.BeautifulSoup:
     """
     Strip spans that Kobo adds to the html.
     These have the class "koboSpan".
@@ -61,7 +98,7 @@ def strip_kobo_spans(soup: BeautifulSoup) -> BeautifulSoup:
     return soup
 
 
-def bust_empty_spans(soup: BeautifulSoup) -> BeautifulSoup:
+def bust_empty_spans(soup: bs4.BeautifulSoup) -> bs4.BeautifulSoup:
     """
     Remove empty spans from the text.
     """
@@ -104,20 +141,33 @@ def bust_ruby_tags(text: str) -> str:
     if not re.search(r'lang="ja"', text):
         return text
 
-    lines = [deruby(line) for line in text.splitlines()]
-    return "\n".join(lines)
+    return deruby(text)
 
 
 def html_contains_text(html: str) -> bool:
     """
     Check if the html contains any text.
     """
-    soup = BeautifulSoup(html, "lxml")
+    soup = bs4.BeautifulSoup(html, "lxml")
     # Exclude the title.
     text = soup.find("body").text.strip()
     return bool(text)
 
 
+# Any tag, comment or processing instruction.
+TAG_PATTERN = re.compile(r"<[^>]*>")
+
+
+def estimate_char_count(html: str) -> int:
+    """
+    Cheaply estimate the number of characters in the html, without parsing it.
+
+    :param html: The html text.
+    :return: The approximate char count.
+    """
+    return len(TAG_PATTERN.sub("", html))
+
+
 # This is an expensive pure function, taking around 300ms to run for an entire epub.
 # When loading multiple epubs, each one triggers a recount when updating parameters.
 # So cache results for a massive speed up: 300ms -> 0.02ms: 15,000x speed up.
@@ -126,77 +176,177 @@ def get_char_count(html: str) -> int:
     """
     Get the number of characters in the html.
     """
-    soup = BeautifulSoup(html, "lxml")
+    soup = bs4.BeautifulSoup(html, "lxml")
     return len(
         soup.text,
     )
 
 
-def deruby(line: str) -> str:
+# The common case of a single base text and reading, which a plain template can flatten.
+SIMPLE_RUBY_PATTERN = re.compile(r"<ruby>(?:<rb>)?([^<]*)(?:</rb>)?<rt>([^<]*)</rt></ruby>")
+# Any other ruby element, matched across line breaks so that wrapped markup is flattened too.
+# It may not contain another opening tag, so an unclosed element can't swallow the text
+# up to the next element's closing tag.
+RUBY_ELEMENT_PATTERN = re.compile(r"<ruby>((?:[^<]|<(?!ruby>))*?)</ruby>")
+# Any tag within a ruby element. Splitting on it alternates between text and tag names.
+RUBY_INNER_TAG_PATTERN = re.compile(r"<([^<>]*)>")
+
+
+def deruby(text: str) -> str:
     """
     Converts this:
     <ruby><rb>皇</rb><rt>こう</rt><rb>室</rb><rt>しつ</rt><rb>典</rb><rt>てん</rt><rb>範</rb><rt>ぱん</rt></ruby>
     To this:
     皇室典範（こうしつてんぱん）
 
-    Works on html files.
+    Works on html files, processing the whole document at once.
+    Simple elements are expanded by the regex engine directly, only elements with multiple
+    base texts or extra tags need to be untangled in Python.
+
+    :param text: The text to process.
+    :return: The processed text.
+    """
+    # Skip this if the text doesn't contain ruby tags.
+    if "<ruby>" not in text:
+        return text
+    text = SIMPLE_RUBY_PATTERN.sub(r"\1（\2）", text)
+    if "<ruby>" not in text:
+        return text
+    return RUBY_ELEMENT_PATTERN.sub(flatten_ruby_element, text)
+
+
+def flatten_ruby_element(match: re.Match) -> str:
+    """
+    Untangle a single ruby element into its base text followed by the reading in brackets.
+    Tags other than rb and rt are kept, but moved in front of the flattened text.
+
+    :param match: The match of the ruby element pattern.
+    :return: The flattened ruby text.
+    """
+    kept_tags = []
+    main = []
+    ruby = []
+    target = main
+    # Even indices hold text, odd indices hold the tag names between them.
+    for index, part in enumerate(RUBY_INNER_TAG_PATTERN.split(match.group(1))):
+        if index % 2 == 0:
+            target.append(part)
+        elif part in ("rb", "/rb", "/rt"):
+            target = main
+        elif part == "rt":
+            target = ruby
+        elif part == "ruby":
+            # A stray opening tag restarts the element.
+            main.clear()
+            ruby.clear()
+            target = main
+        else:
+            # Leave the tag untouched.
+            kept_tags.append(f"<{part}>")
+
+    return f"{''.join(kept_tags)}{''.join(main)}（{''.join(ruby)}）"
+
+
+# The namespaces used by the epub container and package documents.
+EPUB_NAMESPACES = {
+    "calibre": "http://calibre.kovidgoyal.net/2009/metadata",
+    "dc": "http://purl.org/dc/elements/1.1/",
+    "dcterms": "http://purl.org/dc/terms/",
+    "opf": "http://www.idpf.org/2007/opf",
+    "u": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "xhtml": "http://www.w3.org/1999/xhtml",
+}
+
+NCX_MEDIA_TYPE = "application/x-dtbncx+xml"
+
+
+@define
+class EpubPackage:
+    """
+    Everything needed from an epub's container and package (OPF) documents.
+    All paths are archive paths, relative to the root of the zip file.
+
+    - rootfile_path: The path of the package document.
+    - spine: The content documents in reading order.
+    - media_types: The media type of every manifest item, in manifest order.
+    - ncx_path: The path of the NCX table of contents, if any.
+    - cover_path: The path of the cover image, if one was found.
+    """
+
+    rootfile_path: str
+    spine: list[str] = Factory(list)
+    media_types: dict[str, str] = Factory(dict)
+    ncx_path: str | None = None
+    cover_path: str | None = None
+
+    def html_paths(self) -> list[str]:
+        """
+        Get the html files, in reading order.
+        Html files in the manifest that aren't part of the spine, like the nav document, follow after.
+        """
+        paths = list(dict.fromkeys(self.spine + list(self.media_types)))
+        return [path for path in paths if PurePosixPath(path).suffix in (".html", ".xhtml")]
+
+    def css_paths(self) -> list[str]:
+        return [path for path in self.media_types if PurePosixPath(path).suffix == ".css"]
+
 
-    :param line: The line to process.
-    :return: The processed line.
+def resolve_epub_href(base_path: str, href: str) -> str:
     """
-    # Skip this if the line doesn't contain ruby tags.
-    if "<ruby>" not in line:
-        return line
+    Resolve a link found in the document at base_path to an archive path.
+
+    :param base_path: The archive path of the document containing the link.
+    :param href: The link, relative to that document.
+    :return: The normalized archive path.
+    """
+    href = unquote(href.split("#", 1)[0])
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), href))
+
+
+def parse_epub_package(epub_zip: zipfile.ZipFile) -> EpubPackage:
+    """
+    Read the container and package documents of an epub in a single pass.
+    Nothing is extracted.
+
+    :param epub_zip: The opened epub archive.
+    :return: The parsed package.
+    :raises KeyError: If a required document is missing from the archive.
+    :raises IndexError: If the container doesn't name a package document.
+    :raises etree.XMLSyntaxError: If the container or package document is malformed.
+    """
+    container = etree.fromstring(epub_zip.read("META-INF/container.xml"))
+    rootfile_path = container.xpath(
+        "/u:container/u:rootfiles/u:rootfile", namespaces=EPUB_NAMESPACES
+    )[0].get("full-path")
+    logger.debug(f"Path of root file found: {rootfile_path}")
+    opf = etree.fromstring(epub_zip.read(rootfile_path))
+
+    package = EpubPackage(rootfile_path)
+    paths_by_id = {}
+    for item in opf.xpath("//opf:manifest/opf:item", namespaces=EPUB_NAMESPACES):
+        href = item.get("href")
+        if href is None:
+            continue
+        path = resolve_epub_href(rootfile_path, href)
+        paths_by_id[item.get("id")] = path
+        package.media_types[path] = item.get("media-type", "")
+
+    for itemref in opf.xpath("//opf:spine/opf:itemref", namespaces=EPUB_NAMESPACES):
+        path = paths_by_id.get(itemref.get("idref"))
+        if path is not None:
+            package.spine.append(path)
+
+    # The spine names the NCX in EPUB 2.0, otherwise go by the media type.
+    spine_toc = opf.xpath("//opf:spine/@toc", namespaces=EPUB_NAMESPACES)
+    if spine_toc and spine_toc[0] in paths_by_id:
+        package.ncx_path = paths_by_id[spine_toc[0]]
     else:
-        states = {
-            "ruby": "start",
-            "/ruby": "end",
-            "rb": "main",
-            "/rb": "main",
-            "rt": "ruby",
-            "/rt": "main",
-        }
-        tag = ""
-        out = ""
-        main = ""
-        ruby = ""
-        cstate = "normal"
-        reading_tag = False
-
-        for char in line:
-            if char == "<":  # New tag
-                tag = ""
-                reading_tag = True
-
-            elif char == ">":  # Evaluate tag
-                reading_tag = False
-                if tag in states:
-                    cstate = states[tag]
-                    if cstate == "start":  # Ruby opened
-                        # clear current strings
-                        main = ""
-                        ruby = ""
-                        cstate = "main"
-                    if cstate == "end":  # Ruby closed
-                        # paste back untangled rubytext
-                        out += f"{main}（{ruby}）"
-                        cstate = "normal"
-                else:
-                    # leave tag untouched
-                    out += f"<{tag}>"
-
-            else:
-                if not reading_tag:
-                    if cstate == "normal":
-                        out += char
-                    elif cstate == "main":
-                        main += char
-                    elif cstate == "ruby":
-                        ruby += char
-                else:
-                    tag += char
-
-        return out
+        ncx_paths = [path for path, kind in package.media_types.items() if kind == NCX_MEDIA_TYPE]
+        package.ncx_path = ncx_paths[0] if ncx_paths else None
+
+    package.cover_path = find_epub_cover(epub_zip, opf, package, paths_by_id)
+    return package
 
 
 ####################################################################################################
@@ -208,6 +358,87 @@ def deruby(line: str) -> str:
 ####################################################################################################
 
 
+def find_epub_cover(
+    epub_zip: zipfile.ZipFile,
+    opf: etree.ElementBase,
+    package: EpubPackage,
+    paths_by_id: dict[str, str],
+) -> str | None:
+    """
+    Find the cover image of an epub, using its already parsed package document.
+
+    :param epub_zip: The opened epub archive.
+    :param opf: The parsed package document.
+    :param package: The package, with its spine already filled in.
+    :param paths_by_id: The archive paths of the manifest items, by their id.
+    :return: The archive path of the cover image, if one was found.
+    """
+    # For EPUB 2.0, we use xpath() to find a <meta>
+    # named "cover" and get the attribute "content":
+    """
+    <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+      ...
+      <meta content="my-cover-image" name="cover"/>
+      ...
+    </metadata>"""
+    cover_ids = opf.xpath(
+        "//opf:metadata/opf:meta[@name='cover']/@content", namespaces=EPUB_NAMESPACES
+    )
+    # Next, we find the <item> (in <manifest>) with this id:
+    """
+    <manifest>
+        ...
+        <item id="my-cover-image" href="images/978.jpg" ... />
+        ...
+    </manifest>
+    """
+    if cover_ids and cover_ids[0] in paths_by_id:
+        logger.debug(f"ID of cover image found: {cover_ids[0]}")
+        return paths_by_id[cover_ids[0]]
+
+    # For EPUB 3.0, We use xpath to find the <item> (in <manifest>) that
+    # has properties='cover-image' and get the attribute "href":
+    """
+    <manifest>
+      ...
+      <item href="images/cover.png" id="cover-img" media-type="image/png" properties="cover-image"/>
+      ...
+    </manifest>
+    """
+    cover_hrefs = opf.xpath(
+        "//opf:manifest/opf:item[@properties='cover-image']/@href", namespaces=EPUB_NAMESPACES
+    )
+    if cover_hrefs:
+        return resolve_epub_href(package.rootfile_path, cover_hrefs[0])
+
+    # Some EPUB files do not declare explicitly a cover image.
+    # Instead, they use an "<img src=''>" inside the first xhmtl file.
+    # The <spine> is a list that defines the linear reading order
+    # of the content documents of the book. The first item in the
+    # list is the first item in the book.
+    """
+    <spine toc="ncx">
+      <itemref idref="cover"/>
+      <itemref idref="nav"/>
+      <itemref idref="s04"/>
+    </spine>
+    """
+    if not package.spine:
+        return None
+    cover_page_path = package.spine[0]
+    logger.debug(f"Path of cover page found: {cover_page_path}")
+    try:
+        # We try to find the <img> and get the "src" attribute.
+        # It is relative to the cover page, not the package document.
+        cover_page = etree.fromstring(epub_zip.read(cover_page_path))
+        cover_srcs = cover_page.xpath("//xhtml:img/@src", namespaces=EPUB_NAMESPACES)
+    except (KeyError, etree.XMLSyntaxError):
+        return None
+    if cover_srcs:
+        return resolve_epub_href(cover_page_path, cover_srcs[0])
+    return None
+
+
 def get_epub_cover(epub_path: str | Path) -> Path | None:
     """
     Return the cover image file from an epub archive.
@@ -215,125 +446,12 @@ def get_epub_cover(epub_path: str | Path) -> Path | None:
     :param epub_path: The path to the epub file.
     :return: The path to the cover image file, if one was found.
     """
+    with zipfile.ZipFile(epub_path) as z:
+        package = parse_epub_package(z)
 
-    # Let's define the required XML namespaces
-    namespaces = {
-        "calibre": "http://calibre.kovidgoyal.net/2009/metadata",
-        "dc": "http://purl.org/dc/elements/1.1/",
-        "dcterms": "http://purl.org/dc/terms/",
-        "opf": "http://www.idpf.org/2007/opf",
-        "u": "urn:oasis:names:tc:opendocument:xmlns:container",
-        "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xhtml": "http://www.w3.org/1999/xhtml",
-    }
+    if package.cover_path is None:
+        logger.warning("Cover image not found.")
+        return None
 
-    # We open the epub archive using zipfile.ZipFile():
-    with zipfile.ZipFile(epub_path) as z:
-        # We load "META-INF/container.xml" using lxml.etree.fromString():
-        t = etree.fromstring(z.read("META-INF/container.xml"))
-        # We use xpath() to find the attribute "full-path":
-        """
-        <container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
-          <rootfiles>
-            <rootfile full-path="OEBPS/content.opf" ... />
-          </rootfiles>
-        </container>
-        """
-        rootfile_path = t.xpath("/u:container/u:rootfiles/u:rootfile", namespaces=namespaces)[
-            0
-        ].get("full-path")
-        logger.debug("Path of root file found: " + rootfile_path)
-
-        # We load the "root" file, indicated by the "full_path" attribute of "META-INF/container.xml", using lxml.etree.fromString():
-        t = etree.fromstring(z.read(rootfile_path))
-
-        cover_href = None
-        try:
-            # For EPUB 2.0, we use xpath() to find a <meta>
-            # named "cover" and get the attribute "content":
-            """
-            <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
-              ...
-              <meta content="my-cover-image" name="cover"/>
-              ...
-            </metadata>"""
-
-            cover_id = t.xpath("//opf:metadata/opf:meta[@name='cover']", namespaces=namespaces)[
-                0
-            ].get("content")
-            logger.debug("ID of cover image found: " + cover_id)
-            # Next, we use xpath() to find the <item> (in <manifest>) with this id
-            # and get the attribute "href":
-            """
-            <manifest>
-                ...
-                <item id="my-cover-image" href="images/978.jpg" ... />
-                ... 
-            </manifest>
-            """
-            cover_href = t.xpath(
-                "//opf:manifest/opf:item[@id='" + cover_id + "']", namespaces=namespaces
-            )[0].get("href")
-        except IndexError:
-            pass
-
-        if not cover_href:
-            # For EPUB 3.0, We use xpath to find the <item> (in <manifest>) that
-            # has properties='cover-image' and get the attribute "href":
-            """
-            <manifest>
-              ...
-              <item href="images/cover.png" id="cover-img" media-type="image/png" properties="cover-image"/>
-              ...
-            </manifest>
-            """
-            try:
-                cover_href = t.xpath(
-                    "//opf:manifest/opf:item[@properties='cover-image']", namespaces=namespaces
-                )[0].get("href")
-            except IndexError:
-                pass
-
-        if not cover_href:
-            # Some EPUB files do not declare explicitly a cover image.
-            # Instead, they use an "<img src=''>" inside the first xhmtl file.
-            try:
-                # The <spine> is a list that defines the linear reading order
-                # of the content documents of the book. The first item in the
-                # list is the first item in the book.
-                """
-                <spine toc="ncx">
-                  <itemref idref="cover"/>
-                  <itemref idref="nav"/>
-                  <itemref idref="s04"/>
-                </spine>
-                """
-                cover_page_id = t.xpath("//opf:spine/opf:itemref", namespaces=namespaces)[0].get(
-                    "idref"
-                )
-                # Next, we use xpath() to find the item (in manifest) with this id
-                # and get the attribute "href":
-                cover_page_href = t.xpath(
-                    "//opf:manifest/opf:item[@id='" + cover_page_id + "']", namespaces=namespaces
-                )[0].get("href")
-                # In order to get the full path for the cover page,
-                # we have to join rootfile_path and cover_page_href:
-                cover_page_path = Path(rootfile_path).parent / cover_page_href
-                logger.debug(f"Path of cover page found: {cover_page_path}")
-                # We try to find the <img> and get the "src" attribute:
-                t = etree.fromstring(z.read(cover_page_path))
-                cover_href = t.xpath("//xhtml:img", namespaces=namespaces)[0].get("src")
-            except IndexError:
-                pass
-
-        if not cover_href:
-            logger.warning("Cover image not found.")
-            return None
-
-        # In order to get the full path for the cover image,
-        # we have to join rootfile_path and cover_href:
-        cover_path = Path(rootfile_path).parent / cover_href
-        logger.debug(f"Path of cover image found: {cover_path}")
-
-        # We return the image path
-        return Path(cover_path)
+    logger.debug(f"Path of cover image found: {package.cover_path}")
+    return Path(package.cover_path)
@@ -3,8 +3,8 @@
 Purpose:
 This script is designed to create sparse copies of theme directories based on the structure specified in a YAML file.
 It aims to extract only the essential files as defined in the YAML file and replicate the directory structure in the
-current working directory. Additionally, the script generates a Qt resource file (theme_icons.qrc), which lists all
-the copied files, making it convenient for use in Qt applications.
+current working directory. Afterwards, build_resource_bundle.py lists the copied files in a Qt resource file,
+which is compiled into the resource bundle the program loads its icons from.
 
 This only works on Linux systems that have Qt theme icons installed.
 
@@ -41,7 +41,6 @@ Files:
 The script performs the following tasks:
 1. Parse the YAML file to obtain the theme directory paths and file structure.
 2. Create sparse copies of the theme directories, copying only the specified files.
-3. Generate the theme_icons.qrc file, listing all the copied files with their relative paths.
 
 Usage:
 - Make sure the YAML file with the desired structure is in the current working directory and named "theme_list.yaml".
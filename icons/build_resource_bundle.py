@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Purpose:
+Generate the Qt resource file (deepqt/data/resources.qrc) listing the bundled theme icons,
+custom icons and color themes. The Makefile compiles it with rcc into a binary bundle
+(deepqt/data/resources.rcc), which the program registers at startup. Qt maps the bundle into memory,
+so icons are then resolved through :/ paths instead of searching the package data on disk.
+
+The bundle is laid out as follows:
+    :/icons/<theme>/...          The sparse icon themes made by build_icon_cache.py.
+                                 Qt searches :/icons for icon themes by default.
+    :/custom_icons/...           The custom icons, including the dark and light variants.
+    :/color_themes/<theme>       The color palettes.
+
+Usage:
+- Run from the repository root, after build_icon_cache.py if the icon themes changed.
+"""
+
+from pathlib import Path
+import xml.etree.ElementTree as ET
+
+DATA_DIR = Path("deepqt/data")
+QRC_PATH = DATA_DIR / "resources.qrc"
+
+# Maps each resource prefix to the data directory whose files it holds.
+BUNDLED_DIRS = {
+    "/icons": "theme_icons",
+    "/custom_icons": "custom_icons",
+    "/color_themes": "color_themes",
+}
+
+# Python package files living next to the data.
+SKIPPED_NAMES = {"__init__.py", "__pycache__"}
+
+
+def collect_files(directory: Path) -> list[Path]:
+    """
+    Find all data files in the directory, skipping python package files.
+
+    :param directory: The directory to search.
+    :return: The files, relative to the directory, sorted for stable output.
+    """
+    files = []
+    for path in sorted(directory.rglob("*")):
+        relative = path.relative_to(directory)
+        if path.is_dir() or SKIPPED_NAMES.intersection(relative.parts):
+            continue
+        files.append(relative)
+    return files
+
+
+def build_qrc(data_dir: Path) -> ET.ElementTree:
+    """
+    Build the resource file listing all bundled files.
+    File paths are relative to the data directory, where the resource file is written.
+
+    :param data_dir: The package's data directory.
+    :return: The resource file's element tree.
+    """
+    root = ET.Element("RCC", version="1.0")
+    for prefix, directory_name in BUNDLED_DIRS.items():
+        resource = ET.SubElement(root, "qresource", prefix=prefix)
+        for relative in collect_files(data_dir / directory_name):
+            file = ET.SubElement(resource, "file", alias=relative.as_posix())
+            file.text = (Path(directory_name) / relative).as_posix()
+    ET.indent(root)
+    return ET.ElementTree(root)
+
+
+def main() -> None:
+    """
+    Write the resource file for the bundle.
+    """
+    tree = build_qrc(DATA_DIR)
+    tree.write(QRC_PATH, encoding="unicode")
+    file_count = len(tree.getroot().findall("./qresource/file"))
+    print(f"Wrote {QRC_PATH} with {file_count} files.")
+
+
+if __name__ == "__main__":
+    main()
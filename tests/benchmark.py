@@ -0,0 +1,487 @@
+"""
+End-to-end performance benchmarks on synthetic corpora.
+
+Everything runs headless, without Qt widgets or network access, so it works on any CI machine:
+    python -m tests.benchmark --scale 2 --output benchmark.json
+
+The results are stored as JSON, along with the commit they were measured at.
+To see regressions across commits, compare against an earlier result:
+    python -m tests.benchmark --baseline benchmark.json --output new.json
+This exits with an error if any stage got slower than the tolerance allows.
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import zipfile
+from pathlib import Path
+from typing import Callable
+
+from attrs import define, Factory
+from loguru import logger
+
+import deepqt.backends.mock_backend as mb
+import deepqt.config as cfg
+import deepqt.glossary as gls
+import deepqt.structures as st
+import deepqt.translation_engine as te
+import deepqt.translation_interface as ti
+import deepqt.utils as ut
+import deepqt.xml_parser as xp
+
+RESULTS_VERSION = 1
+
+# At scale 1, the text file has this many characters, and the epub this many chapters.
+BASE_TEXT_CHARS = 1_000_000
+BASE_EPUB_CHAPTERS = 24
+EPUB_CHAPTER_CHARS = 20_000
+# Detecting a legacy encoding falls back to chardet, which is much slower per byte.
+BASE_LEGACY_CHARS = 50_000
+# Lines of densely annotated html, to flatten the ruby markup of.
+BASE_RUBY_LINES = 20_000
+RUBY_LINE = (
+    "<p>前<ruby>漢字<rt>かんじ</rt></ruby>後"
+    "<ruby><rb>皇</rb><rt>こう</rt><rb>室</rb><rt>しつ</rt></ruby></p>"
+)
+
+# The partitioning parameters of a typical run.
+MAX_CHUNKS = 20
+MIN_CHUNK_SIZE = 5000
+
+# A benchmark is a regression if it takes this much longer than the baseline.
+DEFAULT_TOLERANCE = 1.25
+
+NAMES = ["Tanaka", "Suzuki", "Aoi", "Haruto", "Yuki", "Sakura", "Ren", "Mio"]
+HONORIFICS = ["さん", "くん", "ちゃん", "様", "先生"]
+KANA = (
+    "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+)
+KANJI = "日本語学校先生時間今年大人気分電車世界自分"
+PUNCTUATION = "、。！？"
+
+
+@define
+class Corpus:
+    """
+    The synthetic inputs, generated once per run.
+    """
+
+    directory: Path
+    text_path: Path
+    legacy_path: Path
+    epub_path: Path
+    text: str
+    glossary: st.Glossary
+    html_texts: list[str] = Factory(list)
+    ruby_text: str = ""
+
+
+@define
+class BenchmarkResult:
+    seconds: float
+    min_seconds: float
+    repeats: int
+    chars: int
+
+    @property
+    def chars_per_second(self) -> float:
+        return self.chars / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "min_seconds": self.min_seconds,
+            "repeats": self.repeats,
+            "chars": self.chars,
+            "chars_per_second": self.chars_per_second,
+        }
+
+
+def make_line(rng: random.Random) -> str:
+    """
+    Generate a line resembling a light novel, with names, honorifics and dialogue.
+    """
+    words = []
+    for _ in range(rng.randint(3, 12)):
+        if rng.random() < 0.2:
+            words.append(rng.choice(NAMES) + rng.choice(HONORIFICS))
+        else:
+            words.append("".join(rng.choices(KANA + KANJI, k=rng.randint(2, 8))))
+        words.append(rng.choice(PUNCTUATION) if rng.random() < 0.2 else "")
+    line = "".join(words)
+    if rng.random() < 0.3:
+        line = f"「{line}」"
+    return line
+
+
+def make_text(char_count: int, seed: int = 0) -> str:
+    """
+    Generate a text of about the given length, in lines separated by blank lines.
+
+    :param char_count: The number of characters to generate, at least.
+    :param seed: The seed, so the same corpus is generated every time.
+    :return: The text.
+    """
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    while length < char_count:
+        line = make_line(rng)
+        lines.append(line)
+        length += len(line) + 1
+        if rng.random() < 0.2:
+            lines.append("")
+            length += 1
+    return "\n".join(lines) + "\n"
+
+
+def make_html(text: str, title: str) -> str:
+    """
+    Wrap the lines of a text in xhtml, with the markup found in real epubs.
+    """
+    paragraphs = []
+    for index, line in enumerate(text.splitlines()):
+        if not line:
+            paragraphs.append("    <p><br/></p>")
+        elif index % 7 == 0:
+            paragraphs.append(
+                f'    <p><span class="koboSpan" id="kobo.{index}.1">'
+                f"<ruby>{line[:1]}<rt>か</rt></ruby>{line[1:]}</span></p>"
+            )
+        else:
+            paragraphs.append(f"    <p>{line}</p>")
+    body = "\n".join(paragraphs)
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="ja">\n'
+        f"<head><title>{title}</title>"
+        '<link rel="stylesheet" type="text/css" href="../style.css"/></head>\n'
+        f"<body>\n{body}\n</body>\n</html>\n"
+    )
+
+
+def make_epub(path: Path, html_texts: list[str]) -> None:
+    """
+    Write an epub 2.0 file with the given chapters.
+
+    :param path: The file to write.
+    :param html_texts: The xhtml contents of each chapter.
+    """
+    chapter_names = [f"text/chapter_{i:03}.xhtml" for i in range(len(html_texts))]
+    manifest = "\n".join(
+        f'    <item id="ch{i}" href="{name}" media-type="application/xhtml+xml"/>'
+        for i, name in enumerate(chapter_names)
+    )
+    spine = "\n".join(f'    <itemref idref="ch{i}"/>' for i in range(len(chapter_names)))
+    nav_points = "\n".join(
+        f'  <navPoint id="np{i}" playOrder="{i + 1}"><navLabel><text>第{i + 1}章</text>'
+        f'</navLabel><content src="{name}"/></navPoint>'
+        for i, name in enumerate(chapter_names)
+    )
+    opf = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="2.0" unique-identifier="id">\n'
+        '  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        "<dc:title>Benchmark</dc:title><dc:language>ja</dc:language></metadata>\n"
+        f'  <manifest>\n{manifest}\n    <item id="ncx" href="toc.ncx" '
+        'media-type="application/x-dtbncx+xml"/>\n'
+        '    <item id="css" href="style.css" media-type="text/css"/>\n  </manifest>\n'
+        f'  <spine toc="ncx">\n{spine}\n  </spine>\n</package>\n'
+    )
+    ncx = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+        f"<navMap>\n{nav_points}\n</navMap>\n</ncx>\n"
+    )
+    container = (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n'
+        '  <rootfiles><rootfile full-path="OEBPS/content.opf" '
+        'media-type="application/oebps-package+xml"/></rootfiles>\n</container>\n'
+    )
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as epub_zip:
+        epub_zip.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        epub_zip.writestr("META-INF/container.xml", container)
+        epub_zip.writestr("OEBPS/content.opf", opf)
+        epub_zip.writestr("OEBPS/toc.ncx", ncx)
+        epub_zip.writestr("OEBPS/style.css", "body { writing-mode: vertical-rl; }\n")
+        for name, html in zip(chapter_names, html_texts):
+            epub_zip.writestr(f"OEBPS/{name}", html)
+
+
+def make_glossary() -> st.Glossary:
+    """
+    Build a glossary like the ones users maintain for a series.
+    """
+    glossary = st.Glossary(
+        # Translated names end in a lowercase letter and a space, which the honorifics follow.
+        exact_terms={name: f"{name.lower()} " for name in NAMES},
+        honorific_terms={honorific: f"-{honorific}" for honorific in HONORIFICS},
+        post_terms={"「": '"', "」": '"'},
+    )
+    # Pad it out with terms that rarely match, which still cost time in the trie.
+    for i in range(500):
+        glossary.exact_terms[f"用語{i:03}"] = f"Term{i}"
+    glossary.generate_patterns()
+    glossary.hash = "benchmark"
+    return glossary
+
+
+def make_corpus(directory: Path, scale: float) -> Corpus:
+    """
+    Generate all inputs for the benchmarks.
+
+    :param directory: The directory to write the input files to.
+    :param scale: Multiplies the size of every input.
+    :return: The corpus.
+    """
+    text = make_text(round(BASE_TEXT_CHARS * scale))
+    text_path = directory / "novel.txt"
+    text_path.write_text(text, encoding="utf-8")
+
+    legacy_path = directory / "novel_shift_jis.txt"
+    legacy_path.write_bytes(make_text(round(BASE_LEGACY_CHARS * scale), seed=1).encode("shift_jis"))
+
+    chapter_count = max(2, round(BASE_EPUB_CHAPTERS * scale))
+    html_texts = [
+        make_html(make_text(EPUB_CHAPTER_CHARS, seed=100 + i), f"第{i + 1}章")
+        for i in range(chapter_count)
+    ]
+    epub_path = directory / "novel.epub"
+    make_epub(epub_path, html_texts)
+
+    return Corpus(
+        directory=directory,
+        text_path=text_path,
+        legacy_path=legacy_path,
+        epub_path=epub_path,
+        text=text,
+        glossary=make_glossary(),
+        html_texts=html_texts,
+        ruby_text="\n".join(RUBY_LINE for _ in range(max(1, round(BASE_RUBY_LINES * scale)))),
+    )
+
+
+def time_benchmark(function: Callable[[], int], repeat: int) -> BenchmarkResult:
+    """
+    Run a benchmark several times, keeping the median, which is robust to the odd hiccup.
+
+    :param function: Performs the work once, returning the number of characters processed.
+    :param repeat: The number of runs.
+    :return: The timing.
+    """
+    timings = []
+    chars = 0
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        chars = function()
+        timings.append(time.perf_counter() - start)
+    return BenchmarkResult(statistics.median(timings), min(timings), len(timings), chars)
+
+
+def make_benchmarks(corpus: Corpus) -> dict[str, Callable[[], int]]:
+    """
+    Define the benchmarks, each running one stage of the pipeline on the corpus.
+
+    :param corpus: The inputs.
+    :return: The benchmark functions, by name, in pipeline order.
+    """
+    epub_options = cfg.Config().epub_options()
+    # Give each epub run its own cache, otherwise later runs would merely load the first one's.
+    epub_runs = itertools.count()
+
+    def load_text_file() -> int:
+        return len(st.TextFile(corpus.text_path).text)
+
+    def detect_encoding_utf8() -> int:
+        ut._encoding_cache.clear()
+        assert ut.detect_encoding(corpus.text_path) in ("utf-8", "ascii")
+        return corpus.text_path.stat().st_size
+
+    def detect_encoding_legacy() -> int:
+        ut._encoding_cache.clear()
+        ut.detect_encoding(corpus.legacy_path)
+        return corpus.legacy_path.stat().st_size
+
+    def prepare_html_text() -> int:
+        for html in corpus.html_texts:
+            xp.prepare_html_text(
+                html, nuke_ruby=True, nuke_indents=True, nuke_kobo=True, crush_html_text=True
+            )
+        return sum(len(html) for html in corpus.html_texts)
+
+    def deruby() -> int:
+        xp.deruby(corpus.ruby_text)
+        return len(corpus.ruby_text)
+
+    def apply_glossary() -> int:
+        gls.process_text(corpus.text, corpus.glossary)
+        return len(corpus.text)
+
+    def partition_text() -> int:
+        ti.partition_text(corpus.text, MAX_CHUNKS, MIN_CHUNK_SIZE)
+        return len(corpus.text)
+
+    def mock_translation() -> int:
+        spans = ti.partition_text(corpus.text, MAX_CHUNKS, MIN_CHUNK_SIZE)
+        chunks = [corpus.text[start:end] for start, end in spans]
+        te.TranslationEngine(mb.MockBackend()).translate(chunks)
+        return len(corpus.text)
+
+    def load_epub() -> int:
+        epub = st.EpubFile(
+            path=corpus.epub_path, cache_dir=corpus.directory / f"epub_{next(epub_runs)}"
+        )
+        epub.initialize_files(**epub_options)
+        return epub.char_count
+
+    epub = st.EpubFile(path=corpus.epub_path, cache_dir=corpus.directory / "epub_repack")
+    epub.initialize_files(**epub_options)
+
+    def repack_epub() -> int:
+        epub.write(st.ProcessLevel.RAW, corpus.directory / "repacked.epub")
+        return epub.char_count
+
+    return {
+        "load_text_file": load_text_file,
+        "detect_encoding_utf8": detect_encoding_utf8,
+        "detect_encoding_legacy": detect_encoding_legacy,
+        "prepare_html_text": prepare_html_text,
+        "deruby": deruby,
+        "apply_glossary": apply_glossary,
+        "partition_text": partition_text,
+        "mock_translation": mock_translation,
+        "load_epub": load_epub,
+        "repack_epub": repack_epub,
+    }
+
+
+def current_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        )
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    scale: float = 1.0, repeat: int = 3, only: list[str] | None = None, work_dir: Path | None = None
+) -> dict:
+    """
+    Generate the corpus and time every benchmark on it.
+
+    :param scale: Multiplies the size of every input.
+    :param repeat: The number of runs per benchmark.
+    :param only: [Optional] The names of the benchmarks to run, defaults to all.
+    :param work_dir: [Optional] Where to put the corpus, defaults to a temporary directory.
+    :return: The results, ready to be stored as JSON.
+    """
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = tempfile.mkdtemp(prefix="deepqt_benchmark_")
+        work_dir = Path(temp_dir)
+    try:
+        corpus = make_corpus(work_dir, scale)
+        results = {}
+        for name, function in make_benchmarks(corpus).items():
+            if only and name not in only:
+                continue
+            results[name] = time_benchmark(function, repeat).to_dict()
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return {
+        "version": RESULTS_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "benchmarks": results,
+    }
+
+
+def compare_results(
+    baseline: dict, current: dict, tolerance: float = DEFAULT_TOLERANCE
+) -> tuple[list[str], list[str]]:
+    """
+    Compare two benchmark runs, which should have been made at the same scale.
+
+    :param baseline: The earlier results.
+    :param current: The new results.
+    :param tolerance: How many times slower a benchmark may get before it counts as a regression.
+    :return: A line per benchmark in both runs, and the names of those that regressed.
+    """
+    lines = []
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        before = baseline["benchmarks"][name]["seconds"]
+        ratio = result["seconds"] / before if before else 1.0
+        regressed = ratio > tolerance
+        if regressed:
+            regressions.append(name)
+        lines.append(
+            f"{name:<24} {before:>10.4f}s -> {result['seconds']:>10.4f}s  {ratio:>6.2f}x"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return lines, regressions
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'benchmark':<24} {'seconds':>11} {'chars/s':>14}"]
+    for name, result in results["benchmarks"].items():
+        lines.append(f"{name:<24} {result['seconds']:>10.4f}s {result['chars_per_second']:>14,.0f}")
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the processing pipeline.")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies the corpus size.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark.")
+    parser.add_argument("--only", nargs="*", help="Run only these benchmarks.")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", type=Path, help="Compare against earlier results.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    # The debug logging and parser warnings would drown out the results.
+    logger.disable("deepqt")
+    warnings.simplefilter("ignore")
+    results = run_benchmarks(args.scale, args.repeat, args.only)
+    print(format_results(results))
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("scale") != results["scale"]:
+            print(f"Warning: the baseline was measured at scale {baseline.get('scale')}.")
+        lines, regressions = compare_results(baseline, results, args.tolerance)
+        print("\n".join(lines))
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
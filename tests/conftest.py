@@ -0,0 +1,10 @@
+import ctypes
+
+import PySide6
+
+# PySide6 6.12.0 returns the result of Signal.emit without taking a reference to it, so every
+# emission whose result is discarded releases a reference to True that was never taken.
+# Enough emissions in one session deallocate True while the interpreter shuts down, crashing it
+# after all tests passed. Make up for them with references that are never released.
+if PySide6.__version_info__[:3] == (6, 12, 0):
+    ctypes.c_ssize_t.from_address(id(True)).value += 1_000_000
@@ -0,0 +1,48 @@
+import json
+
+import deepqt.translation_interface as ti
+import tests.benchmark as bm
+
+
+def test_benchmarks_run_headless(tmp_path):
+    results = bm.run_benchmarks(scale=0.02, repeat=1, work_dir=tmp_path)
+
+    assert list(results["benchmarks"]) == [
+        "load_text_file",
+        "detect_encoding_utf8",
+        "detect_encoding_legacy",
+        "prepare_html_text",
+        "deruby",
+        "apply_glossary",
+        "partition_text",
+        "mock_translation",
+        "load_epub",
+        "repack_epub",
+    ]
+    for result in results["benchmarks"].values():
+        assert result["seconds"] > 0
+        assert result["chars"] > 0
+    # The results must survive being stored.
+    assert json.loads(json.dumps(results)) == results
+
+
+def test_corpus_is_deterministic(tmp_path):
+    text = bm.make_text(10_000)
+    assert text == bm.make_text(10_000)
+    assert len(text) >= 10_000
+    assert len(ti.partition_text(text, bm.MAX_CHUNKS, bm.MIN_CHUNK_SIZE)) == 3
+
+    corpus = bm.make_corpus(tmp_path, scale=0.02)
+    assert bm.gls.process_text("田中Tanakaさん", corpus.glossary) == "田中tanaka-さん"
+
+
+def test_compare_results():
+    def make_results(**seconds: float) -> dict:
+        return {"benchmarks": {name: {"seconds": value} for name, value in seconds.items()}}
+
+    lines, regressions = bm.compare_results(
+        make_results(load=1.0, glossary=1.0, removed=1.0),
+        make_results(load=1.1, glossary=2.0, added=1.0),
+    )
+    assert regressions == ["glossary"]
+    assert len(lines) == 2
@@ -0,0 +1,84 @@
+import pytest
+
+import deepqt.deduplication as dd
+
+SEPARATOR = "* * *"
+DISCLAIMER = "This translation is not affiliated with the publisher."
+
+
+class Recorder:
+    """
+    Translates by upper-casing, and records everything sent.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts: list[str]) -> list[str]:
+        self.batches.append(texts)
+        return [text.upper() for text in texts]
+
+
+def test_find_repeated_lines():
+    texts = [
+        f"{DISCLAIMER}\nYes.\n{SEPARATOR}\nOnce.\n",
+        f"  {DISCLAIMER}  \nYes.\n{SEPARATOR}\n\n\n",
+    ]
+    # Short lines with words stay in their context, blank lines are ignored.
+    assert dd.find_repeated_lines(texts) == {DISCLAIMER, SEPARATOR}
+    assert dd.find_repeated_lines(texts, min_count=3) == set()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        f"Start.\n\n  {DISCLAIMER}\t\nMiddle.\n{SEPARATOR}\r\nEnd.",
+        f"{DISCLAIMER}\n{DISCLAIMER}\n",
+        "\n\nNothing repeated.\n\n",
+        "",
+    ],
+)
+def test_segments_keep_layout(text):
+    deduplicator = dd.Deduplicator({DISCLAIMER, SEPARATOR})
+    segments = deduplicator.segments(text)
+    assert "".join(segment for segment, _ in segments) == text
+    for segment, needs_translation in segments:
+        assert needs_translation == bool(segment.strip())
+        assert not needs_translation or segment == segment.strip("\r\n")
+
+
+def test_translate_sends_repeats_once():
+    deduplicator = dd.Deduplicator({DISCLAIMER})
+    recorder = Recorder()
+    texts = [f"{DISCLAIMER}\nOne.\n", f"{DISCLAIMER}\nTwo.\n", f"{DISCLAIMER}\nOne.\n"]
+
+    assert deduplicator.translate(texts, recorder) == [text.upper() for text in texts]
+    assert recorder.batches == [[DISCLAIMER, "One.", "Two."]]
+    assert deduplicator.saved_chars == 2 * len(DISCLAIMER) + len("One.")
+
+    # Later requests reuse the translations too, and aren't sent at all if nothing is new.
+    assert deduplicator.translate([f"One.\n\n{DISCLAIMER}"], recorder) == [
+        f"ONE.\n\n{DISCLAIMER.upper()}"
+    ]
+    assert len(recorder.batches) == 1
+
+
+def test_translate_lean_memory():
+    deduplicator = dd.Deduplicator({DISCLAIMER}, remember_all=False)
+    recorder = Recorder()
+    deduplicator.translate([f"{DISCLAIMER}\nOne."], recorder)
+    deduplicator.translate([f"{DISCLAIMER}\nOne."], recorder)
+
+    assert recorder.batches == [[DISCLAIMER, "One."], ["One."]]
+    assert set(deduplicator.memory) == {DISCLAIMER}
+
+
+def test_translate_without_splitting():
+    deduplicator = dd.Deduplicator({DISCLAIMER})
+    recorder = Recorder()
+    html = f"<p>{DISCLAIMER}</p>\n<p>Text</p>"
+    results = deduplicator.translate([html, html, "  "], recorder, split_lines=False)
+
+    assert results == [html.upper(), html.upper(), "  "]
+    assert recorder.batches == [[html]]
+    assert deduplicator.saved_chars == len(html)
@@ -50,3 +50,33 @@ def test_read_text_encoding(file_name, expected_message):
     assert (
         recovered_message == expected_message
     ), f"Failed for encoding in {file_name}: Got {recovered_message}"
+
+
+def test_detect_encoding_large_utf8(tmp_path, monkeypatch):
+    # Only a sample is inspected, so non-ASCII text further in still counts as UTF-8.
+    path = tmp_path / "large.txt"
+    path.write_bytes(b"a" * ut.ENCODING_SAMPLE_BYTES + "ü".encode("utf-8"))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("Valid UTF-8 shouldn't need chardet.")
+
+    monkeypatch.setattr(ut.chardet.universaldetector, "UniversalDetector", fail)
+    assert ut.detect_encoding(path) == "utf-8"
+
+
+def test_detect_encoding_bom(tmp_path):
+    path = tmp_path / "bom.txt"
+    path.write_text("Grüße", encoding="utf-8-sig")
+    assert ut.detect_encoding(path) == "utf-8-sig"
+    with ut.read_autodetect_encoding(path) as f:
+        assert f.read() == "Grüße"
+
+
+def test_detect_encoding_cached(tmp_path):
+    path = tmp_path / "cached.txt"
+    path.write_text("Grüße", encoding="utf-8")
+    assert ut.detect_encoding(path) == "utf-8"
+
+    # A modified file is detected again.
+    path.write_text("Grüße aus Köln", encoding="utf-16")
+    assert ut.detect_encoding(path) == "utf-16"
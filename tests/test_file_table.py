@@ -0,0 +1,64 @@
+import time
+
+import PySide6.QtCore as Qc
+import PySide6.QtWidgets as Qw
+import pytest
+
+import deepqt.config as cfg
+import deepqt.file_table as ft
+import deepqt.structures as st
+import deepqt.utils as ut
+import tests.mock_files.mime_types as mime_files
+from tests.helpers import mock_file_path
+
+
+@pytest.fixture(scope="module")
+def app():
+    return Qw.QApplication.instance() or Qw.QApplication([])
+
+
+@pytest.fixture
+def table(app, tmp_path, monkeypatch) -> ft.FileTable:
+    monkeypatch.setattr(ut, "epub_cache_path", lambda: tmp_path)
+    monkeypatch.setattr(ft, "make_output_filename", lambda input_file, config: input_file.path)
+    table = ft.FileTable()
+    table.set_config(cfg.Config())
+    table.add_file(mock_file_path("book.epub", module=mime_files))
+    return table
+
+
+def wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        Qc.QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+def test_epubs_load_in_the_background(table):
+    epub = next(iter(table.files.values()))
+    assert not epub.initialized
+
+    loaded = []
+    table.epub_files_loaded.connect(loaded.append)
+    assert table.load_all_epub_files()
+    wait_for(lambda: loaded)
+
+    assert loaded == [True]
+    assert epub.initialized
+    assert not epub.locked
+    # Nothing left to load, so the translation can start right away.
+    assert not table.load_all_epub_files()
+
+
+def test_failed_epub_load_is_reported(table, monkeypatch):
+
+    def fail(*args, **kwargs):
+        raise ValueError("Broken epub.")
+
+    monkeypatch.setattr(st.EpubFile, "initialize_files", fail)
+    loaded = []
+    table.epub_files_loaded.connect(loaded.append)
+    assert table.load_all_epub_files()
+    wait_for(lambda: loaded)
+    assert loaded == [False]
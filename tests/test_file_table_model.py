@@ -0,0 +1,79 @@
+import time
+
+import PySide6.QtCore as Qc
+import pytest
+
+import deepqt.file_table_model as ftm
+from deepqt.file_table_model import Column
+
+
+@pytest.fixture(scope="module")
+def app():
+    return Qc.QCoreApplication.instance() or Qc.QCoreApplication([])
+
+
+def make_model(row_count: int) -> ftm.FileTableModel:
+    model = ftm.FileTableModel()
+    for i in range(row_count):
+        model.append_row(f"id{i}", {Column.FILENAME: f"file{i}.txt", Column.STATUS: "File added"})
+    return model
+
+
+def test_row_index_follows_removals(app):
+    model = make_model(60)
+    model.remove_row("id10")
+    model.remove_row("id0")
+
+    assert model.rowCount() == 58
+    assert model.file_ids()[:2] == ["id1", "id2"]
+    for row, file_id in enumerate(model.file_ids()):
+        assert model.row_of(file_id) == row
+    assert model.row_of("id10") is None
+    assert model.data(model.index(8, Column.FILENAME)) == "file9.txt"
+    assert model.data(model.index(8, Column.ID)) == "id9"
+
+    model.clear()
+    assert model.rowCount() == 0
+    assert model.row_of("id1") is None
+
+
+def test_updates_are_coalesced(app):
+    model = make_model(60)
+    emitted = []
+    model.dataChanged.connect(
+        lambda top_left, bottom_right: emitted.append(
+            (top_left.row(), top_left.column(), bottom_right.row(), bottom_right.column())
+        )
+    )
+
+    for i in range(10, 50):
+        model.set_text(f"id{i}", Column.STATUS, f"Chunk {i}")
+    model.set_text("id30", Column.CHARS, "1,000")
+    # Files removed in the meantime are ignored.
+    model.set_text("missing", Column.STATUS, "Ready")
+
+    # The values are stored right away, but the views haven't been notified yet.
+    assert model.text("id23", Column.STATUS) == "Chunk 23"
+    assert emitted == []
+
+    model.flush_changes()
+    assert emitted == [(10, Column.STATUS, 49, Column.CHARS)]
+
+    # Setting the same text again doesn't count as a change.
+    model.set_text("id23", Column.STATUS, "Chunk 23")
+    model.flush_changes()
+    assert len(emitted) == 1
+
+
+def test_updates_flushed_by_timer(app):
+    model = make_model(10)
+    emitted = []
+    model.dataChanged.connect(lambda *_: emitted.append(True))
+
+    for _ in range(50):
+        model.set_text("id3", Column.STATUS, str(time.perf_counter()))
+    deadline = time.monotonic() + 5
+    while not emitted and time.monotonic() < deadline:
+        Qc.QCoreApplication.processEvents()
+        time.sleep(0.01)
+    assert emitted == [True]
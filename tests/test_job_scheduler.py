@@ -0,0 +1,178 @@
+import threading
+import time
+
+import PySide6.QtCore as Qc
+import pytest
+
+import deepqt.job_scheduler as js
+import deepqt.worker_thread as wt
+
+
+@pytest.fixture(scope="module")
+def app():
+    return Qc.QCoreApplication.instance() or Qc.QCoreApplication([])
+
+
+class Recorder:
+    """
+    Creates workers that log when they run, and block until released.
+    Once released, they stop if they were asked to abort in the meantime.
+    """
+
+    def __init__(self) -> None:
+        self.started: list[str] = []
+        self.finished: list[tuple[str, bool]] = []
+        self.release = threading.Event()
+        self.flags: dict[str, wt.SharableFlag] = {}
+
+    def factory(self, name: str):
+        def make_worker() -> wt.Worker:
+            worker = wt.Worker(self.work, name, no_progress_callback=True, abortable=True)
+            self.flags[name] = worker.aborted
+            return worker
+
+        return make_worker
+
+    def work(self, name: str, abort_flag: wt.SharableFlag) -> str:
+        self.started.append(name)
+        self.release.wait(5)
+        abort_flag.raise_if_set()
+        return name
+
+    def on_finished(self, key: str, superseded: bool) -> None:
+        self.finished.append((key, superseded))
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out."
+        Qc.QCoreApplication.processEvents()
+        time.sleep(0.005)
+
+
+def make_scheduler(max_running: int, thread_count: int = 4) -> tuple[js.JobScheduler, Recorder]:
+    pool = Qc.QThreadPool()
+    pool.setMaxThreadCount(thread_count)
+    scheduler = js.JobScheduler(pool, max_running)
+    recorder = Recorder()
+    scheduler.job_finished.connect(recorder.on_finished)
+    return scheduler, recorder
+
+
+def test_identical_jobs_are_deduplicated(app):
+    scheduler, recorder = make_scheduler(1)
+    assert scheduler.submit("a", 1, recorder.factory("a1"))
+    assert not scheduler.submit("a", 1, recorder.factory("a2"))
+    assert scheduler.submit("b", 1, recorder.factory("b1"))
+    assert not scheduler.submit("b", 1, recorder.factory("b2"))
+
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+    assert recorder.started == ["a1", "b1"]
+    assert recorder.finished == [("a", False), ("b", False)]
+
+
+def test_waiting_job_is_replaced(app):
+    scheduler, recorder = make_scheduler(1)
+    scheduler.submit("a", 1, recorder.factory("a1"))
+    scheduler.submit("b", 1, recorder.factory("b1"))
+    scheduler.submit("b", 2, recorder.factory("b2"))
+    scheduler.submit("b", 3, recorder.factory("b3"))
+    assert scheduler.is_busy("b")
+
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+    assert recorder.started == ["a1", "b3"]
+
+
+def test_running_job_is_aborted_and_followed(app):
+    scheduler, recorder = make_scheduler(2)
+    scheduler.submit("a", 1, recorder.factory("a1"))
+    wait_for(lambda: recorder.started == ["a1"])
+    scheduler.submit("a", 2, recorder.factory("a2"))
+
+    # The new job must wait for the old one to stop, even though a slot is free.
+    assert recorder.flags["a1"].get()
+    assert "a2" not in recorder.flags
+
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+    assert recorder.started == ["a1", "a2"]
+    assert recorder.finished == [("a", True), ("a", False)]
+
+
+def test_cancel_resumed_by_same_job(app):
+    scheduler, recorder = make_scheduler(1)
+    scheduler.submit("a", 1, recorder.factory("a1"))
+    assert scheduler.cancel("a")
+    assert not scheduler.submit("a", 1, recorder.factory("a2"))
+
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+    assert recorder.started == ["a1"]
+    assert recorder.finished == [("a", False)]
+    assert not scheduler.cancel("a")
+
+
+def test_resumed_too_late_is_restarted(app):
+    scheduler, recorder = make_scheduler(1)
+    scheduler.submit("a", 1, recorder.factory("a1"))
+    wait_for(lambda: recorder.started == ["a1"])
+    scheduler.cancel("a")
+    worker = scheduler.running["a"].worker
+    recorder.release.set()
+    # The worker stops, but the scheduler doesn't know yet, as its signals weren't processed.
+    deadline = time.monotonic() + 5
+    while not worker.stopped_early:
+        assert time.monotonic() < deadline, "Timed out."
+        time.sleep(0.005)
+    assert not scheduler.submit("a", 1, recorder.factory("a2"))
+
+    wait_for(lambda: not scheduler.has_jobs())
+    assert recorder.started == ["a1", "a1"]
+    assert recorder.finished == [("a", True), ("a", False)]
+
+
+def test_unrelated_threads_dont_block(app):
+    scheduler, recorder = make_scheduler(2, thread_count=3)
+    unrelated = threading.Event()
+    scheduler.threadpool.start(lambda: unrelated.wait(5))
+
+    scheduler.submit("a", 1, recorder.factory("a1"))
+    scheduler.submit("b", 1, recorder.factory("b1"))
+    wait_for(lambda: len(recorder.started) == 2)
+
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+    unrelated.set()
+    scheduler.threadpool.waitForDone()
+    assert sorted(recorder.started) == ["a1", "b1"]
+
+
+def test_superseded_worker_stops_at_checkpoint(app):
+    scheduler, recorder = make_scheduler(1)
+    aborted = []
+
+    def spin(abort_flag: wt.SharableFlag) -> None:
+        recorder.started.append("spin")
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            abort_flag.raise_if_set()
+            time.sleep(0.001)
+
+    def make_worker() -> wt.Worker:
+        worker = wt.Worker(spin, no_progress_callback=True, abortable=True)
+        worker.signals.aborted.connect(lambda _: aborted.append(True))
+        return worker
+
+    scheduler.submit("a", 1, make_worker)
+    wait_for(lambda: recorder.started == ["spin"])
+    start = time.monotonic()
+    scheduler.submit("a", 2, recorder.factory("a2"))
+    recorder.release.set()
+    wait_for(lambda: not scheduler.has_jobs())
+
+    assert time.monotonic() - start < 1
+    assert aborted == [True]
+    assert recorder.started == ["spin", "a2"]
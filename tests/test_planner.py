@@ -0,0 +1,139 @@
+from pathlib import Path
+
+import pytest
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.deepl_backend as deepl_b
+import deepqt.config as cfg
+import deepqt.planner as planner
+import deepqt.structures as st
+import deepqt.throughput as tp
+import deepqt.translation_interface as ti
+import tests.mock_files.mime_types as mime_files
+from tests.helpers import mock_file_path
+
+
+def write_text(path: Path, text: str) -> st.TextFile:
+    path.write_text(text, encoding="utf-8")
+    return st.TextFile(path=path)
+
+
+def test_text_file_requests_match_partitioning(tmp_path):
+    text = "".join(f"Line {i}: {'ü' * (i % 7)}\n" for i in range(500))
+    file = write_text(tmp_path / "a.txt", text)
+
+    requests = planner.text_file_requests(file, max_chunks=8, min_chunk_size=100)
+    assert [request.texts for request in requests] == [
+        [text[start:end]] for start, end in ti.partition_text(text, 8, 100)
+    ]
+    assert sum(request.chars for request in requests) == len(text)
+    assert all(request.size == len(request.texts[0].encode("utf-8")) for request in requests)
+    assert file.chunk_spans == []
+
+
+def test_text_file_requests_are_batched(tmp_path):
+    text = "".join(f"Line {i}: {'ü' * (i % 50)}\n" for i in range(20_000))
+    file = write_text(tmp_path / "a.txt", text)
+    capabilities = deepl_b.DeepLBackend().capabilities()
+
+    requests = planner.text_file_requests(file, 200, 5000, capabilities)
+    pieces = planner.text_file_requests(file, 200, 5000)
+    # Several pieces fit in a request, but not all of them.
+    assert 1 < len(requests) < len(pieces)
+    assert all(request.size <= capabilities.max_request_bytes for request in requests)
+    assert [piece for request in requests for piece in request.texts] == [
+        piece for request in pieces for piece in request.texts
+    ]
+
+    # The worker hands the engine a window of chunks at a time, each batched on its own.
+    capabilities = bi.BackendCapabilities(max_texts_per_request=3)
+    file = write_text(tmp_path / "b.txt", "".join(f"Line {i}\n" for i in range(700)))
+    requests = planner.text_file_requests(file, 7, 100, capabilities)
+    assert [len(request.texts) for request in requests] == [3, 3, 1]
+
+
+def test_mapped_file_requests_leave_file_unchanged(tmp_path):
+    path = tmp_path / "large.txt"
+    path.write_text("".join(f"Zeile {i}: ü\n" for i in range(2000)), encoding="utf-8")
+    mapped = st.MappedTextFile(path=path)
+    mapped.chunk_spans = [(0, 10)]
+
+    requests = planner.text_file_requests(mapped, max_chunks=10, min_chunk_size=1000)
+    assert len(requests) == 10
+    assert sum(request.size for request in requests) == mapped.size
+    assert sum(request.chars for request in requests) == pytest.approx(mapped.char_count, abs=10)
+    assert all(request.texts is None for request in requests)
+    assert mapped.chunk_spans == [(0, 10)]
+
+    capabilities = bi.BackendCapabilities(max_request_bytes=10_000, max_texts_per_request=50)
+    requests = planner.text_file_requests(mapped, 10, 1000, capabilities)
+    assert len(requests) == 4
+    assert sum(request.size for request in requests) == mapped.size
+    mapped.close()
+
+
+def test_plan_counts_repeats_and_time(tmp_path):
+    chapter = "Chapter header\n" * 10
+    files = [
+        write_text(tmp_path / "1.txt", chapter),
+        write_text(tmp_path / "2.txt", chapter),
+        write_text(tmp_path / "3.txt", "Something else entirely.\n"),
+    ]
+    model = tp.ThroughputModel()
+    model.record(tp.profile_key("deepl", "ja", "en", tp.ContentType.TEXT), 100, 1.0)
+
+    plan = planner.plan_translation(files, 1, 1000, model, "deepl", "ja", "en")
+    assert plan.requests == 3
+    assert plan.chars == 2 * len(chapter) + 25
+    assert plan.request_bytes == [len(chapter), len(chapter), 25]
+    assert [file.repeated_requests for file in plan.files] == [0, 1, 0]
+    assert plan.repeated_chars == len(chapter)
+    assert plan.files[0].seconds == pytest.approx(1.5)
+    assert plan.seconds == pytest.approx(1.5 + 1.5 + 0.25)
+
+    summary = plan.summary()
+    assert "3 requests" in summary
+    assert "Deduplicated: 1 request skipped" in summary
+    assert plan.breakdown().splitlines()[2].split()[:4] == ["2.txt", "text", "150", "1"]
+
+
+def test_plan_without_measurements(tmp_path):
+    plan = planner.plan_translation([write_text(tmp_path / "a.txt", "Hi\n")], 1, 1000)
+    assert plan.seconds is None
+    assert "unknown" in plan.summary()
+
+
+def test_plan_epub(tmp_path):
+    path = mock_file_path("book.epub", module=mime_files)
+    epub = st.EpubFile(path=path, cache_dir=tmp_path)
+
+    plan = planner.plan_translation([epub], 1, 1000)
+    assert not plan.files[0].loaded
+    assert plan.requests == 0
+    assert "Not loaded yet" in plan.summary()
+
+    epub.initialize_files(**cfg.Config().epub_options())
+    plan = planner.plan_translation([epub], 1, 1000)
+    assert plan.files[0].loaded
+    assert plan.files[0].content_type == tp.ContentType.HTML
+    # The table of contents takes a request, and each html file at least one.
+    assert plan.requests >= len(epub.html_files) + 1
+
+    capabilities = bi.BackendCapabilities(max_texts_per_request=50)
+    plan = planner.plan_translation([epub], 1, 1000, capabilities=capabilities)
+    assert plan.requests == len(epub.html_files) + 1
+
+
+def test_plan_counts_repeated_lines(tmp_path):
+    header = "*** Translated by the fan group ***\n"
+    files = [
+        write_text(tmp_path / "1.txt", header + "First chapter.\n"),
+        write_text(tmp_path / "2.txt", header + "Second chapter.\n"),
+    ]
+
+    plan = planner.plan_translation(files, 1, 1000)
+    assert plan.repeated_requests == 0
+    assert plan.repeated_chars == len(header.strip())
+
+    plan = planner.plan_translation(files, 1, 1000, deduplicate=False)
+    assert plan.repeated_chars == 0
@@ -0,0 +1,128 @@
+import random
+
+import pytest
+
+import deepqt.processing_rules as pr
+import deepqt.quote_protection as qp
+
+# The quote_protection script serves as the reference for the bundled rules.
+quote_marks = [
+    ("「", "」"),
+    ("“", "”"),
+    ("『", "』"),
+    ("‘", "’"),
+    ("（", "）"),
+    ("(", ")"),
+    ("《", "》"),
+    ("<<", ">>"),
+    ("", ""),
+]
+
+
+def make_dialogue(line_count: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ["彼は", "言った", "hello", "world", "「", "」", "『", "』", "(", ")", "<<", ">>", "。"]
+    lines = []
+    for _ in range(line_count):
+        opening, closing = rng.choice(quote_marks)
+        body = " ".join(rng.choice(words) for _ in range(rng.randint(0, 12)))
+        lines.append(f"{opening}{body}{closing}")
+    return "\n".join(lines) + rng.choice(["", "\n", "\n\n"])
+
+
+def make_rule_file(path, rules: str):
+    path.write_text("rules:\n" + rules, encoding="utf-8")
+    return path
+
+
+def test_bundled_rules_match_quote_protection():
+    rule_set = pr.load_rule_set()
+    for seed in range(10):
+        text = make_dialogue(200, seed).rstrip("\n")
+        protected = rule_set.preprocess(text)
+        assert protected == qp.protect_text(text)
+        assert rule_set.postprocess(protected) == qp.restore(protected)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "[TELNET]\n[QUOTE]\nq\n[ENDQUOTE]\n[ENDTELNET]",
+        "[QUOTE]\n[THOUGHT]\n[RAPHAEL]\nr\n[ENDRAPHAEL]\n[ENDTHOUGHT]\n[ENDQUOTE]",
+        "[QUOTE] x\n[TELNET]\nt\n[ENDTELNET]\n\n[ENDQUOTE]",
+        "[TELNET]\na\n[ENDQUOTE]\n[QUOTE]\nb\n[ENDTELNET]\n[ENDQUOTE]",
+    ],
+)
+def test_bundled_rules_restore_tangled_tags(text):
+    rule_set = pr.load_rule_set()
+    assert rule_set.postprocess(text) == qp.restore(text)
+
+
+def test_bundled_rules_restore_mangled_tags():
+    rule_set = pr.load_rule_set()
+    for seed in range(10):
+        protected = qp.protect_text(make_dialogue(200, seed))
+        mangled = protected.replace("[ENDQUOTE]", "", 3).replace("[ENDTELNET]", "[ENDQUOTE]", 2)
+        assert rule_set.postprocess(mangled) == qp.restore(mangled)
+
+
+def test_rule_groups_and_order(tmp_path):
+    path = make_rule_file(
+        tmp_path / "rules.yaml",
+        """
+  - name: Swap
+    pattern: '(\\w+)=(\\w+)'
+    replacement: '\\2=\\g<1>'
+  - name: Shout
+    pattern: 'hey|(?:ho)'
+    replacement: '\\g<0>!'
+    flags: i
+  - name: Never
+    pattern: 'a=b'
+    replacement: 'unreachable'
+  - name: Unwrap
+    stage: post
+    pattern: '\\[(.*?)\\]'
+    replacement: '\\1'
+""",
+    )
+    rule_set = pr.load_rule_set(path)
+    rule_set.collect_stats = True
+
+    # The first rule listed wins where several match.
+    assert rule_set.preprocess("a=b, HEY ho c=d") == "b=a, HEY! ho! d=c"
+    assert rule_set.postprocess("[x] [y]") == "x y"
+    assert rule_set.stats["Swap"].matches == 2
+    assert rule_set.stats["Shout"].matches == 2
+    assert "Never" not in rule_set.stats
+    assert set(rule_set.profile("a=b")) == {"Swap", "Shout", "Never", "Unwrap"}
+
+
+@pytest.mark.parametrize(
+    "rule",
+    [
+        "  - pattern: '(a)\\1'\n",
+        "  - pattern: '(?P<name>a)'\n",
+        "  - pattern: '(a'\n",
+        "  - pattern: 'a'\n    replacement: '\\2'\n",
+        "  - pattern: 'a'\n    stage: during\n",
+        "  - pattern: 'a'\n    flags: L\n",
+        "  - pattern: '(?i)abc'\n",
+        "  - pattern: 'a|(?s)b'\n",
+        "  - replacement: 'a'\n",
+    ],
+)
+def test_invalid_rules(tmp_path, rule):
+    with pytest.raises(pr.RuleError):
+        pr.load_rule_set(make_rule_file(tmp_path / "rules.yaml", rule))
+
+
+def test_rule_sets_cached_by_content(tmp_path):
+    rules = "  - pattern: 'a'\n    replacement: 'b'\n"
+    first = pr.load_rule_set(make_rule_file(tmp_path / "first.yaml", rules))
+    second = pr.load_rule_set(make_rule_file(tmp_path / "second.yaml", rules))
+    third = pr.load_rule_set(make_rule_file(tmp_path / "third.yaml", rules + "    flags: i\n"))
+
+    assert first is second
+    assert third is not first
+    assert third.preprocess("A") == "b"
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import PySide6.QtCore as Qc
+import pytest
+
+import deepqt.progress_aggregator as pa
+
+
+@pytest.fixture(scope="module")
+def app():
+    return Qc.QCoreApplication.instance() or Qc.QCoreApplication([])
+
+
+def test_reports_are_coalesced(app):
+    aggregator = pa.ProgressAggregator()
+    aggregator.report("a", "Partitioning file...")
+    aggregator.report("b", "Translating chunk 1 / 3", 0, 100)
+    aggregator.report("a", "Translating chunk 1 / 2", 10, 100)
+    aggregator.report("b", "Too many requests. Waiting...")
+
+    snapshot = aggregator.take()
+    assert snapshot.messages == {
+        "a": "Translating chunk 1 / 2",
+        "b": "Too many requests. Waiting...",
+    }
+    assert list(snapshot.messages) == ["a", "b"]
+    # Reports without counts don't reset them.
+    assert (snapshot.processed_chars, snapshot.total_chars) == (10, 100)
+    assert snapshot.report_count == 4
+    assert aggregator.take() is None
+
+
+def test_reports_from_threads(app):
+    aggregator = pa.ProgressAggregator()
+    reports_per_thread = 5000
+
+    def work(file_id: str) -> None:
+        for i in range(reports_per_thread):
+            aggregator.report(file_id, f"Chunk {i}", i, reports_per_thread)
+
+    threads = [threading.Thread(target=work, args=(f"file{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = aggregator.take()
+    assert snapshot.report_count == 4 * reports_per_thread
+    assert snapshot.messages == {f"file{n}": f"Chunk {reports_per_thread - 1}" for n in range(4)}
+    assert snapshot.processed_chars == reports_per_thread - 1
+
+
+def test_updates_are_rate_limited(app):
+    aggregator = pa.ProgressAggregator(updates_per_second=20)
+    updates = []
+    aggregator.updated.connect(updates.append)
+    aggregator.start()
+
+    stop = threading.Event()
+
+    def work() -> None:
+        i = 0
+        while not stop.is_set():
+            aggregator.report("file", f"Chunk {i}", i, 10**9)
+            i += 1
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    start = time.monotonic()
+    while time.monotonic() - start < 0.5:
+        Qc.QCoreApplication.processEvents()
+        time.sleep(0.005)
+    stop.set()
+    thread.join()
+    aggregator.stop()
+
+    # Ten updates at 20 per second, plus the final one, give or take the timer's jitter.
+    assert 3 <= len(updates) <= 13
+    assert sum(update.report_count for update in updates) > len(updates)
+    assert updates[-1].messages["file"] == f"Chunk {updates[-1].processed_chars}"
@@ -0,0 +1,127 @@
+import deepl
+import pytest
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.deepl_backend as deepl_b
+import deepqt.backends.lookups as b_lut
+import deepqt.backends.mock_backend as mb
+import deepqt.backends.simulated_backend as sb
+import deepqt.backends.simulated_server as ss
+import deepqt.constants as ct
+import deepqt.translation_engine as te
+
+
+def instant_profile(**kwargs) -> sb.SimulationProfile:
+    return sb.SimulationProfile(time_scale=0, seed=42, **kwargs)
+
+
+def test_mock_translate():
+    assert mb.mock_translate("Hello, world!") == "Trans, lated!"
+    assert mb.mock_translate("123 ab\nすごい") == "123 tr\nans"
+    assert mb.MockBackend().translate_text("") == ""
+
+
+def test_request_too_large():
+    backend = sb.SimulatedBackend(instant_profile(max_request_bytes=10))
+    assert backend.translate_text("0123456789") == "0123456789"
+    with pytest.raises(sb.RequestTooLarge):
+        backend.translate_text("x" * 11)
+    assert backend.simulator.stats.too_large == 1
+
+
+def test_rate_limit():
+    backend = sb.SimulatedBackend(instant_profile(rate_limit_per_second=0.001, rate_limit_burst=3))
+    for _ in range(3):
+        backend.translate_text("Hello")
+    with pytest.raises(sb.TooManyRequests):
+        backend.translate_text("Hello")
+    assert backend.simulator.stats.rate_limited == 1
+
+
+def test_quota():
+    backend = sb.SimulatedBackend(instant_profile(quota_chars=10))
+    backend.translate_texts(["Hello", "World"])
+    with pytest.raises(sb.QuotaExceeded):
+        backend.translate_text("!")
+    status = backend.status()
+    assert status.usage_count == 10
+    assert status.usage_limit == 10
+
+
+def test_transient_errors_are_seeded():
+    def count_errors() -> int:
+        simulator = sb.TranslationSimulator(instant_profile(transient_error_rate=0.3))
+        for _ in range(200):
+            try:
+                simulator.translate(["Hello"])
+            except sb.TransientError:
+                pass
+        return simulator.stats.transient_errors
+
+    errors = count_errors()
+    assert 30 < errors < 90
+    assert count_errors() == errors
+
+
+def test_mock_backend_is_simulated():
+    backend = b_lut.backend_to_class[ct.Backend.MOCK]()
+    assert isinstance(backend, sb.SimulatedBackend)
+
+    backend.set_config(mb.MockConfig(wait_time=0))
+    assert backend.simulator.latency(0) == 0
+    assert backend.translate_text("Hello") == "Trans"
+    backend.set_config(mb.MockConfig(wait_time=1500))
+    assert backend.simulator.profile.latency_base_ms == 1500
+
+
+def test_latency_scales_with_size():
+    simulator = sb.TranslationSimulator(instant_profile(latency_jitter=0))
+    assert simulator.latency(0) == pytest.approx(0.05)
+    assert simulator.latency(10 * 1024) == pytest.approx(0.25)
+
+
+def test_engine_with_simulated_backend():
+    backend = sb.SimulatedBackend(instant_profile(max_texts_per_request=7))
+    texts = [f"Line number {i}" for i in range(100)]
+    translations = te.TranslationEngine(backend).translate(texts)
+    assert translations == [mb.mock_translate(text) for text in texts]
+    assert backend.simulator.stats.requests == 15
+
+
+def test_server_with_deepl_client():
+    with ss.SimulatedServer(instant_profile(quota_chars=20), port=0) as server:
+        translator = deepl.Translator(auth_key="mock", server_url=server.url)
+        result = translator.translate_text("Hello", target_lang="DE")
+        assert result.text == "Trans"
+        assert result.billed_characters == 5
+        results = translator.translate_text(["One", "Two"], target_lang="DE")
+        assert [r.text for r in results] == ["Tra", "Tra"]
+
+        usage = translator.get_usage()
+        assert usage.character.count == 11
+        assert usage.character.limit == 20
+        assert any(lang.code == "EN-US" for lang in translator.get_target_languages())
+
+        with pytest.raises(deepl.QuotaExceededException):
+            translator.translate_text("x" * 10, target_lang="DE")
+
+
+def test_deepl_backend_with_server():
+    with ss.SimulatedServer(instant_profile(quota_chars=30), port=0) as server:
+        backend = deepl_b.DeepLBackend()
+        backend.set_config(deepl_b.DeepLConfig(api_key="mock", server_url=server.url))
+        backend.set_languages("", "DE")
+        backend.connect()
+
+        assert backend.translate_texts(["One", "Two"]) == ["Tra", "Tra"]
+        assert backend.translate_text("<b>Hi</b>", is_html=True) == "<b>Tr</b>"
+        assert ("EN-US", "English (American)") in backend.supported_languages()
+        status = backend.status()
+        assert status.connection == bi.ConnectionStatus.Connected
+        assert (status.usage_count, status.usage_limit) == (15, 30)
+
+        with pytest.raises(bi.QuotaExceeded):
+            backend.translate_text("x" * 20)
+        backend.disconnect()
+        with pytest.raises(bi.TranslationFailed):
+            backend.translate_text("Hello")
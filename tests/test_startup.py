@@ -0,0 +1,116 @@
+"""
+Guard the time it takes to show the main window, since the app is opened and closed constantly.
+
+The window is launched in a fresh interpreter with -X importtime, so nothing imported by other
+tests skews the result. The main check is deterministic: modules that are slow to import must not
+be imported before the window is shown. The time budgets are generous, to only catch gross
+regressions on slow machines. Override them with DEEPQT_STARTUP_BUDGET and
+DEEPQT_IMPORT_BUDGET (in seconds) when profiling.
+"""
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+# These are only needed once the window is up, a glossary or epub is loaded, or translating starts.
+LAZY_MODULES = [
+    "deepl",
+    "requests",
+    "bs4",
+    "minify_html",
+    "psutil",
+    "pyexcel",
+    "pyexcel_io",
+    "pynvml",
+]
+
+STARTUP_BUDGET = float(os.environ.get("DEEPQT_STARTUP_BUDGET", 5.0))
+IMPORT_BUDGET = float(os.environ.get("DEEPQT_IMPORT_BUDGET", 2.0))
+
+LAUNCH_WINDOW = """
+import json, sys, time
+start = time.perf_counter()
+import PySide6.QtWidgets as Qw
+from deepqt.constants import Command
+from deepqt.driver_mainwindow import MainWindow
+imported = time.perf_counter()
+app = Qw.QApplication([])
+window = MainWindow(Command.NONE, None, None, False, False)
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "window_seconds": shown - start,
+    "modules": sorted(sys.modules),
+}))
+window.close()
+"""
+
+
+def parse_import_times(stderr: str) -> dict[str, int]:
+    """
+    Parse the output of -X importtime.
+
+    :param stderr: The interpreter's stderr.
+    :return: The cumulative import time of each module in microseconds.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.fixture(scope="module")
+def startup(tmp_path_factory) -> tuple[dict, dict[str, int]]:
+    home = tmp_path_factory.mktemp("startup")
+    env = dict(
+        os.environ,
+        QT_QPA_PLATFORM="offscreen",
+        XDG_CONFIG_HOME=str(home / "config"),
+        XDG_CACHE_HOME=str(home / "cache"),
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", LAUNCH_WINDOW],
+        cwd=Path(__file__).parent.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert process.returncode == 0, process.stderr[-2000:]
+    report = json.loads(process.stdout.strip().splitlines()[-1])
+    return report, parse_import_times(process.stderr)
+
+
+def test_slow_modules_imported_lazily(startup):
+    report, import_times = startup
+    imported = set(report["modules"]) & set(LAZY_MODULES)
+    assert not imported, f"Imported before the window was shown: {sorted(imported)}"
+    assert "deepqt.driver_mainwindow" in import_times
+
+
+def test_time_to_first_window(startup):
+    report, import_times = startup
+    slowest = sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:10]
+    details = "\n".join(f"{micros / 1000:8.1f} ms  {name}" for name, micros in slowest)
+
+    assert report["import_seconds"] < IMPORT_BUDGET, f"Slowest imports:\n{details}"
+    assert report["window_seconds"] < STARTUP_BUDGET, f"Slowest imports:\n{details}"
+
+
+def test_parse_import_times():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   zipimport\n"
+        "import time:      2000 |       5000 | deepqt.utils\n"
+        "some other output\n"
+    )
+    assert parse_import_times(stderr) == {"zipimport": 120, "deepqt.utils": 5000}
@@ -0,0 +1,387 @@
+import os
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import deepqt.config as cfg
+import deepqt.glossary as gls
+import deepqt.structures as st
+import deepqt.utils as ut
+import tests.mock_files.mime_types as mime_files
+from tests.helpers import mock_file_path
+
+
+def make_html_files(directory: Path, count: int) -> list[st.HTMLFile]:
+    files = []
+    for i in range(count):
+        path = directory / f"chapter_{i:03}.xhtml"
+        if i % 3 == 0:
+            body = "<img src='picture.png'/>"
+        else:
+            body = f"<p><span>Chapter</span> <ruby>漢字<rt>かんじ</rt></ruby> {i}</p>"
+        path.write_text(
+            f'<html lang="ja"><head><title>{i}</title></head>\n<body>\n    {body}\n</body></html>',
+            encoding="utf8",
+        )
+        files.append(st.HTMLFile(path))
+    return files
+
+
+def test_prepare_html_files_pool_matches_serial(tmp_path):
+    count = st.MIN_FILES_FOR_POOL * 2
+    options = dict(
+        ignore_empty=True, nuke_ruby=True, nuke_indents=True, nuke_kobo=True, crush_html=True
+    )
+    progress = []
+
+    serial = [st.prepare_html_files([file], **options) for file in make_html_files(tmp_path, count)]
+    serial = [file for result in serial for file in result]
+    pooled = st.prepare_html_files(
+        make_html_files(tmp_path, count),
+        **options,
+        progress_callback=lambda done, total: progress.append((done, total)),
+        max_workers=2,
+    )
+
+    # Every third file contains no text.
+    assert len(pooled) == count - len(range(0, count, 3))
+    assert [f.path.name for f in pooled] == [f.path.name for f in serial]
+    assert [f.text for f in pooled] == [f.text for f in serial]
+    assert "漢字（かんじ）" in pooled[0].text
+    assert progress == [(i, count) for i in range(1, count + 1)]
+
+
+def test_prepare_html_files_reuses_pool(tmp_path):
+    count = st.MIN_FILES_FOR_POOL
+    options = dict(
+        ignore_empty=True, nuke_ruby=True, nuke_indents=True, nuke_kobo=True, crush_html=True
+    )
+
+    st.prepare_html_files(make_html_files(tmp_path, count), **options, max_workers=2)
+    pool = st.get_html_pool(2)
+    st.prepare_html_files(make_html_files(tmp_path, count), **options, max_workers=2)
+    assert st.get_html_pool(2) is pool
+
+    st.shutdown_html_pool()
+    assert st.get_html_pool(2) is not pool
+    st.shutdown_html_pool()
+
+
+class Stop(Exception):
+    pass
+
+
+def abort_after(calls: int):
+    """
+    Make a checkpoint that aborts once it was passed the given number of times.
+    """
+    passed = []
+
+    def check_aborted() -> None:
+        if len(passed) >= calls:
+            raise Stop
+        passed.append(True)
+
+    return check_aborted
+
+
+def test_prepare_html_files_aborted(tmp_path):
+    count = st.MIN_FILES_FOR_POOL * 2
+    progress = []
+
+    with pytest.raises(Stop):
+        st.prepare_html_files(
+            make_html_files(tmp_path, count),
+            ignore_empty=True,
+            nuke_ruby=True,
+            nuke_indents=True,
+            nuke_kobo=True,
+            crush_html=True,
+            progress_callback=lambda done, total: progress.append(done),
+            max_workers=2,
+            check_aborted=abort_after(3),
+        )
+    assert progress == [1, 2, 3]
+
+
+def test_epub_initialization_aborted(tmp_path):
+    path = mock_file_path("book.epub", module=mime_files)
+    epub = st.EpubFile(path=path, cache_dir=tmp_path)
+    options = cfg.Config().epub_options()
+
+    with pytest.raises(Stop):
+        epub.initialize_files(**options, check_aborted=abort_after(2))
+    assert not epub.initialized
+    assert not epub.html_files
+
+    # Nothing half-done was cached, so it can simply be initialized again.
+    epub.initialize_files(**options)
+    assert epub.initialized
+    assert epub.html_files
+
+
+def test_glossary_aborted():
+    glossary = st.Glossary(exact_terms={"Hello": "Hallo "})
+    glossary.generate_patterns()
+    text = "Hello world.\n" * (gls.CHECKPOINT_INTERVAL * 2)
+
+    assert gls.process_text(text, glossary, abort_after(2)).startswith("Hallo  world.")
+    with pytest.raises(Stop):
+        gls.process_text(text, glossary, abort_after(1))
+
+
+def test_epub_scan_before_initialization(tmp_path):
+    path = mock_file_path("book.epub", module=mime_files)
+    epub = st.EpubFile(path=path, cache_dir=tmp_path)
+
+    assert not epub.initialized
+    assert epub.estimated_char_count > 0
+    assert epub.char_count == epub.estimated_char_count
+    assert epub.process_level == st.ProcessLevel.RAW
+    # Nothing but the cover, if any, is extracted while scanning.
+    assert not list(epub.cache_dir.glob("**/*.xhtml"))
+
+    epub.initialize_files(**cfg.Config().epub_options())
+    assert epub.initialized
+    assert epub.char_count == sum(f.char_count for f in epub.html_files)
+
+
+def test_epub_scan_invalid(tmp_path):
+    path = mock_file_path("archive.zip", module=mime_files)
+    with pytest.raises(ValueError):
+        st.EpubFile(path=path, cache_dir=tmp_path)
+
+
+def test_extract_epub_spine_order(tmp_path):
+    path = mock_file_path("book.epub", module=mime_files)
+    html_files, css_files, toc_file = st.extract_epub(path, tmp_path)
+
+    assert [f.path.relative_to(tmp_path).as_posix() for f in html_files] == [
+        "EPUB/text/title_page.xhtml",
+        "EPUB/text/ch001.xhtml",
+        "EPUB/nav.xhtml",
+    ]
+    assert [f.path.name for f in css_files] == ["stylesheet1.css"]
+    assert toc_file.path == tmp_path / "EPUB" / "toc.ncx"
+
+
+def test_epub_stream_writer(tmp_path):
+    path = mock_file_path("book.epub", module=mime_files)
+    epub = st.EpubFile(path=path, cache_dir=tmp_path / "cache")
+    epub.initialize_files(**cfg.Config().epub_options())
+    output_path = tmp_path / "out" / "book_de.epub"
+
+    writer = st.EpubStreamWriter(epub, output_path)
+    first, *rest = epub.html_files
+    first.translation = "<html><body><p>Übersetzt</p></body></html>"
+    writer.write_file(first, first.translation)
+
+    # The partial output is a readable archive already.
+    first_name = first.path.relative_to(epub.cache_dir).as_posix()
+    with zipfile.ZipFile(writer.temp_path) as partial_zip:
+        assert partial_zip.namelist() == ["mimetype", first_name]
+
+    assert writer.finalize() == output_path
+    assert not writer.temp_path.exists()
+
+    with zipfile.ZipFile(output_path) as out_zip, zipfile.ZipFile(path) as source_zip:
+        names = out_zip.namelist()
+        assert names[0] == "mimetype"
+        assert out_zip.getinfo("mimetype").compress_type == zipfile.ZIP_STORED
+        assert sorted(names) == sorted(source_zip.namelist())
+        assert out_zip.read(first_name).decode() == first.translation
+        # Untranslated files keep their current text.
+        for html_file in rest:
+            name = html_file.path.relative_to(epub.cache_dir).as_posix()
+            assert out_zip.read(name).decode() == html_file.text
+        assert out_zip.read("EPUB/content.opf") == source_zip.read("EPUB/content.opf")
+
+
+def make_ncx(path: Path, count: int) -> st.TocNCXFile:
+    nav_points = "".join(
+        f'<navPoint id="p{i}"><navLabel><text> Chapter {i} &amp; more </text></navLabel>'
+        f'<content src="c{i}.xhtml"/></navPoint>'
+        for i in range(count)
+    )
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+        f"<docTitle><text>Title</text></docTitle><navMap>{nav_points}</navMap></ncx>",
+        encoding="utf8",
+    )
+    return st.TocNCXFile(path)
+
+
+def make_ncx_path(directory: Path, xml: str) -> Path:
+    path = directory / "rendered.ncx"
+    path.write_text(xml, encoding="utf8")
+    return path
+
+
+def test_toc_ncx_texts(tmp_path):
+    toc = make_ncx(tmp_path / "toc.ncx", 20)
+
+    assert toc.get_texts()[:2] == ["Title", "Chapter 0 & more"]
+    assert toc.char_count == sum(len(text) for text in toc.get_texts())
+
+    translations = [f"Kapitel <{i}>" for i in range(21)]
+    xml = toc.set_texts(translations)
+    # All entries are replaced, the caller's list and the parsed file are left alone.
+    assert len(translations) == 21
+    assert st.TocNCXFile(make_ncx_path(tmp_path, xml)).get_texts() == translations
+    assert toc.get_texts()[20] == "Chapter 19 & more"
+
+    with pytest.raises(ValueError):
+        toc.set_texts(translations[1:])
+
+
+def test_toc_ncx_large(tmp_path):
+    toc = make_ncx(tmp_path / "toc.ncx", 5000)
+    texts = toc.get_texts()
+
+    start = time.perf_counter()
+    xml = toc.set_texts(texts)
+    for _ in range(100):
+        toc.char_count
+    elapsed = time.perf_counter() - start
+
+    assert xml.count("<text>") == 5001
+    # This takes a few milliseconds, the bound merely catches quadratic behavior.
+    assert elapsed < 5
+
+
+def test_epub_cache_reused(tmp_path, monkeypatch):
+    path = mock_file_path("book.epub", module=mime_files)
+    options = cfg.Config().epub_options()
+    first = st.EpubFile(path=path, cache_dir=tmp_path)
+    first.initialize_files(**options)
+
+    # A second session loads the prepared files without preparing them again.
+    def fail(*args, **kwargs):
+        raise AssertionError("Prepared files weren't loaded from the cache.")
+
+    monkeypatch.setattr(st, "prepare_html_files", fail)
+    second = st.EpubFile(path=path, cache_dir=tmp_path)
+    second.initialize_files(**options)
+
+    assert second.cache_dir == first.cache_dir
+    assert [f.path for f in second.html_files] == [f.path for f in first.html_files]
+    assert [f.text for f in second.html_files] == [f.text for f in first.html_files]
+    assert [f.text for f in second.css_files] == [f.text for f in first.css_files]
+    assert second.toc_file.get_texts() == first.toc_file.get_texts()
+
+    # Different options need their own preparation.
+    third = st.EpubFile(path=path, cache_dir=tmp_path)
+    with pytest.raises(AssertionError):
+        third.initialize_files(**(options | {"nuke_ruby": not options["nuke_ruby"]}))
+
+
+def test_epub_cache_keyed_by_content(tmp_path):
+    source = mock_file_path("book.epub", module=mime_files)
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    same_stem_a = tmp_path / "a" / "book.epub"
+    same_stem_b = tmp_path / "b" / "book.epub"
+    same_stem_a.write_bytes(source.read_bytes())
+    with zipfile.ZipFile(source) as source_zip, zipfile.ZipFile(same_stem_b, "w") as other_zip:
+        for info in source_zip.infolist():
+            data = source_zip.read(info)
+            if info.filename == "EPUB/text/ch001.xhtml":
+                data = data.replace(b"</body>", b"<p>Another book.</p></body>")
+            other_zip.writestr(info, data)
+
+    cache_dir = tmp_path / "cache"
+    assert (
+        st.EpubFile(path=same_stem_a, cache_dir=cache_dir).cache_dir
+        != st.EpubFile(path=same_stem_b, cache_dir=cache_dir).cache_dir
+    )
+
+
+def test_prune_epub_cache(tmp_path):
+    for age, name in enumerate(["newest", "middle", "oldest"]):
+        book_dir = tmp_path / name
+        (book_dir / "files").mkdir(parents=True)
+        (book_dir / "files" / "chapter.xhtml").write_bytes(b"x" * 1000)
+        os.utime(book_dir, (time.time() - age * 100, time.time() - age * 100))
+
+    ut.prune_epub_cache(2500, tmp_path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["middle", "newest"]
+
+    ut.prune_epub_cache(0, tmp_path)
+    assert not list(tmp_path.iterdir())
+
+
+def make_mapped_text(path: Path) -> str:
+    lines = [f"Zeile {i}: 「引用」 ü\r\n" if i % 2 else f"Line {i}\n" for i in range(2000)]
+    path.write_bytes("".join(lines).encode("utf-8") + "last line without break".encode("utf-8"))
+    return path.read_text(encoding="utf-8")
+
+
+def test_mapped_text_file_partition(tmp_path):
+    text = make_mapped_text(tmp_path / "large.txt")
+    mapped = st.MappedTextFile(path=tmp_path / "large.txt")
+
+    assert mapped.char_count == len(text)
+    assert mapped.head(100) == text[: len(mapped.head(100))]
+    assert mapped.head(100).endswith("\n")
+    with pytest.raises(TypeError):
+        mapped.current_text()
+
+    max_bytes = 4000
+    mapped.partition(max_chunks=10, min_chunk_size=1000, max_bytes=max_bytes)
+    assert mapped.chunk_count() == 10
+    assert mapped.chunk_spans[0][0] == 0
+    assert mapped.chunk_spans[-1][1] == mapped.size
+    for (_, end), (start, _) in zip(mapped.chunk_spans, mapped.chunk_spans[1:]):
+        assert end == start
+    assert all(end - start <= max_bytes for start, end in mapped.chunk_spans)
+    assert "".join(mapped.get_chunk(i) for i in range(mapped.chunk_count())) == text
+
+    # The last chunks aim for the target size too, even when the rest would fit in one.
+    mapped.partition(max_chunks=10, min_chunk_size=1000, max_bytes=mapped.size)
+    assert mapped.chunk_count() == 10
+
+    # Processors apply per chunk, without losing the line breaks between chunks.
+    mapped.chunk_processors = [str.upper, str.rstrip]
+    assert "".join(mapped.get_chunk(i) for i in range(mapped.chunk_count())) == text.upper()
+    mapped.close()
+
+
+def test_mapped_text_file_long_line(tmp_path):
+    path = tmp_path / "line.txt"
+    path.write_text("ä" * 3000, encoding="utf-8")
+    mapped = st.MappedTextFile(path=path)
+
+    # Lines too long for a chunk are cut at character boundaries.
+    mapped.partition(max_chunks=1, min_chunk_size=1000, max_bytes=1001)
+    assert mapped.chunk_count() == 6
+    assert "".join(mapped.get_chunk(i) for i in range(mapped.chunk_count())) == "ä" * 3000
+    mapped.close()
+
+
+def test_text_file_release_intermediate_texts(tmp_path):
+    path = tmp_path / "text.txt"
+    path.write_text("Hello world.\nGoodbye world.\n", encoding="utf-8")
+    text_file = st.TextFile(path=path)
+    text_file.glossary_processor = lambda text: text.replace("world", "Welt")
+    text_file.text_glossary = text_file.glossary_processor(text_file.text)
+    text_file.process_level = st.ProcessLevel.GLOSSARY
+    text_file.chunk_spans = [(0, 12), (12, 26)]
+
+    text_file.release_intermediate_texts()
+    assert text_file.text == ""
+    assert text_file.current_text() == "Hello Welt.\nGoodbye Welt.\n"
+    assert [text_file.get_chunk(i) for i in range(2)] == ["Hello Welt.\n", "Goodbye Welt.\n"]
+    # The raw text is read from disk again when needed.
+    assert text_file.level_text(st.ProcessLevel.RAW) == "Hello world.\nGoodbye world.\n"
+    assert text_file.text == ""
+
+    # Switching back keeps the recomputed text, in place of the released one.
+    text_file.process_level = st.ProcessLevel.RAW
+    assert text_file.char_count == 28
+    assert text_file.text == "Hello world.\nGoodbye world.\n"
+    assert text_file.text_glossary == ""
+    path.unlink()
+    assert text_file.char_count == 28
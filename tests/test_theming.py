@@ -1,7 +1,13 @@
+import importlib.util
 import yaml
 from pathlib import Path, PosixPath
 from importlib import resources
 
+import PySide6.QtCore as Qc
+import pytest
+
+import deepqt.data
+import deepqt.gui_utils as gu
 import deepqt.utils as ut
 import deepqt.ui_generated_files
 import deepqt.data.theme_icons as theme_icons_module
@@ -88,3 +94,44 @@ def test_theme_icon_app_presence():
 
     missing = expected_icons - icon_set
     assert not missing
+
+
+def load_bundle_builder():
+    script_path = Path(__file__).parent.parent / "icons" / "build_resource_bundle.py"
+    spec = importlib.util.spec_from_file_location("build_resource_bundle", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_resource_bundle_up_to_date():
+    """
+    Test that the compiled resource bundle contains every bundled data file.
+    Otherwise run make compile-resources.
+    """
+    builder = load_bundle_builder()
+    with resources.files(deepqt.data) as data_path:
+        data_dir = Path(data_path)
+
+    tree = builder.build_qrc(data_dir)
+    assert gu.load_resource_bundle()
+    for resource in tree.getroot().findall("qresource"):
+        prefix = resource.get("prefix")
+        for file in resource.findall("file"):
+            resource_path = f":{prefix}/{file.get('alias')}"
+            assert Qc.QFileInfo(resource_path).isFile(), f"{resource_path} missing from the bundle."
+            assert Qc.QFileInfo(resource_path).size() == (data_dir / file.text).stat().st_size
+
+
+def test_custom_icon_path(monkeypatch):
+    assert gu.load_resource_bundle()
+    assert gu.custom_icon_path("cost-warning", "dark") == ":/custom_icons/dark/cost-warning.svg"
+    assert gu.custom_icon_path("logo.ico") == ":/custom_icons/logo.ico"
+    with pytest.raises(FileNotFoundError):
+        gu.custom_icon_path("missing-icon")
+
+    # Without the bundle, the package data is used.
+    monkeypatch.setattr(gu, "resource_bundle_loaded", False)
+    path = Path(gu.custom_icon_path("cost-warning", "light"))
+    assert path.is_file()
+    assert path.parts[-2:] == ("light", "cost-warning.svg")
@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+import deepqt.throughput as tp
+
+TEXT_KEY = tp.profile_key("deepl", "ja", "en-us", tp.ContentType.TEXT)
+HTML_KEY = tp.profile_key("deepl", "ja", "en-us", tp.ContentType.HTML)
+
+
+def record_linear(model: tp.ThroughputModel, key: str, request_cost: float, char_cost: float):
+    for chars in (100, 1000, 5000, 20000):
+        model.record(key, chars, request_cost + char_cost * chars)
+
+
+def test_fit_separates_request_and_char_cost():
+    fit = tp.fit_samples([tp.Sample(chars, 0.5 + 0.001 * chars) for chars in (100, 1000, 4000)])
+
+    assert fit.request_cost == pytest.approx(0.5)
+    assert fit.char_cost == pytest.approx(0.001)
+    assert fit.mean_request_chars == pytest.approx(1700)
+
+
+def test_fit_fallbacks():
+    assert tp.fit_samples([]) is None
+    # Too few samples, or all of the same size, can only give a cost per char.
+    fit = tp.fit_samples([tp.Sample(1000, 2.0), tp.Sample(1000, 4.0)])
+    assert (fit.request_cost, fit.char_cost) == (0, pytest.approx(0.003))
+    # Bigger requests being faster is noise, so it's all attributed to the request.
+    fit = tp.fit_samples([tp.Sample(100, 3.0), tp.Sample(1000, 2.0), tp.Sample(5000, 1.0)])
+    assert (fit.request_cost, fit.char_cost) == (pytest.approx(2.0), 0)
+
+
+def test_estimate_per_profile():
+    model = tp.ThroughputModel()
+    assert model.estimate(TEXT_KEY, 1000) is None
+    assert model.estimate(TEXT_KEY, 0) == 0
+
+    record_linear(model, TEXT_KEY, 0.5, 0.0001)
+    record_linear(model, HTML_KEY, 1.0, 0.0004)
+
+    assert model.estimate(TEXT_KEY, 10_000, requests=4) == pytest.approx(4 * 0.5 + 1.0)
+    assert model.estimate(HTML_KEY, 10_000, requests=4) == pytest.approx(4 * 1.0 + 4.0)
+    # The request count defaults to what the average request holds, 6525 chars here.
+    assert model.estimate(TEXT_KEY, 13_050) == pytest.approx(2 * 0.5 + 1.305)
+
+
+def test_estimate_with_concurrency():
+    model = tp.ThroughputModel()
+    for chars in (100, 1000, 5000):
+        model.record(TEXT_KEY, chars, 1 + 0.001 * chars, concurrency=4)
+
+    # 10 requests of 1000 chars run in 3 waves of 2 seconds each.
+    assert model.estimate(TEXT_KEY, 10_000, requests=10) == pytest.approx(6)
+
+
+def test_estimate_falls_back_on_other_language_pairs():
+    model = tp.ThroughputModel()
+    record_linear(model, tp.profile_key("deepl", "", "de", tp.ContentType.TEXT), 0.5, 0.0001)
+    record_linear(model, tp.profile_key("other", "ja", "en-us", tp.ContentType.TEXT), 9, 0.1)
+
+    assert model.estimate(TEXT_KEY, 10_000, requests=1) == pytest.approx(1.5)
+    assert model.estimate(HTML_KEY, 10_000) is None
+
+
+def test_fits_are_cached_until_recorded(monkeypatch):
+    model = tp.ThroughputModel()
+    record_linear(model, TEXT_KEY, 0.5, 0.0001)
+    fits = []
+    fit_samples = tp.fit_samples
+    monkeypatch.setattr(tp, "fit_samples", lambda samples: fits.append(1) or fit_samples(samples))
+
+    for _ in range(10):
+        model.estimate(TEXT_KEY, 10_000)
+        assert model.estimate(HTML_KEY, 10_000) is None
+    assert len(fits) == 1
+
+    # A new sample may change any fit, including the fallback of profiles without samples.
+    model.record(tp.profile_key("deepl", "", "de", tp.ContentType.HTML), 1000, 2.0)
+    assert model.estimate(HTML_KEY, 1000, requests=1) == pytest.approx(2.0)
+    model.estimate(TEXT_KEY, 10_000)
+    assert len(fits) == 3
+
+
+def test_only_recent_samples_are_kept():
+    model = tp.ThroughputModel()
+    for _ in range(tp.MAX_SAMPLES):
+        model.record(TEXT_KEY, 1000, 10.0)
+    for _ in range(tp.MAX_SAMPLES):
+        model.record(TEXT_KEY, 1000, 1.0)
+
+    assert len(model.profiles[TEXT_KEY].samples) == tp.MAX_SAMPLES
+    assert model.estimate(TEXT_KEY, 1000) == pytest.approx(1.0)
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "cache" / "throughput.json"
+    model = tp.ThroughputModel(path)
+    record_linear(model, TEXT_KEY, 0.5, 0.0001)
+    model.record(HTML_KEY, 2000, 3.0, concurrency=2)
+    assert model.save()
+
+    loaded = tp.ThroughputModel.load(path)
+    assert loaded.path == path
+    assert loaded.profiles == model.profiles
+    assert loaded.estimate(TEXT_KEY, 5000, 2) == model.estimate(TEXT_KEY, 5000, 2)
+
+
+@pytest.mark.parametrize("content", ["{broken", json.dumps({"version": 0, "profiles": {}}), "[]"])
+def test_load_unusable_file(tmp_path, content):
+    path = tmp_path / "throughput.json"
+    path.write_text(content)
+    assert tp.ThroughputModel.load(path).profiles == {}
+    assert tp.ThroughputModel.load(tmp_path / "missing.json").profiles == {}
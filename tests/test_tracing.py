@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+import deepqt.tracing as trc
+
+
+def test_spans_are_recorded():
+    tracer = trc.Tracer()
+    with tracer.span("glossary", "preprocessing", file="a.txt"):
+        pass
+    with tracer.span("write"):
+        pass
+
+    spans = tracer.spans()
+    assert [span.name for span in spans] == ["glossary", "write"]
+    assert spans[0].category == "preprocessing"
+    assert spans[0].args == {"file": "a.txt"}
+    assert spans[0].duration >= 0
+    assert spans[0].thread_name == threading.current_thread().name
+
+
+def test_failed_span_is_recorded():
+    tracer = trc.Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("partition"):
+            raise ValueError("Oops.")
+    assert tracer.spans()[0].args == {"error": "ValueError"}
+
+
+def test_disabled_and_full_tracer():
+    tracer = trc.Tracer(max_spans=2)
+    tracer.enabled = False
+    with tracer.span("skipped"):
+        pass
+    assert tracer.spans() == []
+
+    tracer.enabled = True
+    for _ in range(3):
+        with tracer.span("stage"):
+            pass
+    assert len(tracer.spans()) == 2
+    assert tracer.dropped == 1
+    assert "1 spans dropped" in tracer.format_summary()
+
+    tracer.clear()
+    assert tracer.spans() == []
+    assert tracer.dropped == 0
+
+
+def test_traced_decorator():
+    @trc.traced("doubling", "test")
+    def double(value: int) -> int:
+        return value * 2
+
+    trc.tracer.clear()
+    assert double(2) == 4
+    assert double.__name__ == "double"
+    assert [(span.name, span.category) for span in trc.tracer.spans()] == [("doubling", "test")]
+    trc.tracer.clear()
+
+
+def test_spans_from_threads():
+    tracer = trc.Tracer()
+    # Keep all threads alive at once, otherwise their ids may be reused.
+    barrier = threading.Barrier(4)
+
+    def work() -> None:
+        with tracer.span("api_request"):
+            barrier.wait(5)
+
+    threads = [threading.Thread(target=work, name=f"worker-{i}") for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    trace = tracer.chrome_trace()
+    names = {event["args"]["name"] for event in trace["traceEvents"] if event["ph"] == "M"}
+    assert names == {f"worker-{i}" for i in range(4)}
+
+
+def test_chrome_trace():
+    tracer = trc.Tracer()
+    tracer.add(trc.Span("write", "io", tracer.origin + 0.5, 0.25, 1, "main", {"path": object()}))
+
+    trace = tracer.chrome_trace()
+    json.dumps(trace)
+    event = trace["traceEvents"][0]
+    assert event["ph"] == "X"
+    assert event["ts"] == 500_000
+    assert event["dur"] == 250_000
+    assert event["pid"] == os.getpid()
+    assert isinstance(event["args"]["path"], str)
+
+
+def test_async_spans_overlap_on_one_thread():
+    tracer = trc.Tracer()
+
+    async def request() -> None:
+        with tracer.async_span("api_request", "network", texts=3):
+            await asyncio.sleep(0.01)
+
+    async def run() -> None:
+        await asyncio.gather(request(), request())
+
+    asyncio.run(run())
+    spans = tracer.spans()
+    assert {span.async_id for span in spans} == {1, 2}
+    assert spans[0].thread_id == spans[1].thread_id
+
+    events = [event for event in tracer.chrome_trace()["traceEvents"] if event["ph"] != "M"]
+    assert sorted(event["ph"] for event in events) == ["b", "b", "e", "e"]
+    for async_id in (1, 2):
+        begin, end = (event for event in events if event["id"] == async_id)
+        assert (begin["ph"], end["ph"]) == ("b", "e")
+        assert begin["name"] == end["name"] == "api_request"
+        assert begin["cat"] == end["cat"] == "network"
+        assert begin["args"] == {"texts": 3}
+        assert end["ts"] > begin["ts"]
+    # Both requests were in flight at once.
+    begins = [event["ts"] for event in events if event["ph"] == "b"]
+    ends = [event["ts"] for event in events if event["ph"] == "e"]
+    assert max(begins) < min(ends)
+
+
+def test_summary():
+    tracer = trc.Tracer()
+    for duration in (0.1, 0.3):
+        tracer.add(trc.Span("glossary", "", 0, duration, 1, "main", {}))
+    tracer.add(trc.Span("write", "", 0, 1.0, 1, "main", {}))
+
+    write, glossary = tracer.summary()
+    assert write.name == "write"
+    assert glossary.count == 2
+    assert glossary.total == pytest.approx(0.4)
+    assert glossary.mean == pytest.approx(0.2)
+    assert glossary.longest == pytest.approx(0.3)
+
+    lines = tracer.format_summary().splitlines()
+    assert lines[0].split() == ["Stage", "Count", "Total", "s", "Mean", "ms", "Max", "ms"]
+    assert lines[1].split() == ["write", "1", "1.000", "1000.00", "1000.00"]
+    assert lines[2].split() == ["glossary", "2", "0.400", "200.00", "300.00"]
+
+
+def test_export_prunes_old_runs(tmp_path):
+    tracer = trc.Tracer()
+    with tracer.span("write"):
+        pass
+
+    for index in range(4):
+        trace_path, summary_path = tracer.export(tmp_path, f"run-{index}", keep=2)
+        os.utime(trace_path, (index, index))
+
+    assert json.loads(trace_path.read_text())["traceEvents"][0]["name"] == "write"
+    assert summary_path.read_text().startswith("Stage")
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "run-2.summary.txt",
+        "run-2.trace.json",
+        "run-3.summary.txt",
+        "run-3.trace.json",
+    ]
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+import deepqt.backends.backend_interface as bi
+import deepqt.backends.deepl_backend as deepl_b
+import deepqt.backends.mock_backend as mb
+import deepqt.translation_engine as te
+import deepqt.translation_interface as ti
+
+
+class SlowBackend(mb.MockBackend):
+    """
+    Takes a random amount of time per request and records how many run at once.
+    """
+
+    def __init__(self, capabilities: bi.BackendCapabilities) -> None:
+        super().__init__()
+        self._capabilities = capabilities
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def capabilities(self) -> bi.BackendCapabilities:
+        return self._capabilities
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        with self.lock:
+            self.requests.append(texts)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(random.uniform(0, 0.01))
+        with self.lock:
+            self.in_flight -= 1
+        return [text.upper() for text in texts]
+
+
+def test_make_batches():
+    capabilities = bi.BackendCapabilities(max_request_bytes=10, max_texts_per_request=3)
+    texts = ["aaaa", "bbbb", "", "cc", "d", "e", "f", "ggggggggggggggg", "h"]
+
+    assert te.make_batches(texts, capabilities) == [[0, 1, 3], [4, 5, 6], [7], [8]]
+    assert te.make_batches(texts, bi.BackendCapabilities()) == [[i] for i in range(9) if texts[i]]
+
+
+def test_deepl_batches_within_api_limit():
+    backend = SlowBackend(deepl_b.DeepLBackend().capabilities())
+    engine = te.TranslationEngine(backend)
+    text = "".join(f"Line {i}: {'ü' * (i % 50)}\n" for i in range(20_000))
+    pieces = ti.partition_text_max_bytes(text, ti.API_MAX_BYTES)
+
+    assert engine.translate(pieces, lambda batch, _: None) == [piece.upper() for piece in pieces]
+    assert len(backend.requests) > 1
+    for request in backend.requests:
+        # Packing several pieces together may not exceed what a single piece is limited to.
+        assert sum(len(piece.encode("utf-8")) for piece in request) <= ti.API_MAX_BYTES
+
+
+def test_engine_concurrency_and_order():
+    capabilities = bi.BackendCapabilities(
+        max_request_bytes=None,
+        max_texts_per_request=4,
+        supports_concurrency=True,
+        max_concurrency=3,
+    )
+    backend = SlowBackend(capabilities)
+    engine = te.TranslationEngine(backend)
+    texts = [f"text {i}" for i in range(50)]
+    finished = []
+
+    translations = engine.translate(texts, lambda batch, _: finished.extend(batch))
+
+    assert translations == [text.upper() for text in texts]
+    assert sorted(finished) == list(range(50))
+    assert len(backend.requests) == 13
+    assert 1 < backend.max_in_flight <= 3
+    assert engine.window_size() == 12
+
+
+def test_engine_sequential_backend():
+    backend = SlowBackend(bi.BackendCapabilities(max_concurrency=8))
+    translations = te.TranslationEngine(backend).translate(["a", "b", "c"])
+
+    assert translations == ["A", "B", "C"]
+    assert backend.max_in_flight == 1
+
+
+def test_engine_abort():
+    backend = SlowBackend(bi.BackendCapabilities(supports_concurrency=True, max_concurrency=2))
+    calls = 0
+
+    def check_aborted():
+        nonlocal calls
+        calls += 1
+        if calls > 3:
+            raise bi.TranslationAborted
+
+    with pytest.raises(bi.TranslationAborted):
+        te.TranslationEngine(backend).translate([str(i) for i in range(20)], None, check_aborted)
+    # Requests still waiting for a thread when the abort cancels them never reach the backend.
+    assert 1 <= len(backend.requests) <= 3
+
+
+def test_engine_times_requests():
+    backend = SlowBackend(bi.BackendCapabilities(max_texts_per_request=2))
+    timed = []
+
+    te.TranslationEngine(backend).translate(
+        ["a", "b", "c"], request_timed=lambda batch, seconds: timed.append((batch, seconds))
+    )
+    assert [batch for batch, _ in timed] == [[0, 1], [2]]
+    assert all(0 <= seconds < 1 for _, seconds in timed)
+
+
+class RateLimitedBackend(mb.MockBackend):
+    """
+    Rejects the first few requests as rate limited.
+    """
+
+    def __init__(self, rejections: int) -> None:
+        super().__init__()
+        self.rejections = rejections
+        self.requests = 0
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        self.requests += 1
+        if self.requests <= self.rejections:
+            raise bi.TooManyRequests("Slow down.")
+        return super().translate_texts(texts, is_html)
+
+
+def test_engine_retries_rate_limited_requests():
+    backend = RateLimitedBackend(rejections=2)
+    engine = te.TranslationEngine(backend, max_tries=3, retry_delay=0)
+    assert engine.translate(["Hello"]) == ["Trans"]
+    assert backend.requests == 3
+
+    backend = RateLimitedBackend(rejections=3)
+    with pytest.raises(bi.TooManyRequests):
+        te.TranslationEngine(backend, max_tries=3, retry_delay=0).translate(["Hello"])
+    assert backend.requests == 3
+
+
+def test_engine_html():
+    translations = te.TranslationEngine(mb.MockBackend()).translate(
+        ['<p class="x">Hello &amp; world</p>'], is_html=True
+    )
+    assert translations == ['<p class="x">Trans &amp; trans</p>']
+
+
+def test_backend_defaults():
+    backend = mb.MockBackend()
+    backend.set_config(backend.default_config())
+
+    assert backend.translate_texts(["Hello", "World"]) == ["Trans", "Trans"]
+    assert asyncio.run(backend.translate_text_async("abc")) == "tra"
+    assert asyncio.run(backend.translate_texts_async(["ab"])) == ["tr"]
+    assert bi.Backend.capabilities(backend) == bi.BackendCapabilities()
@@ -0,0 +1,161 @@
+import deepqt.backends.deepl_backend as deepl_b
+import deepqt.backends.mock_backend as mb
+import deepqt.backends.simulated_backend as sb
+import deepqt.backends.simulated_server as ss
+import deepqt.config as cfg
+import deepqt.processing_rules as pr
+import deepqt.structures as st
+import deepqt.translation_interface as ti
+import tests.mock_files.mime_types as mime_files
+from tests.helpers import mock_file_path
+
+
+def test_partition_text_spans():
+    text = "".join(f"Line {i}: {'ü' * (i % 7)}\n" for i in range(500)) + "no break"
+    spans = ti.partition_text(text, max_chunks=8, min_chunk_size=100)
+
+    assert len(spans) == 8
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end == start
+        # Chunks only end at line breaks.
+        assert text[end - 1] == "\n"
+    assert "".join(text[start:end] for start, end in spans) == text
+
+
+def test_partition_text_max_bytes():
+    text = "".join("ä" * 90 + "\n" for _ in range(100))
+    spans = ti.partition_text(text, max_chunks=1, min_chunk_size=100, max_bytes=1000)
+
+    assert all(len(text[start:end].encode("utf-8")) <= 1000 for start, end in spans)
+    assert "".join(text[start:end] for start, end in spans) == text
+    assert ti.partition_text("", max_chunks=4, min_chunk_size=100) == []
+
+
+class RecordingBackend(mb.MockBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.requests = []
+
+    def translate_texts(self, texts: list[str], is_html: bool = False) -> list[str]:
+        self.requests.append(texts)
+        return super().translate_texts(texts, is_html)
+
+
+def run_worker(
+    backend: mb.MockBackend | deepl_b.DeepLBackend,
+    input_files: dict[str, st.InputFile],
+    config: cfg.Config | None = None,
+) -> list[ti.State]:
+    backend.connect()
+    worker = ti.DeeplWorker(backend, input_files, config or cfg.Config())
+    results = []
+    worker.signals.result.connect(results.append)
+    worker.signals.error.connect(results.append)
+    worker.run()
+    return results
+
+
+def test_worker_with_mock_backend(tmp_path):
+    text_path = tmp_path / "text.txt"
+    text_path.write_text("Hello world\nHello world\n\nGoodbye!\n")
+    text_file = st.TextFile(path=text_path)
+    epub = st.EpubFile(path=mock_file_path("book.epub", module=mime_files), cache_dir=tmp_path)
+    epub.initialize_files(**cfg.Config().epub_options())
+
+    assert run_worker(mb.MockBackend(), {"text": text_file, "epub": epub}) == [ti.State.DONE]
+    assert text_file.translation == "Trans lated\nTrans lated\n\nTransla!\n"
+    assert "TRANSLAT" not in epub.toc_file.text
+    assert "TRANSLAT" in epub.toc_file.translation
+    for html_file in epub.html_files:
+        # Only the text is translated, the markup is kept.
+        assert html_file.translation.count("<") == html_file.text.count("<")
+
+
+def test_worker_without_deduplication(tmp_path):
+    text_path = tmp_path / "text.txt"
+    text_path.write_text("Hello\nHello\n")
+    text_file = st.TextFile(path=text_path)
+    backend = RecordingBackend()
+
+    assert run_worker(backend, {"text": text_file}, cfg.Config(deduplicate=False)) == [
+        ti.State.DONE
+    ]
+    # Neither merged nor split into lines.
+    assert backend.requests == [["Hello\nHello\n"]]
+    assert text_file.translation == "Trans\nLated\n"
+
+
+def test_worker_quota_exceeded(tmp_path):
+    text_path = tmp_path / "text.txt"
+    text_path.write_text("Hello\n" * 10)
+    text_file = st.TextFile(path=text_path)
+    profile = sb.SimulationProfile(time_scale=0, quota_chars=5)
+
+    with ss.SimulatedServer(profile, port=0) as server:
+        # The DeepL client raises its QuotaExceededException, which the backend passes on.
+        backend = deepl_b.DeepLBackend()
+        backend.set_config(deepl_b.DeepLConfig(api_key="mock", server_url=server.url))
+        backend.set_languages("", "DE")
+        config = cfg.Config(deduplicate=False)
+        assert run_worker(backend, {"text": text_file}, config) == [ti.State.QUOTA_EXCEEDED]
+    assert text_file.translation == ti.quota_exceeded_banner()
+
+    # Each text in a request that ran out of quota gets a banner.
+    worker = ti.DeeplWorker(sb.SimulatedBackend(profile), {}, config)
+    worker.total_chars = 0
+    assert worker.translate_texts("text", ["One", "", "Two"]) == [
+        ti.quota_exceeded_banner(),
+        "",
+        ti.quota_exceeded_banner(),
+    ]
+    assert worker.state == ti.State.QUOTA_EXCEEDED
+
+
+def test_worker_streams_mapped_file(tmp_path):
+    path = tmp_path / "large.txt"
+    path.write_text("「Hello there」\nPlain line\n" * 2000)
+    text_file = st.MappedTextFile(path=path)
+    # The markers are kept by the mock translation, since they have no letters.
+    rule_set = pr.parse_rule_set(
+        b"rules:\n"
+        b"  - pattern: '^\xe3\x80\x8c(.*)\xe3\x80\x8d$'\n"
+        b"    replacement: '{{\\n\\1\\n}}'\n"
+        b"    flags: m\n"
+        b"  - pattern: '\\{\\{\\n(.*)\\n\\}\\}'\n"
+        b"    replacement: '\xe3\x80\x8c\\1\xe3\x80\x8d'\n"
+        b"    stage: post\n"
+    )
+    text_file.rule_set = rule_set
+    text_file.chunk_processors = [rule_set.preprocess]
+    text_file.process_level = st.ProcessLevel.PROTECTED
+    writer = st.TextStreamWriter(tmp_path / "out" / "large_en.txt")
+
+    backend = mb.MockBackend()
+    backend.connect()
+    worker = ti.DeeplWorker(
+        backend, {"text": text_file}, cfg.Config(), text_writers={"text": writer}
+    )
+    results = []
+    worker.signals.result.connect(results.append)
+    worker.run()
+
+    assert results == [ti.State.DONE]
+    # Nothing was kept in memory, each chunk was restored and written on its own.
+    assert not text_file.translation and not text_file.translation_chunks
+    assert writer.written_chunks == text_file.chunk_count() > 1
+    lines = writer.finalize().read_text().splitlines()
+    assert len(lines) == 4000
+    # Every quote was protected and restored within its own chunk.
+    assert all(line.startswith("「") and line.endswith("」") for line in lines[::2])
+    assert not any("「" in line or "{" in line for line in lines[1::2])
+
+
+def test_text_stream_writer_incomplete(tmp_path):
+    writer = st.TextStreamWriter(tmp_path / "out.txt")
+    writer.write("First\n")
+    assert writer.finalize(incomplete=True).read_text() == (
+        st.incomplete_translation_banner() + "First\n"
+    )
+    assert not writer.temp_path.exists()
@@ -0,0 +1,114 @@
+import zipfile
+from pathlib import Path
+
+import deepqt.xml_parser as xp
+import tests.mock_files.mime_types as mime_files
+from tests.helpers import mock_file_path
+
+
+def test_deruby_simple():
+    text = "<p>彼は<ruby>漢字<rt>かんじ</rt></ruby>を書いた。</p>"
+    assert xp.deruby(text) == "<p>彼は漢字（かんじ）を書いた。</p>"
+
+
+def test_deruby_multiple_bases():
+    text = "<p><ruby><rb>皇</rb><rt>こう</rt><rb>室</rb><rt>しつ</rt></ruby>典範</p>"
+    assert xp.deruby(text) == "<p>皇室（こうしつ）典範</p>"
+
+
+def test_deruby_extra_tags():
+    # Tags other than rb and rt are moved in front of the flattened text.
+    text = "<p><ruby>書<rp>(</rp><rt>か</rt><rp>)</rp></ruby>いた。</p>"
+    assert xp.deruby(text) == "<p><rp></rp><rp></rp>書()（か）いた。</p>"
+
+
+def test_deruby_across_lines():
+    text = "<p><ruby>\n<rb>漢字</rb>\n<rt>かんじ</rt>\n</ruby></p>\r\n<p>次</p>\r\n"
+    assert xp.deruby(text) == "<p>\n漢字\n\n（かんじ）</p>\r\n<p>次</p>\r\n"
+
+
+def test_deruby_no_ruby():
+    text = "<p>Nothing to see here.</p>\n"
+    assert xp.deruby(text) is text
+
+
+def test_bust_ruby_tags_requires_japanese():
+    text = "<html><p><ruby>漢字<rt>かんじ</rt></ruby></p></html>"
+    assert xp.bust_ruby_tags(text) == text
+    text = '<html lang="ja"><p><ruby>漢字<rt>かんじ</rt></ruby></p></html>'
+    assert xp.bust_ruby_tags(text) == '<html lang="ja"><p>漢字（かんじ）</p></html>'
+
+
+def test_deruby_many_elements():
+    line = (
+        "<p>前<ruby>漢字<rt>かんじ</rt></ruby>後"
+        "<ruby><rb>皇</rb><rt>こう</rt><rb>室</rb><rt>しつ</rt></ruby></p>"
+    )
+    result = xp.deruby("\n".join(line for _ in range(100)))
+
+    assert "<ruby>" not in result
+    assert result.split("\n") == ["<p>前漢字（かんじ）後皇室（こうしつ）</p>"] * 100
+
+
+def test_deruby_unclosed():
+    # The unclosed element is left alone, instead of swallowing the text up to the next one.
+    text = (
+        "<p><ruby>漢<rt>かん</rt></p>\n<p>間の文。</p>\n"
+        "<p><ruby><rb>皇</rb><rt>こう</rt><rb>室</rb><rt>しつ</rt></ruby></p>"
+    )
+    assert xp.deruby(text) == (
+        "<p><ruby>漢<rt>かん</rt></p>\n<p>間の文。</p>\n<p>皇室（こうしつ）</p>"
+    )
+
+
+def test_parse_epub_package():
+    with zipfile.ZipFile(mock_file_path("book.epub", module=mime_files)) as epub_zip:
+        package = xp.parse_epub_package(epub_zip)
+
+    assert package.rootfile_path == "EPUB/content.opf"
+    assert package.spine == ["EPUB/text/title_page.xhtml", "EPUB/text/ch001.xhtml"]
+    assert package.ncx_path == "EPUB/toc.ncx"
+    assert package.media_types["EPUB/styles/stylesheet1.css"] == "text/css"
+    # The nav document isn't in the spine, so it comes last.
+    assert package.html_paths() == [
+        "EPUB/text/title_page.xhtml",
+        "EPUB/text/ch001.xhtml",
+        "EPUB/nav.xhtml",
+    ]
+    assert package.css_paths() == ["EPUB/styles/stylesheet1.css"]
+    assert package.cover_path is None
+
+
+def test_parse_epub_package_cover_page(tmp_path):
+    # Without a declared cover, the first image of the first spine item is used.
+    # Its source is relative to that page, not the package document.
+    path = tmp_path / "cover.epub"
+    with zipfile.ZipFile(path, "w") as epub_zip:
+        epub_zip.writestr(
+            "META-INF/container.xml",
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OPS/book.opf"/></rootfiles></container>',
+        )
+        epub_zip.writestr(
+            "OPS/book.opf",
+            '<package xmlns="http://www.idpf.org/2007/opf"><manifest>'
+            '<item id="b" href="text/b%20page.xhtml" media-type="application/xhtml+xml"/>'
+            '<item id="a" href="text/a.xhtml" media-type="application/xhtml+xml"/>'
+            '<item id="toc" href="contents.ncx" media-type="application/x-dtbncx+xml"/>'
+            '</manifest><spine toc="toc"><itemref idref="b"/><itemref idref="a"/></spine></package>',
+        )
+        epub_zip.writestr(
+            "OPS/text/b page.xhtml",
+            '<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+            '<img src="../images/front.jpg"/></body></html>',
+        )
+        epub_zip.writestr("OPS/text/a.xhtml", "<html/>")
+        epub_zip.writestr("OPS/images/front.jpg", b"")
+
+    with zipfile.ZipFile(path) as epub_zip:
+        package = xp.parse_epub_package(epub_zip)
+
+    assert package.spine == ["OPS/text/b page.xhtml", "OPS/text/a.xhtml"]
+    assert package.ncx_path == "OPS/contents.ncx"
+    assert package.cover_path == "OPS/images/front.jpg"
+    assert xp.get_epub_cover(path) == Path("OPS/images/front.jpg")